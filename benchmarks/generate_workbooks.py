@@ -0,0 +1,279 @@
+"""
+Synthetic Workbook Generator
+Writes an Odoo "Detailed Stock Report" and a Manual "Monthly Stock report" with the same layout
+as the real exports, at any size, for benchmarking the validator.
+
+Usage:
+    python benchmarks/generate_workbooks.py --rows 10000 --out benchmarks/data
+    python benchmarks/generate_workbooks.py --rows 100000 --match-ratio 0.6 --code-noise 0.5 --out /tmp/bench
+"""
+
+import argparse
+import os
+import random
+
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+from openpyxl.utils import get_column_letter
+
+# Manual sheets with the share of items that belong to each, their code prefix and typical units
+SHEET_PROFILES = (
+    ('RM', 0.30, 'TRM', ('KG', 'NOS', 'PCS', 'METER', 'SFT')),
+    ('Consumable', 0.50, 'Con', ('PCS', 'SET', 'LITER', 'FEET', 'REAM', 'KG')),
+    ('Spare parts', 0.18, 'SP', ('PCS', 'SET', 'NOS', 'GALLON')),
+    ('Re-usable', 0.02, 'Rrusable', ('KG', 'PCS', 'POUND')),
+)
+
+# Spellings of each unit seen in the real files (all normalize to the key)
+UNIT_ALIASES = {
+    'PCS': ('Pieces', 'Piece', 'pcs'),
+    'FEET': ('Foot(ft)', 'Feet'),
+    'LITER': ('Liter(s)', 'Litre', 'Liters'),
+    'GALLON': ('gal(s)', 'Gallon'),
+    'SFT': ('Square Foot', 'Sq Ft'),
+    'POUND': ('lbs', 'Pound'),
+    'METER': ('Mtr', 'Meters'),
+    'REAM': ('Rim', 'Ream'),
+    'KG': ('Kg',),
+    'NOS': ('Nos',),
+    'SET': ('Set',),
+}
+
+NAME_MATERIALS = ('Copper', 'Aluminium', 'Steel', 'CRGO', 'Brass', 'PVC', 'Rubber', 'Epoxy', 'Paper', 'Cotton')
+NAME_ITEMS = ('Bolt', 'Washer', 'Gasket', 'Tape', 'Wire', 'Sheet', 'Bushing', 'Clamp', 'Cable', 'Bracket',
+              'Radiator', 'Tank', 'Insulator', 'Core', 'Valve')
+
+# Day-wise Received/Issued blocks after the Rate column of a Manual sheet (merged two-row headers)
+DAY_BLOCKS = 6
+DAY_BLOCK_WIDTH = 5
+
+HEADER_FONT = Font(name='Calibri', size=11, bold=True)
+HEADER_FILL = PatternFill(start_color='FFEFEFEF', end_color='FFEFEFEF', fill_type='solid')
+THIN = Side(style='thin')
+GRID_BORDER = Border(left=THIN, right=THIN, top=THIN, bottom=THIN)
+CENTER = Alignment(horizontal='center', vertical='center', wrap_text=True)
+
+ODOO_HEADERS = ('SL\nNo', 'Product Code', 'Product Name', 'Category', 'Unit', 'Opening Qty', 'Opening Value',
+                'Receive Qty', 'Receive Value', 'Issue Qty', 'Issue Value', 'Closing Qty', 'Closing Value',
+                'Location')
+MANUAL_HEADERS = ('SL # ', 'Product Code', 'Category', 'Items Name ', 'Unit ', 'Qty', 'Value(Tk.) ', 'Qty ',
+                  'Value(Tk.) ', 'Qty ', 'Value(Tk.) ', 'Qty ', 'Value(Tk.) ', 'Rate(Tk) ')
+
+
+def size_label(rows):
+    """Short label for a row count, e.g. 10000 -> '10k'"""
+    if rows >= 1000 and rows % 1000 == 0:
+        return f"{rows // 1000}k"
+    return str(rows)
+
+
+def make_items(rows, rng):
+    """Create the stock items behind both reports: sheet, code number, name, unit and movements"""
+    sheets = [profile[0] for profile in SHEET_PROFILES]
+    weights = [profile[1] for profile in SHEET_PROFILES]
+    items = []
+    for n in range(1, rows + 1):
+        sheet = rng.choices(sheets, weights)[0]
+        units = next(profile[3] for profile in SHEET_PROFILES if profile[0] == sheet)
+        opening_qty = rng.randint(0, 500)
+        received_qty = rng.randint(0, 200) if rng.random() < 0.4 else 0
+        issued_qty = rng.randint(0, opening_qty + received_qty) if rng.random() < 0.5 else 0
+        rate = round(rng.uniform(1, 5000), 2)
+        items.append({
+            'sheet': sheet,
+            'number': n,
+            'name': f"{rng.choice(NAME_MATERIALS)} {rng.choice(NAME_ITEMS)} {rng.randint(2, 400)}mm #{n}",
+            'unit': rng.choice(units),
+            'numbers': [opening_qty, round(opening_qty * rate, 2), received_qty, round(received_qty * rate, 2),
+                        issued_qty, round(issued_qty * rate, 2), opening_qty + received_qty - issued_qty,
+                        round((opening_qty + received_qty - issued_qty) * rate, 2)],
+        })
+    return items
+
+
+def code_prefix(sheet):
+    return next(profile[2] for profile in SHEET_PROFILES if profile[0] == sheet)
+
+
+def styled(ws, value, font=None, fill=None, border=None, alignment=None, number_format=None):
+    cell = WriteOnlyCell(ws, value=value)
+    if font:
+        cell.font = font
+    if fill:
+        cell.fill = fill
+    if border:
+        cell.border = border
+    if alignment:
+        cell.alignment = alignment
+    if number_format:
+        cell.number_format = number_format
+    return cell
+
+
+def write_odoo_report(path, items, rng, blank_row_ratio=0.01, merged_headers=True):
+    """Odoo Detailed Stock Report: date range in row 1, header in row 2, one row per item"""
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet('Table 1')
+    ws.append([styled(ws, 'Date Range: From 2025-08-01 to 2025-08-31', font=HEADER_FONT)])
+    if merged_headers:
+        ws.merged_cells.add('A1:N1')
+    ws.append([styled(ws, header, font=HEADER_FONT, fill=HEADER_FILL, border=GRID_BORDER, alignment=CENTER)
+               for header in ODOO_HEADERS])
+
+    for sl, item in enumerate(sorted(items, key=lambda item: item['name']), 1):
+        if rng.random() < blank_row_ratio:
+            ws.append([])  # Blank rows are removed by the validator's clean-up step
+        code = f"{code_prefix(item['sheet'])}- {item['number']}"
+        ws.append([sl, code, item['name'], f"{item['sheet']} materials", item['odoo_unit']]
+                  + [styled(ws, value, number_format='0.00') for value in item['numbers']]
+                  + ['Physical Locations/WH/Stock'])
+    wb.save(path)
+
+
+def manual_code(item, rng, code_noise):
+    """Product code as typed in the Manual report: 'TRM-328' or 'TRM -328' instead of 'TRM- 328'"""
+    prefix = code_prefix(item['sheet'])
+    if rng.random() < code_noise:
+        return rng.choice((f"{prefix}-{item['number']}", f"{prefix} -{item['number']}", f" {prefix}-  {item['number']}"))
+    return f"{prefix}- {item['number']}"
+
+
+def write_manual_sheet(wb, sheet_name, rows, merged_headers=True):
+    """One Manual sheet: title rows 1-3 (with column totals), grouped headers in row 4, header in row 5"""
+    ws = wb.create_sheet(sheet_name)
+    first, last = 6, 5 + max(len(rows), 1)
+    last_col = 13 + 1 + DAY_BLOCKS * DAY_BLOCK_WIDTH  # A-M, Rate, then the day blocks
+
+    ws.append([styled(ws, 'Confidence Infrastructure PLC (Transformer Unit)', font=HEADER_FONT)])
+    ws.append([styled(ws, sheet_name, font=HEADER_FONT)])
+    totals = ['Month: Aug-2025', None, None, None, None, None]
+    for col in 'GHIJKLM':
+        totals.append(f'=SUM({col}{first}:{col}{last})' if col in 'GIKM' else None)
+    totals.append(None)
+    for day in range(1, DAY_BLOCKS + 1):
+        totals += [f'{day:02d}'] + [None] * (DAY_BLOCK_WIDTH - 1)
+    ws.append(totals)
+
+    groups = [None] * 5 + ['Opening ', None, 'Received ', None, 'Issued ', None, 'Closing Balance', None, 'Rate(Tk) ']
+    for _ in range(DAY_BLOCKS):
+        groups += ['Received ', None, None, 'Issued ', None]
+    ws.append([styled(ws, value, font=HEADER_FONT, alignment=CENTER) if value else None for value in groups])
+    headers = list(MANUAL_HEADERS) + ['Qty ', 'Value(Tk.) ', 'Rate ', 'Qty ', 'Value(Tk.) '] * DAY_BLOCKS
+    ws.append([styled(ws, header, font=HEADER_FONT, fill=HEADER_FILL, border=GRID_BORDER, alignment=CENTER)
+               for header in headers])
+
+    if merged_headers:
+        letter = get_column_letter
+        ws.merged_cells.add(f"A1:{letter(last_col)}1")
+        ws.merged_cells.add(f"A2:{letter(last_col)}2")
+        for start in (6, 8, 10, 12):  # Opening/Received/Issued/Closing over their Qty and Value columns
+            ws.merged_cells.add(f"{letter(start)}4:{letter(start + 1)}4")
+        for block in range(DAY_BLOCKS):
+            start = 15 + block * DAY_BLOCK_WIDTH
+            ws.merged_cells.add(f"{letter(start)}3:{letter(start + DAY_BLOCK_WIDTH - 1)}3")
+            ws.merged_cells.add(f"{letter(start)}4:{letter(start + 2)}4")
+            ws.merged_cells.add(f"{letter(start + 3)}4:{letter(start + 4)}4")
+
+    for sl, (code, name, unit, numbers) in enumerate(rows, 1):
+        row_num = first + sl - 1
+        ws.append([styled(ws, sl, border=GRID_BORDER), styled(ws, code, border=GRID_BORDER), None,
+                   styled(ws, name, border=GRID_BORDER), styled(ws, unit, border=GRID_BORDER)]
+                  + [styled(ws, value, border=GRID_BORDER, number_format='0.00') for value in numbers]
+                  + [styled(ws, f'=IFERROR((G{row_num}+I{row_num})/(F{row_num}+H{row_num}),0)',
+                            border=GRID_BORDER, number_format='0.00')])
+    return ws
+
+
+def write_manual_report(path, items, extra_items, rng, code_noise=0.3, unit_alias_ratio=0.3, diff_ratio=0.05,
+                        merged_headers=True):
+    """Manual Monthly Stock report: a Top Page with cross-sheet formulas and the four item sheets"""
+    wb = openpyxl.Workbook(write_only=True)
+    top = wb.create_sheet('Top Page')
+    top.append([styled(top, 'Stock Summary', font=HEADER_FONT), 'Opening Value', 'Closing Value'])
+    for sheet_name, _, _, _ in SHEET_PROFILES:
+        top.append([sheet_name, f"='{sheet_name}'!G3", f"='{sheet_name}'!M3"])
+
+    sheet_rows = {profile[0]: [] for profile in SHEET_PROFILES}
+    for item in items:
+        if not item['in_manual']:
+            continue
+        unit = item['unit']
+        if rng.random() < unit_alias_ratio and unit in UNIT_ALIASES:
+            unit = rng.choice(UNIT_ALIASES[unit])
+        numbers = list(item['numbers'])
+        if rng.random() < diff_ratio:
+            # Same item, different closing balance - matches in simple mode, not in strict mode
+            numbers[6] += 1
+        sheet_rows[item['sheet']].append((manual_code(item, rng, code_noise), item['name'], unit, numbers))
+    for item in extra_items:
+        sheet_rows[item['sheet']].append((f"{code_prefix(item['sheet'])}-{item['number']}", f"{item['name']} (local)",
+                                          item['unit'], item['numbers']))
+
+    for sheet_name, rows in sheet_rows.items():
+        rng.shuffle(rows)
+        write_manual_sheet(wb, sheet_name, rows, merged_headers)
+    wb.save(path)
+
+
+def generate_pair(rows, out_dir, match_ratio=0.8, code_noise=0.3, unit_alias_ratio=0.3, diff_ratio=0.05,
+                  blank_row_ratio=0.01, merged_headers=True, seed=0):
+    """Write an Odoo/Manual pair with about rows items in each file
+
+    Args:
+        rows: Number of items in the Odoo report (the Manual report has about as many)
+        out_dir: Folder for the two workbooks
+        match_ratio: Share of Odoo items that also appear in the Manual report
+        code_noise: Share of Manual codes spaced differently ('TRM-328' vs Odoo's 'TRM- 328')
+        unit_alias_ratio: Share of units spelled with an alias ('Pieces' vs 'PCS')
+        diff_ratio: Share of shared items whose closing quantity differs
+        blank_row_ratio: Share of blank rows in the Odoo report
+        merged_headers: Merge the title and grouped header cells like the real files
+        seed: Random seed, so the same arguments give the same workbooks
+
+    Returns:
+        Tuple of (odoo_file, manual_file)
+    """
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    items = make_items(rows, rng)
+    for item in items:
+        item['in_manual'] = rng.random() < match_ratio
+        item['odoo_unit'] = item['unit']
+        if rng.random() < unit_alias_ratio and item['unit'] in UNIT_ALIASES:
+            item['odoo_unit'] = rng.choice(UNIT_ALIASES[item['unit']])
+    # Manual-only items make up the rest, so both files have about the same size
+    extra_items = make_items(rows - sum(item['in_manual'] for item in items), rng)
+    for item in extra_items:
+        item['number'] += rows
+
+    label = size_label(rows)
+    odoo_file = os.path.join(out_dir, f"Detailed Stock Report {label}.xlsx")
+    manual_file = os.path.join(out_dir, f"Monthly Stock report {label}.xlsx")
+    write_odoo_report(odoo_file, items, rng, blank_row_ratio, merged_headers)
+    write_manual_report(manual_file, items, extra_items, rng, code_noise, unit_alias_ratio, diff_ratio, merged_headers)
+    return odoo_file, manual_file
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic Odoo/Manual stock report pair")
+    parser.add_argument('--rows', type=int, required=True, help="Items in the Odoo report")
+    parser.add_argument('--out', required=True, help="Output folder")
+    parser.add_argument('--match-ratio', type=float, default=0.8)
+    parser.add_argument('--code-noise', type=float, default=0.3)
+    parser.add_argument('--unit-alias-ratio', type=float, default=0.3)
+    parser.add_argument('--diff-ratio', type=float, default=0.05)
+    parser.add_argument('--blank-row-ratio', type=float, default=0.01)
+    parser.add_argument('--no-merged-headers', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    odoo_file, manual_file = generate_pair(args.rows, args.out, args.match_ratio, args.code_noise,
+                                           args.unit_alias_ratio, args.diff_ratio, args.blank_row_ratio,
+                                           not args.no_merged_headers, args.seed)
+    print(f"Wrote {odoo_file}")
+    print(f"Wrote {manual_file}")
+
+
+if __name__ == '__main__':
+    main()
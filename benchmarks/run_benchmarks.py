@@ -0,0 +1,184 @@
+"""
+Stock Report Validator Benchmarks
+Generates synthetic Odoo/Manual pairs (see generate_workbooks.py) and times each stage of the
+pipeline on them: reading, simple and strict matching, writing (with the Odoo clean-up timed
+separately) and the analysis report. Every size runs in a fresh process, so the peak RSS
+reported per stage is the high-water mark of that run up to the end of the stage.
+
+Usage:
+    python benchmarks/run_benchmarks.py                      # 1k, 10k, 100k and 500k rows
+    python benchmarks/run_benchmarks.py --sizes 1000 10000 --output-modes sidecar
+    python benchmarks/run_benchmarks.py --sizes 10000 --json results.json
+
+Generated workbooks are kept in benchmarks/data and reused while the generator settings are the same.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+from stock_report_engine import StockReportEngine, MANUAL_SHEETS, MATCH_ID_PREFIXES, peak_rss_mb
+from generate_workbooks import generate_pair
+
+DEFAULT_SIZES = (1000, 10000, 100000, 500000)
+DATA_DIR = os.path.join(BENCHMARK_DIR, 'data')
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, 'results')
+
+
+class BenchmarkEngine(StockReportEngine):
+    """Engine that keeps quiet and times the Odoo clean-up inside process_files"""
+
+    def __init__(self):
+        super().__init__()
+        self.clean_seconds = 0.0
+        self.clean_cpu_seconds = 0.0
+
+    def log_status(self, message):
+        pass
+
+    def clean_odoo_file(self, odoo_wb):
+        start, cpu_start = time.perf_counter(), time.process_time()
+        super().clean_odoo_file(odoo_wb)
+        self.clean_seconds += time.perf_counter() - start
+        self.clean_cpu_seconds += time.process_time() - cpu_start
+
+
+def benchmark_pair(odoo_file, manual_file, work_dir, matching_modes, output_modes):
+    """Process pool worker: time every stage on one pair and return the stage rows
+
+    Returns:
+        List of dicts with 'stage', 'seconds', 'cpu_seconds' and 'peak_rss_mb' (and 'matches'
+        for the matching stages)
+    """
+    engine = BenchmarkEngine()
+    stages = []
+
+    def timed(name, func, *args, **kwargs):
+        start, cpu_start = time.perf_counter(), time.process_time()
+        value = func(*args, **kwargs)
+        stages.append({'stage': name, 'seconds': time.perf_counter() - start,
+                       'cpu_seconds': time.process_time() - cpu_start, 'peak_rss_mb': peak_rss_mb()})
+        return value
+
+    odoo_data = timed('read odoo', engine.read_odoo_data, odoo_file)
+    manual_sheets = timed('read manual', engine.read_manual_data, manual_file)
+    manual_data = [row for sheet_name in MANUAL_SHEETS for row in manual_sheets[sheet_name]]
+
+    sheet_matches = {}
+    for mode in matching_modes:
+        matcher = engine.find_matches_simple if mode == 'simple' else engine.find_matches
+        sheet_matches[mode] = timed(f'match {mode}', lambda: {
+            sheet_name: matcher(odoo_data, manual_sheets[sheet_name], prefix=MATCH_ID_PREFIXES[sheet_name])
+            for sheet_name in MANUAL_SHEETS})
+        matches = sheet_matches[mode]
+        stages[-1]['matches'] = sum(len(sheet) for sheet in matches.values())
+        timed(f'report {mode}', engine.generate_analysis_report, odoo_data, manual_data,
+              sum(matches.values(), []), matches['RM'], matches['Consumable'], matches['Spare parts'],
+              matches['Re-usable'], work_dir, mode)
+
+    # Files are written with the matches of the first mode, on fresh copies for every output mode
+    matches = sheet_matches[matching_modes[0]]
+    for output_mode in output_modes:
+        mode_dir = os.path.join(work_dir, output_mode)
+        os.makedirs(mode_dir, exist_ok=True)
+        odoo_copy = shutil.copy(odoo_file, mode_dir)
+        manual_copy = shutil.copy(manual_file, mode_dir)
+        engine.clean_seconds = engine.clean_cpu_seconds = 0.0
+        timed(f'write {output_mode}', engine.process_files, odoo_copy, manual_copy, matches['RM'],
+              matches['Consumable'], matches['Spare parts'], matches['Re-usable'], output_mode=output_mode)
+        if output_mode == 'insert':
+            stages.append({'stage': '  clean (in write insert)', 'seconds': engine.clean_seconds,
+                           'cpu_seconds': engine.clean_cpu_seconds, 'peak_rss_mb': stages[-1]['peak_rss_mb']})
+    return stages
+
+
+def generator_settings(args):
+    return {'match_ratio': args.match_ratio, 'code_noise': args.code_noise,
+            'unit_alias_ratio': args.unit_alias_ratio, 'diff_ratio': args.diff_ratio,
+            'blank_row_ratio': args.blank_row_ratio, 'merged_headers': not args.no_merged_headers,
+            'seed': args.seed}
+
+
+def prepare_pair(rows, settings):
+    """Generate (or reuse) the workbooks for one size, return (odoo_file, manual_file, seconds)"""
+    key = hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()[:10]
+    pair_dir = os.path.join(DATA_DIR, f"{rows}_{key}")
+    settings_path = os.path.join(pair_dir, 'settings.json')
+    if os.path.exists(settings_path):
+        with open(settings_path, encoding='utf-8') as f:
+            stored = json.load(f)
+        if stored['rows'] == rows and stored['files'] and all(os.path.exists(path) for path in stored['files']):
+            return stored['files'][0], stored['files'][1], 0.0
+
+    start = time.perf_counter()
+    # Generating in its own process keeps the item lists out of the benchmark processes
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        odoo_file, manual_file = pool.submit(generate_pair, rows, pair_dir, **settings).result()
+    with open(settings_path, 'w', encoding='utf-8') as f:
+        json.dump({'rows': rows, 'settings': settings, 'files': [odoo_file, manual_file]}, f, indent=2)
+    return odoo_file, manual_file, time.perf_counter() - start
+
+
+def print_stages(rows, stages):
+    print(f"\n{rows:,} rows")
+    print(f"  {'Stage':<28} {'Wall s':>9} {'CPU s':>9} {'Peak RSS MB':>12}")
+    for stage in stages:
+        rss = f"{stage['peak_rss_mb']:.0f}" if stage['peak_rss_mb'] is not None else '-'
+        print(f"  {stage['stage']:<28} {stage['seconds']:9.2f} {stage['cpu_seconds']:9.2f} {rss:>12}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the validation pipeline on synthetic workbooks")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help="Odoo item counts")
+    parser.add_argument('--modes', nargs='+', choices=['simple', 'strict'], default=['simple', 'strict'],
+                        help="Matching modes to time (files are written with the first one)")
+    parser.add_argument('--output-modes', nargs='+', choices=['insert', 'sidecar'], default=['insert', 'sidecar'])
+    parser.add_argument('--json', metavar='PATH', help="Results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument('--match-ratio', type=float, default=0.8)
+    parser.add_argument('--code-noise', type=float, default=0.3)
+    parser.add_argument('--unit-alias-ratio', type=float, default=0.3)
+    parser.add_argument('--diff-ratio', type=float, default=0.05)
+    parser.add_argument('--blank-row-ratio', type=float, default=0.01)
+    parser.add_argument('--no-merged-headers', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    settings = generator_settings(args)
+    results = {'started': datetime.now().isoformat(timespec='seconds'), 'python': sys.version.split()[0],
+               'generator': settings, 'runs': []}
+    for rows in args.sizes:
+        odoo_file, manual_file, generate_seconds = prepare_pair(rows, settings)
+        if generate_seconds:
+            print(f"Generated {rows:,} row workbooks in {generate_seconds:.1f}s")
+        work_dir = os.path.join(os.path.dirname(odoo_file), 'run')
+        shutil.rmtree(work_dir, ignore_errors=True)
+        os.makedirs(work_dir)
+
+        # A fresh process per size, so peak RSS isn't carried over from a bigger run
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            stages = pool.submit(benchmark_pair, odoo_file, manual_file, work_dir, args.modes,
+                                 args.output_modes).result()
+        shutil.rmtree(work_dir, ignore_errors=True)
+        print_stages(rows, stages)
+        results['runs'].append({'rows': rows, 'odoo_file': odoo_file, 'manual_file': manual_file, 'stages': stages})
+
+    json_path = args.json
+    if json_path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        json_path = os.path.join(RESULTS_DIR, datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to: {json_path}")
+
+
+if __name__ == '__main__':
+    main()
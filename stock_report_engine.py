@@ -0,0 +1,3305 @@
+"""
+Stock Report Engine
+Reading, matching, file annotation and reporting for the Stock Report Validator,
+without any UI - used by the GUI and by the command line front end
+"""
+
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed, wait
+import openpyxl
+from openpyxl.styles import PatternFill
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.formula.tokenizer import Tokenizer, Token
+from openpyxl.worksheet.formula import ArrayFormula
+from openpyxl.worksheet.cell_range import MultiCellRange
+from copy import copy
+from contextlib import contextmanager
+from xml.etree import ElementTree
+import bisect
+import cProfile
+import csv
+import hashlib
+import html
+import io
+import json
+import math
+import pickle
+import posixpath
+import pstats
+import re
+import shutil
+import sys
+import os
+import time
+import traceback
+import tracemalloc
+import zipfile
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Matching loops check for Cancel every this many Odoo rows
+CANCEL_CHECK_ROWS = 500
+
+# Stages of a validation run shown on the progress bar: reading, four match passes, writing, report
+VALIDATION_STAGES = 7
+# Stages of an analysis (a validation that doesn't write the files) and of applying its matches
+ANALYSIS_STAGES = VALIDATION_STAGES - 1
+APPLY_STAGES = 1
+
+# Files written next to the analysis report when a run collects metrics / is profiled,
+# named after the run ('validation', 'analysis' or 'apply')
+METRICS_FILENAME = '{}_metrics.json'
+PROFILE_FILENAME = '{}_profile.prof'
+PROFILE_LOG_LINES = 15  # Functions listed in the log from the cProfile dump
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far in MB (None if it can't be measured)"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in KB elsewhere
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    except (ImportError, AttributeError):
+        return None
+
+class ValidationCancelled(Exception):
+    """Raised inside a validation run when the user pressed Cancel"""
+
+# Color for highlighting matches - light yellow
+HIGHLIGHT_FILL = PatternFill(start_color='FFFFFF99', end_color='FFFFFF99', fill_type='solid')
+
+# Quantity/value fields compared in strict mode (order matters for numeric signatures)
+NUMERIC_FIELDS = ('opening_qty', 'opening_value', 'receive_qty', 'receive_value',
+                  'issue_qty', 'issue_value', 'closing_qty', 'closing_value')
+NUMERIC_LABELS = ('Opening Qty', 'Opening Value', 'Receive Qty', 'Receive Value',
+                  'Issue Qty', 'Issue Value', 'Closing Qty', 'Closing Value')
+
+# 1-based column numbers of the Odoo Detailed Stock Report (before any Match ID column is inserted)
+ODOO_COLUMNS = {
+    'sl': 1, 'product_code': 2, 'product_name': 3, 'unit': 5,
+    'opening_qty': 6, 'opening_value': 7, 'receive_qty': 8, 'receive_value': 9,
+    'issue_qty': 10, 'issue_value': 11, 'closing_qty': 12, 'closing_value': 13,
+}
+
+# 1-based column numbers of the Manual report sheets (before any Match ID column is inserted)
+MANUAL_COLUMNS = {
+    'sl': 1, 'product_code': 2, 'items_name': 4, 'unit': 5,
+    'opening_qty': 6, 'opening_value': 7, 'receive_qty': 8, 'receive_value': 9,
+    'issue_qty': 10, 'issue_value': 11, 'closing_qty': 12, 'closing_value': 13,
+}
+
+# Manual report sheets that are matched against the Odoo report, in processing order
+MANUAL_SHEETS = ('RM', 'Consumable', 'Spare parts', 'Re-usable')
+
+# Match ID prefix of each Manual sheet (RM-1, CON-1, ...)
+MATCH_ID_PREFIXES = {'RM': 'RM', 'Consumable': 'CON', 'Spare parts': 'SP', 'Re-usable': 'RE'}
+
+# Field order of parsed rows (record slots and the compact tuples passed between processes)
+ODOO_FIELDS = ('row_num', 'product_code', 'product_name', 'unit') + NUMERIC_FIELDS
+MANUAL_FIELDS = ('row_num', 'product_code', 'items_name', 'unit') + NUMERIC_FIELDS
+
+# Row fingerprints and matches of the last sidecar run on a pair, stored next to the Manual
+# file (<manual file>.match_state.json) so the next run only re-matches the rows that changed,
+# plus the cell formats highlighting replaced, so highlights of rows no longer matched can be
+# removed. Bump the version whenever parsing or matching rules change.
+MATCH_STATE_SUFFIX = '.match_state.json'
+MATCH_STATE_VERSION = 2
+# Above this share of changed rows a re-run matches everything again (and renumbers the IDs)
+INCREMENTAL_MAX_CHANGED_RATIO = 0.5
+
+# On-disk cache of parsed rows, so unchanged files are not parsed again on the next run
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.stock_report_validator', 'cache')
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+CACHE_FORMAT_VERSION = 2
+
+class ParsedRowCache:
+    """Stores parsed rows (as tuples) on disk, keyed by file content hash, sheet and column layout
+    Least recently used entries are evicted once the cache grows past max_bytes."""
+    
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+    
+    def file_hash(self, file_path):
+        """SHA-256 of the file contents"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    def make_key(self, file_hash, sheet_name, columns, fields):
+        """Cache key for one sheet of one file version read with the given column layout"""
+        layout = repr((CACHE_FORMAT_VERSION, sheet_name, sorted(columns.items()), fields))
+        return hashlib.sha256((file_hash + layout).encode('utf-8')).hexdigest()
+    
+    def get(self, key):
+        """Return the cached row tuples for key, or None if not cached"""
+        path = os.path.join(self.cache_dir, key + '.pickle')
+        try:
+            with open(path, 'rb') as f:
+                rows = pickle.load(f)
+            os.utime(path)  # Mark as recently used
+            return rows
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            return None
+    
+    def put(self, key, rows):
+        """Store row tuples under key and evict old entries if the cache is too big"""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = os.path.join(self.cache_dir, key + '.pickle')
+            tmp_path = f'{path}.{os.getpid()}.tmp'  # Batch workers may store the same key at once
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(rows, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            self.evict()
+        except OSError:
+            pass  # Caching is best effort
+    
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.pickle'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+def file_signature(file_path):
+    """(absolute path, modification time, size) of a file - changes whenever the file is saved"""
+    stat = os.stat(file_path)
+    return (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+
+def default_report_dir(odoo_file, manual_file):
+    """Folder the analysis report goes to when none is given: the Manual file's folder"""
+    return os.path.dirname(manual_file) or os.path.dirname(odoo_file) or '.'
+
+class SessionRowStore:
+    """Parsed rows of the files used in this session, kept in memory
+    Holds the last Odoo rows and the last Manual sheets (one entry per kind), each tagged
+    with the file_signature taken before the file was read. An entry is only handed out
+    while the file still has that signature, so a file saved in Excel is read again.
+    Files can also be read in a background thread (preload); their futures are kept
+    until the rows arrive, so a run can wait for them instead of reading again."""
+    
+    def __init__(self):
+        self.entries = {}  # 'odoo' / 'manual' -> (file signature, rows)
+        self.pending = {}  # 'odoo' / 'manual' -> (file signature, Future, cancel event) of the last preload
+        self.lock = threading.Lock()
+    
+    def get(self, kind, signature):
+        """Return the rows stored for kind if they were read from a file with this signature"""
+        with self.lock:
+            entry = self.entries.get(kind)
+        if entry is None or entry[0] != signature:
+            return None
+        return entry[1]
+    
+    def put(self, kind, signature, rows, future=None):
+        """Store rows read from a file with this signature
+        With future set, the rows are only stored while that future is still the last preload of
+        kind, so a slow read of a file that was replaced can't overwrite the newer file's rows.
+        
+        Returns:
+            True if the rows were stored
+        """
+        with self.lock:
+            if future is not None:
+                pending = self.pending.get(kind)
+                if pending is None or pending[1] is not future:
+                    return False
+            self.entries[kind] = (signature, rows)
+            return True
+    
+    def pending_read(self, kind, signature):
+        """Future of the background read of the file with this signature (None if there is none)"""
+        with self.lock:
+            pending = self.pending.get(kind)
+        if pending is None or pending[0] != signature:
+            return None
+        return pending[1]
+    
+    def preload(self, kind, signature, load, cancel_event):
+        """Call load() in a daemon thread and store the rows it returns under kind
+        
+        Args:
+            kind: 'odoo' or 'manual'
+            signature: file_signature of the file, taken before load starts reading it
+            load: Function returning the rows
+            cancel_event: Set when another file of the same kind is preloaded, to stop load
+        
+        Returns:
+            Future of the rows (the rows are stored before the future completes, unless another
+            file of the same kind was preloaded in the meantime)
+        """
+        future = Future()
+        with self.lock:
+            previous = self.pending.get(kind)
+            self.pending[kind] = (signature, future, cancel_event)
+        if previous is not None:
+            previous[2].set()
+        
+        def read():
+            future.set_running_or_notify_cancel()
+            try:
+                rows = load()
+            except Exception as e:
+                future.set_exception(e)
+                return
+            self.put(kind, signature, rows, future)  # Dropped if superseded in the meantime
+            future.set_result(rows)
+        threading.Thread(target=read, daemon=True).start()
+        return future
+    
+    def clear(self):
+        with self.lock:
+            for _, _, cancel_event in self.pending.values():
+                cancel_event.set()
+            self.pending.clear()
+            self.entries.clear()
+
+# Characters dropped from accounting-format numbers: spaces, thousands separators, currency symbols
+NUMERIC_STRIP_TABLE = str.maketrans('', '', ' ,$₹€£')
+ZERO_NUMERIC_TEXTS = ('', '-', '—', '–')
+
+def to_minor_units(value):
+    """Convert a quantity/value cell to an exact integer number of hundredths (cents)
+    Handles Accounting format (commas, parentheses for negatives, dashes for zero, currency
+    symbols) and Number format. Values are rounded to 2 decimal places first, so two values
+    compare equal here exactly when they are equal after rounding to 2 decimals.
+    Empty or unparseable values count as 0."""
+    if value is None:
+        return 0
+    
+    # Fast path: numbers straight from the cell
+    if isinstance(value, int):
+        return value * 100
+    if isinstance(value, float):
+        return float_to_minor_units(value)
+    
+    text = str(value).strip()
+    
+    # Handle Accounting format: parentheses indicate negative numbers
+    is_negative = text.startswith('(') and text.endswith(')')
+    if is_negative:
+        text = text[1:-1]
+    
+    text = text.translate(NUMERIC_STRIP_TABLE)
+    if text in ZERO_NUMERIC_TEXTS:
+        return 0
+    
+    try:
+        minor = float_to_minor_units(float(text))
+    except ValueError:
+        # If conversion fails, treat as 0
+        return 0
+    return -minor if is_negative else minor
+
+def float_to_minor_units(number):
+    """Round a float to 2 decimal places and return it as an integer number of hundredths"""
+    if not math.isfinite(number):
+        return 0
+    return round(round(number, 2) * 100)
+
+class StockRecord:
+    """Compact parsed data row with one slot per field
+    Also behaves like the old row dicts (row['unit'], row.get('unit'), dict(row)) so
+    existing callers keep working, while hot loops use plain attribute access.
+    
+    The eight quantity/value fields are converted once, when the record is created, to
+    integer hundredths and kept in `numeric` (NUMERIC_FIELDS order), so comparisons are
+    plain integer equality and never re-parse the cell values."""
+    __slots__ = ('numeric',)
+    FIELDS = ()
+    
+    def __init__(self, *values):
+        for field, value in zip(self.FIELDS, values):
+            setattr(self, field, value)
+        # FIELDS always end with NUMERIC_FIELDS
+        self.numeric = tuple(map(to_minor_units, values[-len(NUMERIC_FIELDS):]))
+    
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+    
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+    
+    def __contains__(self, key):
+        return key in self.FIELDS
+    
+    def keys(self):
+        return self.FIELDS
+    
+    def items(self):
+        return [(field, getattr(self, field)) for field in self.FIELDS]
+    
+    def as_tuple(self):
+        """Field values in FIELDS order"""
+        return tuple(getattr(self, field) for field in self.FIELDS)
+    
+    def fingerprint(self):
+        """Short hash of code, name, unit and the eight quantity/value fields (not the row number),
+        used to find the rows that changed since the previous run"""
+        code, name, unit = (getattr(self, field) for field in self.FIELDS[1:4])
+        data = repr((code, name, unit, self.numeric)).encode('utf-8')
+        return hashlib.blake2b(data, digest_size=8).hexdigest()
+    
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self.items())!r})"
+
+class OdooRecord(StockRecord):
+    """Data row of the Odoo report"""
+    __slots__ = ODOO_FIELDS
+    FIELDS = ODOO_FIELDS
+
+class ManualRecord(StockRecord):
+    """Data row of a Manual report sheet"""
+    __slots__ = MANUAL_FIELDS
+    FIELDS = MANUAL_FIELDS
+
+def rows_to_tuples(rows):
+    """Convert records into compact tuples (for pickling to the parent process or the cache)"""
+    return [row.as_tuple() for row in rows]
+
+def tuples_to_rows(values_list, record_class):
+    """Convert compact tuples back into records"""
+    return [record_class(*values) for values in values_list]
+
+def read_odoo_file_worker(file_path):
+    """Process pool worker: parse the Odoo file and return rows as tuples in ODOO_FIELDS order"""
+    rows = StockReportEngine().read_odoo_data(file_path)
+    return rows_to_tuples(rows)
+
+def read_manual_sheet_worker(file_path, sheet_name):
+    """Process pool worker: parse one Manual sheet and return rows as tuples in MANUAL_FIELDS order"""
+    rows = StockReportEngine().read_manual_data(file_path, [sheet_name])[sheet_name]
+    return rows_to_tuples(rows)
+
+class XlsxPatchError(Exception):
+    """Raised when a workbook's XML isn't laid out the way XlsxMatchIdWriter expects"""
+
+# Regexes over SpreadsheetML as written by Excel/openpyxl (default namespace, r attribute on every row and cell)
+XLSX_ROW_RE = re.compile(r'<row\b([^>]*?)(?:/>|>(.*?)</row>)', re.S)
+XLSX_CELL_RE = re.compile(r'<c\b([^>]*?)(?:/>|>(.*?)</c>)', re.S)
+XLSX_VALUE_CELL_RE = re.compile(r'<c\s[^>]*?\br="([A-Z]+)\d+"[^>]*?(?<!/)>(?!</c>)')
+XLSX_ROW_NUM_RE = re.compile(r'(?:^|\s)r="(\d+)"')
+XLSX_CELL_REF_RE = re.compile(r'(?:^|\s)r="([A-Z]+)(\d+)"')
+XLSX_STYLE_RE = re.compile(r'(\s)s="(\d+)"')
+XLSX_TYPE_RE = re.compile(r'\st="(\w+)"')
+XLSX_TEXT_RE = re.compile(r'<t(?:\s[^>]*)?>(.*?)</t>', re.S)
+XLSX_VALUE_RE = re.compile(r'<v>(.*?)</v>', re.S)
+XLSX_NS = {
+    'main': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main',
+    'rel': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+    'pkg': 'http://schemas.openxmlformats.org/package/2006/relationships',
+}
+HIGHLIGHT_FILL_XML = ('<fill><patternFill patternType="solid"><fgColor rgb="FFFFFF99"/>'
+                      '<bgColor rgb="FFFFFF99"/></patternFill></fill>')
+
+class XlsxMatchIdWriter:
+    """Writes Match IDs and row highlights straight into the sheet XML of an .xlsx file
+    Only the patched worksheets and styles.xml are regenerated; every other part of the
+    package (drawings, comments, data validations, calcChain, ...) is copied as is.
+    Highlighted cells get a copy of their own cell format with the highlight fill, so
+    fonts, borders and number formats are kept (one extra format per distinct style).
+    The copies are recorded in style_origins, which is what allows removing a highlight
+    later: a cell gets back exactly the format it had, including its own fill."""
+    
+    def __init__(self, file_path, style_origins=None):
+        self.file_path = file_path
+        self.zip = zipfile.ZipFile(file_path)
+        self.patched_parts = {}
+        self.sheet_parts, self.active_sheet, self.shared_strings_part, self.styles_part = self.read_workbook_parts()
+        self.shared_strings = None
+        self.styles_xml = None
+        self.highlight_styles = {}  # Original style index -> highlighted copy
+        # Highlighted style index -> original, as recorded by earlier runs (checked in load_styles)
+        self.style_origins = dict(style_origins or {})
+        self.rows_changed = 0  # Rows touched by the last patch_sheet
+        self.cells_kept_highlighted = 0  # Highlights that couldn't be removed (original format unknown)
+    
+    def close(self):
+        self.zip.close()
+    
+    def read_xml_text(self, part):
+        data = self.patched_parts.get(part)
+        if data is None:
+            data = self.zip.read(part)
+        if data.startswith(b'\xff\xfe') or data.startswith(b'\xfe\xff'):
+            raise XlsxPatchError(f"{part} is not UTF-8")
+        return data.decode('utf-8')
+    
+    def read_workbook_parts(self):
+        """Map sheet names to their worksheet parts using workbook.xml and its relationships"""
+        try:
+            workbook = ElementTree.fromstring(self.zip.read('xl/workbook.xml'))
+            rels = ElementTree.fromstring(self.zip.read('xl/_rels/workbook.xml.rels'))
+        except (KeyError, ElementTree.ParseError) as e:
+            raise XlsxPatchError(f"cannot read workbook parts: {e}")
+        
+        targets = {}
+        shared_strings_part = styles_part = None
+        for rel in rels.findall('pkg:Relationship', XLSX_NS):
+            target = rel.get('Target', '')
+            if target.startswith('/'):
+                part = target.lstrip('/')
+            else:
+                part = posixpath.normpath(posixpath.join('xl', target))
+            targets[rel.get('Id')] = part
+            rel_type = rel.get('Type', '')
+            if rel_type.endswith('/sharedStrings'):
+                shared_strings_part = part
+            elif rel_type.endswith('/styles'):
+                styles_part = part
+        
+        sheet_parts = {}
+        sheet_names = []
+        for sheet in workbook.iterfind('main:sheets/main:sheet', XLSX_NS):
+            part = targets.get(sheet.get(f"{{{XLSX_NS['rel']}}}id"))
+            if part:
+                sheet_parts[sheet.get('name')] = part
+                sheet_names.append(sheet.get('name'))
+        if not sheet_names or styles_part is None:
+            raise XlsxPatchError("workbook has no sheets or styles")
+        
+        view = workbook.find('main:bookViews/main:workbookView', XLSX_NS)
+        active_index = int(view.get('activeTab', 0)) if view is not None else 0
+        active_sheet = sheet_names[active_index] if active_index < len(sheet_names) else sheet_names[0]
+        return sheet_parts, active_sheet, shared_strings_part, styles_part
+    
+    def load_shared_strings(self):
+        """Shared string table as a list (rich text runs joined, phonetic runs skipped)"""
+        if self.shared_strings is None:
+            self.shared_strings = []
+            if self.shared_strings_part:
+                root = ElementTree.fromstring(self.zip.read(self.shared_strings_part))
+                t_tag = f"{{{XLSX_NS['main']}}}t"
+                for si in root.iterfind('main:si', XLSX_NS):
+                    texts = [t.text or '' for t in si.iterfind('main:t', XLSX_NS)]
+                    texts += [t.text or '' for t in si.iterfind('main:r/main:t', XLSX_NS)]
+                    self.shared_strings.append(''.join(texts))
+        return self.shared_strings
+    
+    def cell_text(self, attrs, inner):
+        """Display text of a cell from its XML, '' if empty"""
+        if not inner:
+            return ''
+        type_match = XLSX_TYPE_RE.search(attrs)
+        cell_type = type_match.group(1) if type_match else 'n'
+        if cell_type == 'inlineStr':
+            return html.unescape(''.join(XLSX_TEXT_RE.findall(inner)))
+        value_match = XLSX_VALUE_RE.search(inner)
+        if not value_match:
+            return ''
+        value = html.unescape(value_match.group(1))
+        if cell_type == 's':
+            strings = self.load_shared_strings()
+            index = int(value)
+            return strings[index] if index < len(strings) else ''
+        return value
+    
+    def parse_cells(self, row_inner):
+        """Return {column number: (attrs, inner)} for the cells of a row"""
+        cells = {}
+        for cell_match in XLSX_CELL_RE.finditer(row_inner or ''):
+            attrs, inner = cell_match.group(1), cell_match.group(2)
+            ref = XLSX_CELL_REF_RE.search(attrs)
+            if not ref:
+                raise XlsxPatchError("cell without a reference")
+            cells[openpyxl.utils.column_index_from_string(ref.group(1))] = (attrs, inner)
+        return cells
+    
+    def row_texts(self, sheet_name, row_num):
+        """Return {column number: text} for one row of a sheet"""
+        text = self.read_xml_text(self.sheet_parts[sheet_name])
+        for row_match in XLSX_ROW_RE.finditer(text):
+            num = XLSX_ROW_NUM_RE.search(row_match.group(1))
+            if num and int(num.group(1)) == row_num:
+                cells = self.parse_cells(row_match.group(2))
+                return {col: self.cell_text(attrs, inner) for col, (attrs, inner) in cells.items()}
+        return {}
+    
+    def row_styles(self, sheet_name, row_nums):
+        """Return {(row number, column number): cell format index} for the cells of some rows
+        (the indices openpyxl loses for formats that only differ in their fill)"""
+        text = self.read_xml_text(self.sheet_parts[sheet_name or self.active_sheet])
+        styles = {}
+        for row_match in XLSX_ROW_RE.finditer(text):
+            num = XLSX_ROW_NUM_RE.search(row_match.group(1))
+            if not num:
+                raise XlsxPatchError("row without a number")
+            row_num = int(num.group(1))
+            if row_num in row_nums:
+                for col, (attrs, inner) in self.parse_cells(row_match.group(2)).items():
+                    style = XLSX_STYLE_RE.search(attrs)
+                    styles[(row_num, col)] = int(style.group(2)) if style else 0
+        return styles
+    
+    def find_header_row(self, sheet_name, header_texts, max_row=9):
+        """First of rows 1..max_row whose first cell is one of header_texts (row 1 if none)"""
+        text = self.read_xml_text(self.sheet_parts[sheet_name])
+        for row_match in XLSX_ROW_RE.finditer(text):
+            num = XLSX_ROW_NUM_RE.search(row_match.group(1))
+            if not num or int(num.group(1)) > max_row:
+                break
+            first = self.parse_cells(row_match.group(2)).get(1)
+            if first and self.cell_text(*first).strip() in header_texts:
+                return int(num.group(1))
+        return 1
+    
+    def load_styles(self):
+        """Read the fills and cell formats of styles.xml (once)"""
+        if self.styles_xml is not None:
+            return
+        self.styles_xml = self.read_xml_text(self.styles_part)
+        fills = re.search(r'<fills count="(\d+)">(.*?)</fills>', self.styles_xml, re.S)
+        xfs = re.search(r'<cellXfs count="\d+">(.*?)</cellXfs>', self.styles_xml, re.S)
+        if not fills or not xfs:
+            raise XlsxPatchError("unexpected styles.xml layout")
+        # Re-use the highlight fill if the file was annotated before (spacing may differ when
+        # the file has been saved by another program since)
+        fill_items = [re.sub(r'\s+(/?>)', r'\1', fill)
+                      for fill in re.findall(r'<fill\b.*?</fill>|<fill\s*/>', fills.group(2), re.S)]
+        self.add_fill = HIGHLIGHT_FILL_XML not in fill_items
+        self.fill_id = len(fill_items) if self.add_fill else fill_items.index(HIGHLIGHT_FILL_XML)
+        self.cell_xfs = re.findall(r'<xf\b[^>]*?(?:/>|>.*?</xf>)', xfs.group(1), re.S)
+        self.base_xf_count = len(self.cell_xfs)
+        
+        # A recorded origin only holds while the highlighted format is still the original
+        # with the highlight fill; a file re-saved by another program may have renumbered them
+        def holds(highlighted, original):
+            return (highlighted < self.base_xf_count and original < self.base_xf_count
+                    and self.is_highlighted(highlighted) and not self.is_highlighted(original)
+                    and self.xf_without_fill(highlighted) == self.xf_without_fill(original))
+        self.style_origins = {highlighted: original for highlighted, original in self.style_origins.items()
+                              if not self.add_fill and holds(highlighted, original)}
+        for highlighted, original in sorted(self.style_origins.items()):
+            self.highlight_styles.setdefault(original, highlighted)  # Re-use the copies of earlier runs
+    
+    def is_highlighted(self, style_index):
+        """True if the cell format has the highlight fill"""
+        return not self.add_fill and re.search(rf'\sfillId="{self.fill_id}"', self.cell_xfs[style_index]) is not None
+    
+    def xf_without_fill(self, style_index):
+        return re.sub(r'\s(?:fillId|applyFill)="[^"]*"', '', self.cell_xfs[style_index])
+    
+    def plain_style(self, style_index):
+        """Index of the cell format style_index had before it was highlighted
+        style_index itself if it isn't highlighted, None if the original isn't recorded in
+        style_origins (the highlight is then kept rather than guessing the cell's format)."""
+        self.load_styles()
+        if style_index >= len(self.cell_xfs):
+            raise XlsxPatchError(f"cell style {style_index} not in styles.xml")
+        if not self.is_highlighted(style_index):
+            return style_index
+        return self.style_origins.get(style_index)
+    
+    def highlight_style(self, style_index):
+        """Index of a cell format identical to style_index but with the highlight fill"""
+        if style_index in self.highlight_styles:
+            return self.highlight_styles[style_index]
+        self.load_styles()
+        if style_index >= self.base_xf_count:
+            raise XlsxPatchError(f"cell style {style_index} not in styles.xml")
+        if self.is_highlighted(style_index):
+            self.highlight_styles[style_index] = style_index
+            return style_index
+        xf = self.cell_xfs[style_index]
+        for attr, value in (('fillId', self.fill_id), ('applyFill', 1)):
+            if re.search(rf'\s{attr}="', xf):
+                xf = re.sub(rf'(\s{attr}=")[^"]*"', rf'\g<1>{value}"', xf, count=1)
+            else:
+                xf = xf.replace('<xf', f'<xf {attr}="{value}"', 1)
+        self.cell_xfs.append(xf)
+        self.highlight_styles[style_index] = len(self.cell_xfs) - 1
+        self.style_origins[len(self.cell_xfs) - 1] = style_index
+        return self.highlight_styles[style_index]
+    
+    def patch_sheet(self, sheet_name, header_row, match_ids, highlight_cols=None):
+        """Write Match IDs into a column appended after the last used column of a sheet
+        Re-uses an existing 'Match ID' header in header_row. Then only rows whose Match ID
+        changes are rewritten: rows that are no longer matched lose their ID and highlight
+        (rows_changed is set to the number of rows touched).
+        
+        Args:
+            sheet_name: Sheet to patch (None for the active sheet)
+            header_row: Row number of the header row
+            match_ids: Dict of row number -> Match ID
+            highlight_cols: Columns to highlight on matched rows besides the Match ID column
+                (None highlights every column up to the Match ID column)
+        
+        Returns:
+            Column number of the Match ID column
+        """
+        sheet_name = sheet_name or self.active_sheet
+        text, data_start, data_end, rows = self.read_sheet_rows(sheet_name, header_row)
+        
+        # Find the Match ID column: existing header, else first column after the last used one
+        header_cells = self.parse_cells(rows[header_row].group(2))
+        col = self.find_match_id_column(header_cells)
+        new_column = col is None
+        if new_column:
+            used_letters = set(XLSX_VALUE_CELL_RE.findall(text, data_start, data_end))
+            col = max(map(openpyxl.utils.column_index_from_string, used_letters), default=0) + 1
+        col_letter = openpyxl.utils.get_column_letter(col)
+        
+        # Per-row changes: column -> action (see patch_row)
+        changes = {}
+        current_ids = {}
+        if new_column:
+            source_style = '0'
+            for cell_col in range(col - 1, 0, -1):
+                cell = header_cells.get(cell_col)
+                if cell and cell[1]:
+                    style = XLSX_STYLE_RE.search(cell[0])
+                    source_style = style.group(2) if style else '0'
+                    break
+            changes[header_row] = {col: ('header', source_style)}
+        else:
+            # Already annotated - only rows whose Match ID changes are touched
+            current_ids = self.column_texts(text, data_start, data_end, col_letter, header_row)
+        
+        fill_cols = list(range(1, col)) if highlight_cols is None else [c for c in highlight_cols if c != col]
+        for row_num in current_ids:
+            if row_num not in match_ids:
+                # No longer matched: remove the ID and the highlight
+                row_changes = changes.setdefault(row_num, {})
+                for fill_col in fill_cols:
+                    row_changes[fill_col] = ('unfill', None)
+                row_changes[col] = ('unset', None)
+        for row_num, match_id in match_ids.items():
+            if current_ids.get(row_num) == match_id:
+                continue
+            row_changes = changes.setdefault(row_num, {})
+            for fill_col in fill_cols:
+                row_changes[fill_col] = ('fill', None)
+            row_changes[col] = ('id', match_id)
+        self.rows_changed = len(changes) - (1 if new_column else 0)
+        
+        text = self.rebuild_sheet_text(sheet_name, text, rows, changes)
+        if new_column:
+            text = self.widen_dimension(text, col)
+            text = self.set_column_width(text, col, 12)
+        self.patched_parts[self.sheet_parts[sheet_name]] = text.encode('utf-8')
+        return col
+    
+    def read_sheet_rows(self, sheet_name, header_row):
+        """Sheet XML text, the bounds of its sheetData and its <row> matches by row number"""
+        text = self.read_xml_text(self.sheet_parts[sheet_name])
+        data_start = text.find('<sheetData>')
+        data_end = text.find('</sheetData>')
+        if data_start < 0 or data_end < 0:
+            raise XlsxPatchError(f"{sheet_name} has no sheet data")
+        
+        rows = {}
+        for row_match in XLSX_ROW_RE.finditer(text, data_start, data_end):
+            num = XLSX_ROW_NUM_RE.search(row_match.group(1))
+            if not num:
+                raise XlsxPatchError("row without a number")
+            rows[int(num.group(1))] = row_match
+        if header_row not in rows:
+            raise XlsxPatchError(f"header row {header_row} missing in {sheet_name}")
+        return text, data_start, data_end, rows
+    
+    def column_texts(self, text, data_start, data_end, col_letter, header_row):
+        """{row number: text} of the non-empty cells of one column below header_row"""
+        cell_re = re.compile(rf'<c\s([^>]*?\br="{col_letter}(\d+)"[^>]*?)(?:/>|>(.*?)</c>)', re.S)
+        texts = {}
+        for cell_match in cell_re.finditer(text, data_start, data_end):
+            row_num = int(cell_match.group(2))
+            value = self.cell_text(cell_match.group(1), cell_match.group(3)) if row_num > header_row else ''
+            if value:
+                texts[row_num] = value
+        return texts
+    
+    def find_match_id_column(self, header_cells):
+        """Column of the 'Match ID' header among the header row's cells, None if there is none"""
+        for cell_col, cell in sorted(header_cells.items()):
+            if self.cell_text(*cell).strip() == 'Match ID':
+                return cell_col
+        return None
+    
+    def rebuild_sheet_text(self, sheet_name, text, rows, changes):
+        """Return the sheet text with the per-row cell changes applied, touching only changed rows"""
+        # Cells created for highlighting start from the row or column format Excel shows for them
+        column_styles = []
+        cols_match = re.search(r'<cols>(.*?)</cols>', text, re.S)
+        for col_xml in re.findall(r'<col\b[^>]*/>', cols_match.group(1) if cols_match else ''):
+            style = re.search(r'\sstyle="(\d+)"', col_xml)
+            if style:
+                column_styles.append((int(re.search(r'\smin="(\d+)"', col_xml).group(1)),
+                                      int(re.search(r'\smax="(\d+)"', col_xml).group(1)), int(style.group(1))))
+        
+        pieces = []
+        pos = 0
+        new_rows = []
+        for row_num in sorted(changes):
+            row_match = rows.get(row_num)
+            if row_match is None:
+                new_rows.append(row_num)
+                continue
+            pieces.append(text[pos:row_match.start()])
+            pieces.append(self.patch_row(row_num, row_match.group(1), row_match.group(2), changes[row_num],
+                                         column_styles))
+            pos = row_match.end()
+        pieces.append(text[pos:])
+        if new_rows:
+            raise XlsxPatchError(f"rows {new_rows[:5]} missing in {sheet_name}")
+        return ''.join(pieces)
+    
+    def patch_row(self, row_num, row_attrs, row_inner, row_changes, column_styles):
+        """Return the XML of a row with its cell changes applied
+        Actions: 'fill' / 'unfill' (add / remove the highlight), 'id' (highlighted Match ID),
+        'header' (Match ID header in the given style) and 'unset' (empty the cell and remove
+        its highlight). A highlight whose original format isn't known is left in place."""
+        cells = self.parse_cells(row_inner)
+        row_style = XLSX_STYLE_RE.search(row_attrs) if 'customFormat="1"' in row_attrs else None
+        for col, (action, value) in row_changes.items():
+            if col in cells:
+                attrs = cells[col][0]
+                style_match = XLSX_STYLE_RE.search(attrs)
+                style = int(style_match.group(2)) if style_match else 0
+            elif row_style:
+                attrs, style_match, style = '', None, int(row_style.group(2))
+            else:
+                attrs, style_match = '', None
+                style = next((s for lo, hi, s in column_styles if lo <= col <= hi), 0)
+            ref = f'{openpyxl.utils.get_column_letter(col)}{row_num}'
+            
+            if action == 'unset' or (action == 'unfill' and col in cells):
+                plain = self.plain_style(style)
+                if plain is None:
+                    self.cells_kept_highlighted += 1
+                    plain = style
+            
+            if action == 'unfill':
+                if col in cells and plain != style:
+                    attrs = XLSX_STYLE_RE.sub(rf'\g<1>s="{plain}"', attrs, count=1)
+                    cells[col] = (attrs, cells[col][1])
+            elif action == 'fill':
+                new_style = self.highlight_style(style)
+                if col not in cells:
+                    cells[col] = (f' r="{ref}" s="{new_style}"', None)
+                else:
+                    if style_match:
+                        attrs = XLSX_STYLE_RE.sub(rf'\g<1>s="{new_style}"', attrs, count=1)
+                    else:
+                        attrs += f' s="{new_style}"'
+                    cells[col] = (attrs, cells[col][1])
+            elif action == 'unset':
+                cells[col] = (f' r="{ref}" s="{plain}"', None)
+            else:
+                new_style = self.highlight_style(style) if action == 'id' else value
+                cell_text = 'Match ID' if action == 'header' else value
+                inner = f'<is><t>{html.escape(str(cell_text), quote=False)}</t></is>'
+                cells[col] = (f' r="{ref}" s="{new_style}" t="inlineStr"', inner)
+        
+        # spans is only an optimization hint and may no longer cover the row
+        row_attrs = re.sub(r'\sspans="[^"]*"', '', row_attrs)
+        cell_xml = ''.join(f'<c{attrs}/>' if inner is None else f'<c{attrs}>{inner}</c>'
+                           for _, (attrs, inner) in sorted(cells.items()))
+        return f'<row{row_attrs}>{cell_xml}</row>'
+    
+    def widen_dimension(self, text, col):
+        """Extend the sheet's dimension ref to include col"""
+        def widen(match):
+            start, _, end = match.group(1).partition(':')
+            end = end or start
+            end_col, end_row = re.match(r'([A-Z]+)(\d+)', end).groups()
+            if openpyxl.utils.column_index_from_string(end_col) < col:
+                end_col = openpyxl.utils.get_column_letter(col)
+            return f'<dimension ref="{start}:{end_col}{end_row}"/>'
+        # openpyxl writes the tag with a space before '/>'
+        return re.sub(r'<dimension ref="([A-Z]+\d+(?::[A-Z]+\d+)?)"\s*/>', widen, text, count=1)
+    
+    def set_column_width(self, text, col, width):
+        """Give column col its own <col> entry with the given width (splitting any range covering it)"""
+        new_col = f'<col min="{col}" max="{col}" width="{width}" customWidth="1"/>'
+        cols_match = re.search(r'<cols>(.*?)</cols>', text, re.S)
+        if not cols_match:
+            insert_at = text.find('<sheetData>')
+            return f'{text[:insert_at]}<cols>{new_col}</cols>{text[insert_at:]}'
+        
+        entries = []
+        placed = False
+        for col_xml in re.findall(r'<col\b[^>]*/>', cols_match.group(1)):
+            col_min = int(re.search(r'\smin="(\d+)"', col_xml).group(1))
+            col_max = int(re.search(r'\smax="(\d+)"', col_xml).group(1))
+            if not placed and col < col_min:
+                entries.append(new_col)
+                placed = True
+            if col_min <= col <= col_max:
+                # Keep the range's other attributes (style, hidden, ...) on the split pieces
+                def ranged(lo, hi, extra=''):
+                    piece = re.sub(r'\smin="\d+"', f' min="{lo}"', col_xml, count=1)
+                    piece = re.sub(r'\smax="\d+"', f' max="{hi}"', piece, count=1)
+                    if extra:
+                        piece = re.sub(r'\swidth="[^"]*"', '', piece, count=1)
+                        piece = re.sub(r'\scustomWidth="[^"]*"', '', piece, count=1)
+                        piece = piece.replace('/>', f' width="{width}" customWidth="1"/>')
+                    return piece
+                if col_min < col:
+                    entries.append(ranged(col_min, col - 1))
+                entries.append(ranged(col, col, 'width'))
+                if col < col_max:
+                    entries.append(ranged(col + 1, col_max))
+                placed = True
+                continue
+            entries.append(col_xml)
+        if not placed:
+            entries.append(new_col)
+        return f"{text[:cols_match.start()]}<cols>{''.join(entries)}</cols>{text[cols_match.end():]}"
+    
+    def patch_styles(self):
+        """Add the highlight fill and the highlighted cell formats to styles.xml"""
+        if self.styles_xml is None or len(self.cell_xfs) == self.base_xf_count:
+            return
+        text = self.styles_xml
+        if self.add_fill:
+            text = re.sub(r'<fills count="(\d+)">(.*?)</fills>',
+                          lambda m: f'<fills count="{self.fill_id + 1}">{m.group(2)}{HIGHLIGHT_FILL_XML}</fills>',
+                          text, count=1, flags=re.S)
+        text = re.sub(r'<cellXfs count="\d+">.*?</cellXfs>',
+                      lambda m: f'<cellXfs count="{len(self.cell_xfs)}">{"".join(self.cell_xfs)}</cellXfs>',
+                      text, count=1, flags=re.S)
+        self.patched_parts[self.styles_part] = text.encode('utf-8')
+    
+    def save(self):
+        """Write the patched package to a temporary file and replace the original with it"""
+        self.patch_styles()
+        tmp_path = self.file_path + '.tmp'
+        try:
+            with zipfile.ZipFile(tmp_path, 'w') as out:
+                for info in self.zip.infolist():
+                    data = self.patched_parts.get(info.filename)
+                    if data is None:
+                        data = self.zip.read(info)
+                    out.writestr(info, data)
+            self.zip.close()
+            os.replace(tmp_path, self.file_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+# Row numbers of cell references - the only part of copied-down formulas like =G6*H6 that
+# changes from row to row. Quoted sheet names and strings are matched whole and kept as is.
+FORMULA_ROW_DIGITS_RE = re.compile(r"""'(?:[^']|'')*'|"[^"]*"|(?<=[A-Z$])\d+(?![\w!(])""")
+FORMULA_REF_PART_RE = re.compile(r'^(\$?)([A-Z]{1,3})(\$?)(\d*)$')
+
+class FormulaColumnShifter:
+    """Shifts column references after columns are inserted into a sheet
+    Formulas are tokenized with openpyxl's Tokenizer so function names, sheet names and
+    strings are left alone; only references into the changed sheet are moved (unqualified
+    references in its own formulas and 'Sheet'!A1 references from anywhere). Results are
+    cached per formula shape (row numbers blanked out), so each distinct shape is only
+    tokenized once."""
+    
+    def __init__(self, sheet_title, inserted_col=1, amount=1):
+        self.sheet_title = sheet_title
+        self.inserted_col = inserted_col
+        self.amount = amount
+        self.shape_cache = {}
+    
+    def shift_formula(self, formula, on_same_sheet=True):
+        """Return formula with references to the changed sheet shifted right"""
+        rows = []
+        key = (self.formula_shape(formula, rows), on_same_sheet)
+        template = self.shape_cache.get(key)
+        if template is None:
+            shifted = self.shift_tokens(formula, on_same_sheet)
+            template = self.formula_shape(shifted, [])
+            if template.count('\0') != len(rows):
+                return shifted  # Shape can't be re-used safely, don't cache it
+            self.shape_cache[key] = template
+        if not rows:
+            return template
+        pieces = template.split('\0')
+        return ''.join(piece + row for piece, row in zip(pieces, rows)) + pieces[-1]
+    
+    def formula_shape(self, formula, rows):
+        """Formula with reference row numbers replaced by NUL (the numbers are appended to rows)"""
+        def blank_row(match):
+            text = match.group(0)
+            if text[0] in '\'"':
+                return text
+            rows.append(text)
+            return '\0'
+        return FORMULA_ROW_DIGITS_RE.sub(blank_row, formula)
+    
+    def shift_tokens(self, formula, on_same_sheet):
+        tokenizer = Tokenizer(formula)
+        for token in tokenizer.items:
+            if token.type == Token.OPERAND and token.subtype == Token.RANGE:
+                token.value = self.shift_reference(token.value, on_same_sheet)
+        return tokenizer.render()
+    
+    def shift_reference(self, reference, on_same_sheet):
+        """Shift one range operand such as G6, $A$1:B5, 'Top Page'!C5 or RM!B:B"""
+        sheet, separator, address = reference.rpartition('!')
+        if separator:
+            if sheet.startswith("'") and sheet.endswith("'"):
+                sheet = sheet[1:-1].replace("''", "'")
+            if sheet != self.sheet_title:
+                return reference
+        elif not on_same_sheet:
+            return reference
+        
+        parts = address.split(':')
+        shifted = []
+        for part in parts:
+            ref = FORMULA_REF_PART_RE.match(part)
+            # Letters alone are only a column in a range like B:B (otherwise a defined name)
+            if not ref or (not ref.group(4) and len(parts) == 1):
+                return reference
+            col = openpyxl.utils.column_index_from_string(ref.group(2))
+            if col >= self.inserted_col:
+                col += self.amount
+            shifted.append(f"{ref.group(1)}{openpyxl.utils.get_column_letter(col)}{ref.group(3)}{ref.group(4)}")
+        return reference[:len(reference) - len(address)] + ':'.join(shifted)
+
+class HighlightStyler:
+    """Highlights cells of one workbook through cached style arrays
+    The highlight fill is registered with the workbook once and each distinct cell style
+    is combined with it once, so highlighting a cell is a single style assignment.
+    Highlights can be removed again when the cell's original style is known: from the
+    cells highlighted here, or from style_origins (highlighted -> original cell format
+    index in the loaded file, as recorded by XlsxMatchIdWriter)."""
+    
+    def __init__(self, wb, fill=HIGHLIGHT_FILL, style_origins=None):
+        self.wb = wb
+        self.fill_id = wb._fills.add(fill)
+        self.styles = {}  # Original style array (as tuple) -> highlighted style array
+        self.origins = {}  # Highlighted style array (as tuple) -> original style array, None if ambiguous
+        self.index_origins = {}  # Highlighted cell format index in the loaded file -> original style array
+        self.cells_kept_highlighted = 0  # Highlights that couldn't be removed (original style unknown)
+        cell_styles = wb._cell_styles
+        for highlighted, original in (style_origins or {}).items():
+            if highlighted < len(cell_styles) and original < len(cell_styles):
+                highlighted_style, original_style = cell_styles[highlighted], cell_styles[original]
+                # Only formats that still differ by nothing but the highlight fill
+                if original_style.fillId != self.fill_id and self.with_fill(original_style) == highlighted_style:
+                    self.index_origins[highlighted] = original_style
+                    self.add_origin(highlighted_style, original_style)
+    
+    def with_fill(self, style):
+        style = copy(style)
+        style.fillId = self.fill_id
+        return style
+    
+    def add_origin(self, highlighted_style, original_style):
+        key = tuple(highlighted_style)
+        known = self.origins.get(key, original_style)
+        # Two styles differing only in their fill look the same once highlighted
+        self.origins[key] = original_style if known is not None and tuple(known) == tuple(original_style) else None
+    
+    def highlight(self, cell):
+        source = cell._style if cell._style is not None else StyleArray()  # New cells have no style yet
+        if source.fillId == self.fill_id:
+            return  # Already highlighted
+        key = tuple(source)
+        style = self.styles.get(key)
+        if style is None:
+            style = self.with_fill(source)
+            self.styles[key] = style
+            self.add_origin(style, copy(source))
+        # openpyxl's style setters modify a cell's array in place, so every cell needs its own copy
+        cell._style = copy(style)
+    
+    def highlight_row(self, ws, row_num, cols):
+        for col in cols:
+            self.highlight(ws.cell(row_num, col))
+    
+    def unhighlight_row(self, ws, row_num, cols, cell_formats=None):
+        """Give the row's highlighted cells their original style back (where it is known)
+        
+        Args:
+            cell_formats: {(row, column): cell format index} of the cells as loaded (see
+                XlsxMatchIdWriter.row_styles); without it, formats that only differ in their
+                fill can't be told apart once highlighted and keep their highlight
+        """
+        for col in cols:
+            cell = ws._cells.get((row_num, col))
+            if cell is None or cell._style is None or cell._style.fillId != self.fill_id:
+                continue
+            if cell_formats and (row_num, col) in cell_formats:
+                original = self.index_origins.get(cell_formats[(row_num, col)])
+                if original is not None and self.with_fill(original) != cell._style:
+                    original = None  # Changed since loading
+            else:
+                original = self.origins.get(tuple(cell._style))
+            if original is None:
+                self.cells_kept_highlighted += 1
+            else:
+                cell._style = copy(original)
+    
+    def saved_style_origins(self):
+        """Highlighted -> original cell format index in the file just saved from the workbook
+        (for the next run's style_origins)"""
+        cell_styles = self.wb._cell_styles
+        written = len(cell_styles)
+        origins = {}
+        for highlighted, original in self.origins.items():
+            if original is None:
+                continue
+            # add() gives the index the saved cells refer to; anything it has to append wasn't saved
+            highlighted_index = cell_styles.add(StyleArray(highlighted))
+            original_index = cell_styles.add(copy(original))
+            if highlighted_index < written and original_index < written:
+                origins[highlighted_index] = original_index
+        return origins
+
+class StockReportEngine:
+    """Validation pipeline: read both reports, match rows, write Match IDs and the analysis report
+    Progress is reported through log_status() (printed by default) and the stage hooks,
+    which the GUI overrides."""
+    
+    def __init__(self):
+        self.odoo_file_path = None
+        self.manual_file_path = None
+        self.cancel_event = threading.Event()
+        self.stage_timings = []  # (stage name, seconds, top level) of the current run
+        self.files_written = False
+        self.metrics = None  # Per-stage metrics of the current run, None unless collecting metrics
+        self.trace_memory = False  # Also record tracemalloc peaks in the metrics
+        self.metric_frames = []  # Metrics of the stages currently running (innermost last)
+        self.session_rows = None  # SessionRowStore of a long-running front end (None: always read the files)
+    
+    def log_status(self, message):
+        print(message)
+    
+    def check_cancelled(self):
+        """Raise ValidationCancelled if Cancel was pressed"""
+        if self.cancel_event.is_set():
+            raise ValidationCancelled()
+    
+    @contextmanager
+    def stage(self, name, advance=True):
+        """Time one step of a validation run
+        Checks for Cancel before starting, logs the duration when done and (if advance)
+        tells the front end that one of the VALIDATION_STAGES is finished.
+        """
+        self.check_cancelled()
+        if advance:
+            self.stage_started(name)
+        frame = self.begin_stage_metrics(name, advance) if self.metrics is not None else None
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            if frame is not None:
+                self.pop_stage_frame(frame)  # A failed stage has no metrics
+            raise
+        elapsed = time.perf_counter() - start
+        self.stage_timings.append((name, elapsed, advance))
+        if frame is not None:
+            self.end_stage_metrics(frame, elapsed)
+        self.log_status(f"  [{name}: {elapsed:.2f}s]")
+        if advance:
+            self.stage_finished(name)
+    
+    def begin_stage_metrics(self, name, top_level):
+        """Start CPU time (and traced memory) measurement for a stage (only when collecting metrics)
+        tracemalloc has a single peak counter, so the peak reached so far is handed to the
+        enclosing stage before the counter is reset for this one.
+        """
+        if self.trace_memory:
+            if self.metric_frames:
+                parent = self.metric_frames[-1]
+                parent['memory_peak'] = max(parent['memory_peak'], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        frame = {'stage': name, 'top_level': top_level, 'cpu_start': time.process_time(),
+                 'memory_peak': 0, 'counters': {}}
+        self.metric_frames.append(frame)
+        return frame
+    
+    def end_stage_metrics(self, frame, elapsed):
+        """Record the finished stage's metrics and pass its memory peak on to the enclosing stage"""
+        self.pop_stage_frame(frame)
+        traced_peak = None
+        if self.trace_memory:
+            peak = max(frame['memory_peak'], tracemalloc.get_traced_memory()[1])
+            if self.metric_frames:
+                parent = self.metric_frames[-1]
+                parent['memory_peak'] = max(parent['memory_peak'], peak)
+            traced_peak = round(peak / (1024 * 1024), 2)
+        rss_peak = peak_rss_mb()
+        self.metrics.append({
+            'stage': frame['stage'],
+            'top_level': frame['top_level'],
+            'wall_seconds': round(elapsed, 4),
+            'cpu_seconds': round(time.process_time() - frame['cpu_start'], 4),
+            'peak_rss_mb': round(rss_peak, 1) if rss_peak is not None else None,
+            'tracemalloc_peak_mb': traced_peak,
+            'counters': frame['counters'],
+        })
+    
+    def pop_stage_frame(self, frame):
+        """Remove frame (and any frames of failed stages left above it) from the running stages"""
+        while self.metric_frames and self.metric_frames.pop() is not frame:
+            pass
+    
+    def count(self, counter, amount=1):
+        """Add to a row/cell counter of the innermost running stage (only when collecting metrics)"""
+        if self.metric_frames:
+            counters = self.metric_frames[-1]['counters']
+            counters[counter] = counters.get(counter, 0) + amount
+    
+    def stage_started(self, name):
+        """Hook for front ends: a top level stage is starting"""
+    
+    def stage_finished(self, name):
+        """Hook for front ends: a top level stage is done"""
+    
+    def log_stage_timings(self):
+        """Log how long each stage of the run took"""
+        if not self.stage_timings:
+            return
+        if self.metrics:
+            self.log_stage_metrics()
+            return
+        self.log_status("\nStage timings:")
+        for name, elapsed, top_level in self.stage_timings:
+            # Sub-steps (e.g. single sheet reads) are indented under their stage
+            label = name if top_level else f"  {name}"
+            self.log_status(f"  {label:<30} {elapsed:8.2f}s")
+        total = sum(elapsed for _, elapsed, top_level in self.stage_timings if top_level)
+        self.log_status(f"  {'Total':<30} {total:8.2f}s")
+    
+    def start_run(self, metrics=False, trace_memory=False):
+        """Reset the per-run state (timings, metrics, files_written) before a run"""
+        self.stage_timings = []
+        self.files_written = False
+        self.metrics = [] if (metrics or trace_memory) else None
+        self.trace_memory = trace_memory
+        self.metric_frames = []
+    
+    def run_validation(self, odoo_file, manual_file, matching_mode='simple', output_mode='insert',
+                       parallel=False, use_cache=True, report_dir=None, metrics=False, trace_memory=False,
+                       cprofile=False, incremental=True):
+        """Run the whole validation for one Odoo/Manual file pair
+        
+        Args:
+            odoo_file: Path to Odoo file
+            manual_file: Path to Manual file (both files are updated in place)
+            matching_mode: 'simple' (code OR name) or 'strict' (all fields)
+            output_mode: 'insert' or 'sidecar' (see process_files)
+            parallel: Read the sheets in a process pool
+            use_cache: Reuse parsed rows of unchanged files
+            report_dir: Folder for the analysis report (default: folder of the Manual file)
+            metrics: Measure wall/CPU time, row/cell counters and the process's peak RSS per stage
+                and write them to validation_metrics.json in report_dir
+            trace_memory: Also record tracemalloc peaks per stage (implies metrics). Much slower, and
+                tracing a fully loaded Manual workbook takes several times its normal memory
+            cprofile: Also profile the run with cProfile and dump it to validation_profile.prof
+                in report_dir (sheets read by the parallel reader processes are not profiled)
+            incremental: If an earlier sidecar run on the pair left its match state, only re-match
+                the rows changed since then (see match_pair). Sidecar runs always store a new state.
+        
+        Returns:
+            Dict with 'sheet_matches' (sheet name -> matches), 'total_matches', 'odoo_rows',
+            'manual_rows', 'report_path' and 'differences' (the report's summary counts, see
+            generate_analysis_report), plus the other keys of run_analysis's result. The report
+            is written even when nothing matched. With metrics/cprofile, 'metrics_path' is the
+            written metrics file.
+        """
+        self.start_run(metrics, trace_memory)
+        if report_dir is None:
+            report_dir = default_report_dir(odoo_file, manual_file)
+        run_info = {'odoo_file': odoo_file, 'manual_file': manual_file, 'matching_mode': matching_mode,
+                    'output_mode': output_mode, 'parallel': parallel, 'use_cache': use_cache,
+                    'incremental': incremental}
+        return self.run_measured('validation', run_info, report_dir, cprofile, self.run_validation_stages,
+                                 odoo_file, manual_file, matching_mode, output_mode, parallel, use_cache, report_dir,
+                                 incremental)
+    
+    def run_analysis(self, odoo_file, manual_file, matching_mode='simple', parallel=False, use_cache=True,
+                     report_dir=None, metrics=False, trace_memory=False, cprofile=False, incremental=True):
+        """Read, match and write the analysis report without touching the files
+        With a session_rows store, files unchanged since they were last read are not read
+        again, so analysing the same pair in the other matching mode only re-runs matching.
+        apply_matches writes the result into the files afterwards.
+        
+        Args:
+            Same as run_validation (minus output_mode); metrics go to analysis_metrics.json
+        
+        Returns:
+            Dict with 'sheet_matches' (sheet name -> matches), 'total_matches', 'odoo_rows',
+            'manual_rows', 'report_path', 'differences' (the report's summary counts, see
+            generate_analysis_report; the report is written even when nothing matched),
+            'matching_mode', 'file_signatures' (the (Odoo, Manual) file_signature the rows were
+            read from), 'rows' (the (odoo_data, manual_sheets_data) they were matched from) and
+            'has_match_ids' (no matches, but an earlier sidecar run left Match IDs to remove)
+        """
+        self.start_run(metrics, trace_memory)
+        if report_dir is None:
+            report_dir = default_report_dir(odoo_file, manual_file)
+        run_info = {'odoo_file': odoo_file, 'manual_file': manual_file, 'matching_mode': matching_mode,
+                    'parallel': parallel, 'use_cache': use_cache, 'incremental': incremental}
+        return self.run_measured('analysis', run_info, report_dir, cprofile, self.run_analysis_stages,
+                                 odoo_file, manual_file, matching_mode, parallel, use_cache, report_dir, incremental)
+    
+    def apply_matches(self, odoo_file, manual_file, analysis, output_mode='insert', report_dir=None,
+                      metrics=False, trace_memory=False, cprofile=False):
+        """Write the Match IDs and highlights of an earlier run_analysis into both files
+        
+        Args:
+            odoo_file, manual_file: The analysed files (updated in place)
+            analysis: The run_analysis result
+            output_mode: 'insert' or 'sidecar' (see process_files)
+            report_dir: Folder for apply_metrics.json (default: folder of the Manual file)
+            metrics, trace_memory, cprofile: See run_validation
+        
+        Returns:
+            Dict with 'total_matches' (and 'metrics_path' with metrics/cprofile)
+        """
+        self.start_run(metrics, trace_memory)
+        if report_dir is None:
+            report_dir = default_report_dir(odoo_file, manual_file)
+        run_info = {'odoo_file': odoo_file, 'manual_file': manual_file, 'output_mode': output_mode}
+        return self.run_measured('apply', run_info, report_dir, cprofile, self.apply_matches_stages,
+                                 odoo_file, manual_file, analysis, output_mode)
+    
+    def run_measured(self, run_name, run_info, report_dir, cprofile, run_stages, *args):
+        """Call run_stages(*args), collecting metrics / a cProfile dump if start_run asked for them
+        
+        Args:
+            run_name: 'validation', 'analysis' or 'apply' - names the metrics and profile files
+            run_info: Settings of the run, stored at the top of the metrics file
+            report_dir: Folder for the metrics and profile files
+            cprofile: Profile the run with cProfile
+            run_stages: Method running the stages, returns the result dict
+        
+        Returns:
+            The result of run_stages, with 'metrics_path' when measured
+        """
+        if self.metrics is None and not cprofile:
+            return run_stages(*args)
+        
+        profiler = cProfile.Profile() if cprofile else None
+        trace_memory = self.trace_memory
+        if trace_memory:
+            tracemalloc.start()
+        status = 'failed'
+        result = None
+        start = time.perf_counter()
+        try:
+            if profiler:
+                profiler.enable()
+            result = run_stages(*args)
+            status = 'completed'
+        except ValidationCancelled:
+            status = 'cancelled'
+            raise
+        finally:
+            if profiler:
+                profiler.disable()
+            if trace_memory:
+                tracemalloc.stop()
+            run_info = dict(run_info, status=status, total_seconds=round(time.perf_counter() - start, 4),
+                            total_matches=result['total_matches'] if result else None)
+            metrics_path = self.write_run_metrics(report_dir, run_info, profiler, run_name)
+        result['metrics_path'] = metrics_path
+        return result
+    
+    def write_run_metrics(self, report_dir, run_info, profiler=None, run_name='validation'):
+        """Write the collected stage metrics (and the cProfile dump) next to the analysis report
+        
+        Args:
+            report_dir: Folder of the analysis report
+            run_info: Settings and outcome of the run (stored at the top of the JSON file)
+            profiler: cProfile.Profile of the run, or None
+            run_name: Names the files (<run_name>_metrics.json, <run_name>_profile.prof)
+        
+        Returns:
+            Path of the metrics file, or None if it could not be written
+        """
+        stages = self.metrics or []
+        totals = {}
+        for stage in stages:
+            for counter, amount in stage['counters'].items():
+                totals[counter] = totals.get(counter, 0) + amount
+        data = dict(run_info)
+        data['generated'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        data['peak_rss_mb'] = max((stage['peak_rss_mb'] for stage in stages if stage['peak_rss_mb'] is not None),
+                                  default=None)
+        data['tracemalloc_peak_mb'] = max((stage['tracemalloc_peak_mb'] for stage in stages
+                                           if stage['tracemalloc_peak_mb'] is not None), default=None)
+        data['counters'] = totals
+        data['stages'] = stages
+        data['profile_path'] = None
+        
+        try:
+            if profiler is not None:
+                profile_path = os.path.join(report_dir, PROFILE_FILENAME.format(run_name))
+                profiler.dump_stats(profile_path)
+                data['profile_path'] = profile_path
+                self.log_status(f"\ncProfile dump saved to: {profile_path} (open with: python -m pstats)")
+                summary = io.StringIO()
+                pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(PROFILE_LOG_LINES)
+                self.log_status(summary.getvalue().rstrip())
+            
+            metrics_path = os.path.join(report_dir, METRICS_FILENAME.format(run_name))
+            with open(metrics_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+        except OSError as e:
+            self.log_status(f"Warning: Could not write metrics to {report_dir}: {e}")
+            return None
+        self.log_status(f"Metrics saved to: {metrics_path}")
+        return metrics_path
+    
+    def log_stage_metrics(self):
+        """Log wall/CPU time, memory peaks and counters of each stage (when metrics were collected)"""
+        def megabytes(value):
+            return f"{value:.1f}" if value is not None else '-'
+        
+        self.log_status("\nStage metrics:")
+        self.log_status(f"  {'Stage':<32} {'Wall s':>8} {'CPU s':>8} {'RSS MB':>8} {'Traced MB':>9}  Counters")
+        for stage in self.metrics:
+            label = stage['stage'] if stage['top_level'] else f"  {stage['stage']}"
+            counters = ', '.join(f"{counter}={amount}" for counter, amount in stage['counters'].items())
+            self.log_status(f"  {label:<32} {stage['wall_seconds']:8.2f} {stage['cpu_seconds']:8.2f} "
+                            f"{megabytes(stage['peak_rss_mb']):>8} {megabytes(stage['tracemalloc_peak_mb']):>9}  "
+                            f"{counters}")
+        total = sum(stage['wall_seconds'] for stage in self.metrics if stage['top_level'])
+        self.log_status(f"  {'Total':<32} {total:8.2f}")
+    
+    def run_validation_stages(self, odoo_file, manual_file, matching_mode, output_mode, parallel, use_cache,
+                              report_dir, incremental=True):
+        """Reading, matching, reporting and writing stages of run_validation: the stages of
+        run_analysis followed by those of apply_matches"""
+        self.log_status("=" * 60)
+        self.log_status("Starting validation...")
+        self.log_status("=" * 60)
+        
+        result = self.analyse_pair(odoo_file, manual_file, matching_mode, parallel, use_cache, report_dir,
+                                   incremental)
+        if result['total_matches'] == 0:
+            self.log_status("\nNo matches found!")
+            if output_mode == 'sidecar' and result['has_match_ids']:
+                # Still remove the Match IDs and highlights an earlier run left in the files
+                self.apply_matches_stages(odoo_file, manual_file, result, output_mode)
+            return result
+        
+        self.apply_matches_stages(odoo_file, manual_file, result, output_mode)
+        
+        self.log_status("\n" + "=" * 60)
+        self.log_status("VALIDATION COMPLETED SUCCESSFULLY!")
+        self.log_status("=" * 60)
+        self.log_match_summary(result['sheet_matches'])
+        return result
+    
+    def run_analysis_stages(self, odoo_file, manual_file, matching_mode, parallel, use_cache, report_dir,
+                            incremental=True):
+        """Reading, matching and reporting stages of run_analysis"""
+        self.log_status("=" * 60)
+        self.log_status("Starting analysis...")
+        self.log_status("=" * 60)
+        
+        result = self.analyse_pair(odoo_file, manual_file, matching_mode, parallel, use_cache, report_dir,
+                                   incremental)
+        
+        self.log_status("\n" + "=" * 60)
+        self.log_status("ANALYSIS COMPLETED - files not modified yet")
+        self.log_status("=" * 60)
+        if result['total_matches'] == 0:
+            self.log_status("\nNo matches found!")
+        else:
+            self.log_match_summary(result['sheet_matches'])
+        return result
+    
+    def analyse_pair(self, odoo_file, manual_file, matching_mode, parallel, use_cache, report_dir, incremental):
+        """Read, match and write the analysis report (shared by run_analysis and run_validation)
+        
+        Returns:
+            The run_analysis result dict
+        """
+        # Taken before reading, so a save during the read shows up as a change later
+        signatures = (file_signature(odoo_file), file_signature(manual_file))
+        odoo_data, manual_sheets_data = self.read_pair(odoo_file, manual_file, parallel, use_cache)
+        previous = self.load_match_state(odoo_file, manual_file) if incremental else None
+        sheet_matches = self.match_pair(odoo_data, manual_sheets_data, matching_mode, previous)
+        total_matches = sum(len(matches) for matches in sheet_matches.values())
+        result = {'sheet_matches': sheet_matches, 'odoo_rows': len(odoo_data),
+                  'manual_rows': sum(len(rows) for rows in manual_sheets_data.values()),
+                  'total_matches': total_matches, 'matching_mode': matching_mode, 'file_signatures': signatures,
+                  'rows': (odoo_data, manual_sheets_data),
+                  # Without matches, applying (sidecar) still removes the Match IDs of an earlier run
+                  'has_match_ids': total_matches == 0 and self.has_sidecar_match_ids(odoo_file, manual_file)}
+        
+        # The report also lists what didn't match, so it's worth having even without matches
+        result['report_path'], result['differences'] = self.write_report(
+            odoo_data, manual_sheets_data, sheet_matches, report_dir, matching_mode)
+        return result
+    
+    def apply_matches_stages(self, odoo_file, manual_file, analysis, output_mode):
+        """Writing stage of apply_matches"""
+        sheet_matches = analysis['sheet_matches']
+        total_matches = sum(len(matches) for matches in sheet_matches.values())
+        if total_matches == 0 and output_mode != 'sidecar':
+            self.log_status("\nNo matches - nothing to write.")
+            return {'total_matches': 0}
+        highlight_styles = self.write_pair(odoo_file, manual_file, sheet_matches, output_mode)
+        odoo_data, manual_sheets_data = analysis['rows']
+        self.update_match_state(odoo_file, manual_file, output_mode, odoo_data, manual_sheets_data, sheet_matches,
+                                analysis['matching_mode'], highlight_styles)
+        self.log_status(f"\nMatch IDs of {total_matches} matches written to both files.")
+        return {'total_matches': total_matches}
+    
+    def read_pair(self, odoo_file, manual_file, parallel, use_cache):
+        """Reading stage: load both files and log the row counts and units
+        
+        Returns:
+            Tuple of (odoo_data, dict of sheet name -> manual rows)
+        """
+        # Read files (unchanged files are served from the parsed-data cache)
+        self.log_status("\nLoading Odoo and Manual files...")
+        with self.stage("Reading files"):
+            odoo_data, manual_sheets_data = self.load_data(odoo_file, manual_file, parallel=parallel, use_cache=use_cache)
+        self.log_status(f"Found {len(odoo_data)} data rows in Odoo file")
+        for sheet_name in MANUAL_SHEETS:
+            self.log_status(f"Found {len(manual_sheets_data[sheet_name])} data rows in Manual {sheet_name} sheet")
+        
+        # Show all normalized units
+        self.log_status("\nCollecting unique units...")
+        all_manual_data = [row for sheet_name in MANUAL_SHEETS for row in manual_sheets_data[sheet_name]]
+        self.show_normalized_units(odoo_data, all_manual_data)
+        return odoo_data, manual_sheets_data
+    
+    def match_pair(self, odoo_data, manual_sheets_data, matching_mode, previous=None):
+        """Matching stages: match the Odoo rows against each Manual sheet
+        
+        Args:
+            previous: Match state of an earlier run on the pair (see load_match_state). If it
+                was matched in the same mode, only rows changed since then are matched again.
+        
+        Returns:
+            Dict of sheet name -> matches, in MANUAL_SHEETS order
+        """
+        if matching_mode == "simple":
+            # Simple matching: Product Code OR Product Name
+            self.log_status("\nUsing SIMPLE matching mode: Product Code OR Product Name")
+            matcher = self.find_matches_simple
+        else:
+            # Strict matching: All fields must match
+            self.log_status("\nUsing STRICT matching mode: All fields must match")
+            matcher = self.find_matches
+        
+        if previous is not None and previous['matching_mode'] == matching_mode:
+            sheet_matches = self.match_pair_incremental(odoo_data, manual_sheets_data, matching_mode, matcher,
+                                                        previous)
+            if sheet_matches is not None:
+                return sheet_matches
+        
+        sheet_matches = {}
+        for sheet_name in MANUAL_SHEETS:
+            self.log_status(f"Finding matches for {sheet_name} sheet...")
+            with self.stage(f"Matching {sheet_name}"):
+                sheet_matches[sheet_name] = matcher(odoo_data, manual_sheets_data[sheet_name],
+                                                    prefix=MATCH_ID_PREFIXES[sheet_name])
+            self.log_status(f"Found {len(sheet_matches[sheet_name])} {sheet_name} matches")
+        return sheet_matches
+    
+    def match_pair_incremental(self, odoo_data, manual_sheets_data, matching_mode, matcher, previous):
+        """Matching stages of a re-run: keep the previous matches of rows that didn't change
+        A row is unchanged when the same row number has the same fingerprint as before. An Odoo
+        row's match only depends on its own values and the Manual rows sharing its code/name
+        (simple) or code/name/unit (strict), so only these Odoo rows are matched again:
+        changed ones, those matched to a changed Manual row and those sharing a key with one.
+        Kept matches keep their Match IDs; new matches get the next free number of their sheet.
+        
+        Returns:
+            Dict of sheet name -> matches (in Odoo row order), or None when too many rows
+            changed for this to pay off
+        """
+        def changed_rows(old_fingerprints, rows):
+            new_fingerprints = {row.row_num: row.fingerprint() for row in rows}
+            return {row_num for row_num in old_fingerprints.keys() | new_fingerprints.keys()
+                    if old_fingerprints.get(row_num) != new_fingerprints.get(row_num)}
+        
+        changed_odoo = changed_rows(previous['odoo_fingerprints'], odoo_data)
+        changed_manual = {sheet_name: changed_rows(previous['manual_fingerprints'].get(sheet_name, {}),
+                                                   manual_sheets_data[sheet_name])
+                          for sheet_name in MANUAL_SHEETS}
+        total_rows = len(odoo_data) + sum(len(rows) for rows in manual_sheets_data.values())
+        total_changed = len(changed_odoo) + sum(len(rows) for rows in changed_manual.values())
+        if total_changed > total_rows * INCREMENTAL_MAX_CHANGED_RATIO:
+            self.log_status(f"{total_changed} of {total_rows} rows changed since the previous run - matching all rows")
+            return None
+        self.log_status(f"Re-matching only what changed since the previous run: {len(changed_odoo)} Odoo rows, "
+                        f"{total_changed - len(changed_odoo)} Manual rows")
+        
+        # Keys a row can match on; empty ones never match anything
+        if matching_mode == "simple":
+            def match_keys(code, name, unit):
+                keys = [('code', self.normalize_product_code(code)), ('name', name)]
+                return [key for key in keys if key[1]]
+        else:
+            def match_keys(code, name, unit):
+                key = self.strict_match_key(code, name, unit)
+                return [key] if key is not None else []
+        odoo_keys = None  # Keys of every Odoo row, worked out once a Manual row has changed
+        odoo_by_row = {row.row_num: row for row in odoo_data}
+        position = {row.row_num: pos for pos, row in enumerate(odoo_data)}
+        
+        sheet_matches = {}
+        for sheet_name in MANUAL_SHEETS:
+            prefix = MATCH_ID_PREFIXES[sheet_name]
+            with self.stage(f"Matching {sheet_name}"):
+                manual_rows = manual_sheets_data[sheet_name]
+                old_matches = previous['sheet_matches'].get(sheet_name, [])
+                sheet_changed = changed_manual[sheet_name]
+                
+                affected = set(changed_odoo)
+                affected.update(odoo_row for _, odoo_row, manual_row in old_matches if manual_row in sheet_changed)
+                if sheet_changed:
+                    dirty_keys = {key for row in manual_rows if row.row_num in sheet_changed
+                                  for key in match_keys(row.product_code, row.items_name, row.unit)}
+                    if odoo_keys is None:
+                        odoo_keys = [(row.row_num, match_keys(row.product_code, row.product_name, row.unit))
+                                     for row in odoo_data]
+                    affected.update(row_num for row_num, keys in odoo_keys if not dirty_keys.isdisjoint(keys))
+                
+                rematched = matcher([row for row in odoo_data if row.row_num in affected], manual_rows,
+                                    prefix=prefix)
+                old_ids = {(odoo_row, manual_row): match_id for match_id, odoo_row, manual_row in old_matches}
+                next_number = max((int(match_id[len(prefix):]) for match_id, _, _ in old_matches
+                                   if match_id[len(prefix):].isdigit()), default=0) + 1
+                matches = []
+                for match_id, odoo_row, manual_row in old_matches:
+                    if odoo_row not in affected:
+                        row = odoo_by_row[odoo_row]
+                        matches.append({'match_id': match_id, 'odoo_row_num': odoo_row, 'manual_row_num': manual_row,
+                                        'product_code': row.product_code, 'name': row.product_name})
+                for match in rematched:
+                    match_id = old_ids.get((match['odoo_row_num'], match['manual_row_num']))
+                    if match_id is None:
+                        match_id = f'{prefix}{str(next_number).zfill(4)}'
+                        next_number += 1
+                    match['match_id'] = match_id
+                    matches.append(match)
+                matches.sort(key=lambda match: position[match['odoo_row_num']])
+                sheet_matches[sheet_name] = matches
+                self.count('incremental_odoo_rows_rematched', len(affected & position.keys()))
+            self.log_status(f"Found {len(matches)} {sheet_name} matches "
+                            f"({len(affected & position.keys())} Odoo rows re-matched)")
+        return sheet_matches
+    
+    def load_match_state(self, odoo_file, manual_file):
+        """Fingerprints and matches stored by the last sidecar run on this pair
+        
+        Returns:
+            Dict with 'matching_mode', 'odoo_fingerprints' (row number -> fingerprint),
+            'manual_fingerprints' (sheet name -> row number -> fingerprint), 'sheet_matches'
+            (sheet name -> list of (match ID, Odoo row, Manual row)) and 'highlight_styles'
+            ('odoo' / 'manual' -> highlighted -> original cell format index), or None if there
+            is no usable state for the pair
+        """
+        path = manual_file + MATCH_STATE_SUFFIX
+        try:
+            with open(path, encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            self.log_status(f"Warning: Ignoring unreadable match state {path}: {e}")
+            return None
+        if (state.get('version') != MATCH_STATE_VERSION
+                or state.get('odoo_file') != os.path.abspath(odoo_file)):
+            return None
+        return {
+            'matching_mode': state['matching_mode'],
+            'odoo_fingerprints': dict(state['odoo_fingerprints']),
+            'manual_fingerprints': {sheet_name: dict(rows) for sheet_name, rows in state['manual_fingerprints'].items()},
+            'sheet_matches': {sheet_name: [tuple(match) for match in matches]
+                              for sheet_name, matches in state['sheet_matches'].items()},
+            'highlight_styles': {kind: dict(origins) for kind, origins in state['highlight_styles'].items()},
+        }
+    
+    def has_sidecar_match_ids(self, odoo_file, manual_file):
+        """True if an earlier run left Match IDs in the files: its match state or a 'Match ID'
+        header in the Odoo header rows or row 5 of a Manual sheet"""
+        if os.path.exists(manual_file + MATCH_STATE_SUFFIX):
+            return True
+        for file_path, sheet_names, min_row, max_row in ((odoo_file, None, 1, 9), (manual_file, MANUAL_SHEETS, 5, 5)):
+            wb = openpyxl.load_workbook(file_path, read_only=True)
+            try:
+                if sheet_names is None:
+                    sheets = [wb.active]
+                else:
+                    sheets = [wb[sheet_name] for sheet_name in sheet_names if sheet_name in wb.sheetnames]
+                for ws in sheets:
+                    for row_vals in ws.iter_rows(min_row=min_row, max_row=max_row, values_only=True):
+                        if any(str(value).strip() == 'Match ID' for value in row_vals if value is not None):
+                            return True
+            finally:
+                wb.close()
+        return False
+    
+    def update_match_state(self, odoo_file, manual_file, output_mode, odoo_data, manual_sheets_data, sheet_matches,
+                           matching_mode, highlight_styles):
+        """Store the fingerprints, matches and highlighted cell formats just written into the
+        files (highlight_styles as returned by write_pair), for the next run
+        Only sidecar runs keep the row numbers and Match IDs the state refers to; after an
+        insert run the state of an earlier run is removed instead.
+        """
+        path = manual_file + MATCH_STATE_SUFFIX
+        try:
+            if output_mode != 'sidecar':
+                if os.path.exists(path):
+                    os.remove(path)
+                return
+            state = {
+                'version': MATCH_STATE_VERSION,
+                'odoo_file': os.path.abspath(odoo_file),
+                'manual_file': os.path.abspath(manual_file),
+                'matching_mode': matching_mode,
+                'generated': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'odoo_fingerprints': [[row.row_num, row.fingerprint()] for row in odoo_data],
+                'manual_fingerprints': {sheet_name: [[row.row_num, row.fingerprint()] for row in manual_sheets_data[sheet_name]]
+                                        for sheet_name in MANUAL_SHEETS},
+                'sheet_matches': {sheet_name: [[match['match_id'], match['odoo_row_num'], match['manual_row_num']]
+                                               for match in sheet_matches[sheet_name]]
+                                  for sheet_name in MANUAL_SHEETS},
+                'highlight_styles': {kind: sorted(origins.items()) for kind, origins in highlight_styles.items()},
+            }
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, separators=(',', ':'))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            self.log_status(f"Warning: Could not update the match state {path}: {e}")
+    
+    def write_pair(self, odoo_file, manual_file, sheet_matches, output_mode):
+        """Writing stage: Match IDs and highlights into both files
+        
+        Returns:
+            Sidecar mode: dict with the 'odoo' and 'manual' highlighted -> original cell formats
+            of the files as written, for update_match_state (None in insert mode)
+        """
+        style_origins = None
+        if output_mode == 'sidecar':
+            # Needed to give rows that are no longer matched their own format back
+            state = self.load_match_state(odoo_file, manual_file)
+            style_origins = state['highlight_styles'] if state else None
+        self.log_status("\nProcessing files...")
+        with self.stage("Writing files"):
+            highlight_styles = self.process_files(odoo_file, manual_file, sheet_matches['RM'],
+                                                  sheet_matches['Consumable'], sheet_matches['Spare parts'],
+                                                  sheet_matches['Re-usable'], output_mode=output_mode,
+                                                  style_origins=style_origins)
+        self.files_written = True
+        return highlight_styles
+    
+    def write_report(self, odoo_data, manual_sheets_data, sheet_matches, report_dir, matching_mode):
+        """Reporting stage: write the analysis report into report_dir
+        
+        Returns:
+            Tuple of (report path, dict of the report's summary counts)
+        """
+        # Generate analysis report (by default in the same folder as loaded files)
+        self.log_status("\nGenerating analysis report...")
+        all_manual_data = [row for sheet_name in MANUAL_SHEETS for row in manual_sheets_data[sheet_name]]
+        all_matches = [match for sheet_name in MANUAL_SHEETS for match in sheet_matches[sheet_name]]
+        with self.stage("Writing analysis report"):
+            differences = self.generate_analysis_report(odoo_data, all_manual_data, all_matches, sheet_matches['RM'],
+                                                         sheet_matches['Consumable'], sheet_matches['Spare parts'],
+                                                         sheet_matches['Re-usable'], report_dir, matching_mode)
+        return differences.pop('report_path'), differences
+    
+    def log_match_summary(self, sheet_matches):
+        """Log the match counts per sheet and the first few matches"""
+        all_matches = [match for sheet_name in MANUAL_SHEETS for match in sheet_matches[sheet_name]]
+        total_matches = len(all_matches)
+        self.log_status(f"\nTotal matches found: {total_matches}")
+        for sheet_name in MANUAL_SHEETS:
+            self.log_status(f"  - {sheet_name} matches: {len(sheet_matches[sheet_name])}")
+        self.log_status("\nMatch Summary (first 10):")
+        for match in all_matches[:10]:
+            name_preview = match['name'][:40] + "..." if len(match['name']) > 40 else match['name']
+            self.log_status(f"  {match['match_id']}: Code='{match['product_code']}', Name='{name_preview}'")
+        if total_matches > 10:
+            self.log_status(f"  ... and {total_matches - 10} more matches")
+    
+    def run_batch(self, pairs, out_dir, matching_mode='simple', output_mode='insert', use_cache=True,
+                  max_workers=None):
+        """Validate many Odoo/Manual pairs in a process pool and write a combined summary
+        
+        Each pair is copied into its own folder under out_dir and validated there by
+        validate_pair_worker. Results are collected as they finish, so a slow pair only
+        occupies its own worker.
+        
+        Args:
+            pairs: List of (name, odoo_file, manual_file), see find_file_pairs/read_pair_manifest
+            out_dir: Folder for the per-pair folders and the summary CSV
+            matching_mode, output_mode, use_cache: As for run_validation
+            max_workers: Number of worker processes (default: one per CPU)
+        
+        Returns:
+            Tuple of (summary CSV path, list of summary rows in pair order)
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        if max_workers is None:
+            max_workers = max(1, min(len(pairs), os.cpu_count() or 1))
+        self.log_status(f"Validating {len(pairs)} file pairs with {max_workers} worker processes...")
+        
+        results = {}
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(validate_pair_worker, name, odoo_file, manual_file, os.path.join(out_dir, name),
+                                   matching_mode, output_mode, use_cache): name
+                       for name, odoo_file, manual_file in pairs}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    summary = future.result()
+                except Exception as e:  # The worker process itself failed (e.g. killed)
+                    summary = {'pair': name, 'status': 'error', 'error': str(e)}
+                results[name] = summary
+                if summary['status'] == 'error':
+                    self.log_status(f"  {name}: ERROR - {summary['error']}")
+                else:
+                    self.log_status(f"  {name}: {summary['total_matches']} matches, "
+                                    f"{summary.get('name_matches_but_different', 0)} with differences "
+                                    f"[{summary['seconds']:.1f}s]")
+        
+        summary_rows = [results[name] for name, _, _ in pairs]
+        summary_path = os.path.join(out_dir, BATCH_SUMMARY_FILENAME)
+        with open(summary_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=BATCH_SUMMARY_FIELDS, restval='')
+            writer.writeheader()
+            writer.writerows(summary_rows)
+        self.log_status(f"Batch summary saved to: {summary_path}")
+        return summary_path, summary_rows
+    
+    def is_data_row_odoo(self, row_vals):
+        """Check if a row is a data row in Odoo file"""
+        if not row_vals or len(row_vals) == 0:
+            return False
+        sl_val = str(row_vals[0]).strip() if row_vals[0] else ''
+        return bool(re.match(r'^\d+$', sl_val))
+    
+    def is_data_row_manual(self, row_vals):
+        """Check if a row is a data row in Manual file"""
+        if not row_vals or len(row_vals) < 4:
+            return False
+        sl_val = str(row_vals[0]).strip() if row_vals[0] else ''
+        if not re.match(r'^\d+$', sl_val):
+            return False
+        product_code = str(row_vals[1]).strip() if len(row_vals) > 1 and row_vals[1] else ''
+        items_name = str(row_vals[3]).strip() if len(row_vals) > 3 and row_vals[3] else ''
+        return bool(product_code or items_name)
+    
+    def normalize_text(self, text):
+        """Normalize text for comparison"""
+        if text is None:
+            return ''
+        return str(text).strip()
+    
+    def normalize_product_code(self, text):
+        """Normalize product code - remove all spaces and make case-insensitive for comparison"""
+        if text is None:
+            return ''
+        # Remove all spaces (leading, trailing, and internal) and convert to uppercase
+        return str(text).replace(' ', '').upper()
+    
+    def normalize_unit(self, text):
+        """Normalize unit - case-insensitive comparison with unit aliases"""
+        if text is None:
+            return ''
+        
+        # Normalize to uppercase and strip whitespace
+        unit = str(text).strip().upper()
+        
+        # Map "PCS", "Pieces", and "Piece" variations to "PCS"
+        if unit in ('PCS', 'PIECES', 'PIECE'):
+            return 'PCS'
+        
+        # Map "Foot(ft)" and "Feet" variations to "FEET"
+        # Handle "FOOT(FT)", "FOOT (FT)", "FEET", etc.
+        if unit in ('FOOT(FT)', 'FOOT (FT)', 'FOOT', 'FEET'):
+            return 'FEET'
+        
+        # Map "Liter(s)" and "Liter" variations to "LITER"
+        # Handle "LITER(S)", "LITER (S)", "LITER", "LITERS", etc.
+        if unit in ('LITER(S)', 'LITER (S)', 'LITER', 'LITERS', 'LITRE(S)', 'LITRE (S)', 'LITRE', 'LITRES'):
+            return 'LITER'
+        
+        # Map "gal(s)" and "Gallon" variations to "GALLON"
+        # Handle "GAL(S)", "GAL (S)", "GAL", "GALLON", "GALLONS", etc.
+        if unit in ('GAL(S)', 'GAL (S)', 'GAL', 'GALLON', 'GALLONS'):
+            return 'GALLON'
+        
+        # Map "Square Foot" and "SFT" variations to "SFT"
+        # Handle "SQUARE FOOT", "SQUARE FEET", "SFT", "SQ FT", "SQFT", etc.
+        if unit in ('SQUARE FOOT', 'SQUARE FEET', 'SQUARE FOOT(FT)', 'SQUARE FOOT (FT)', 'SFT', 'SQ FT', 'SQFT', 'SQ.FT', 'SQ. FT'):
+            return 'SFT'
+        
+        # Map "lbs" and "Pound" variations to "POUND"
+        # Handle "LBS", "LB", "POUND", "POUNDS", etc.
+        if unit in ('LBS', 'LB', 'LBS.', 'LB.', 'POUND', 'POUNDS'):
+            return 'POUND'
+        
+        # Map "Meter" variations to "METER"
+        # Handle "METER", "METERS", "METRE", "METRES", "MTRS", "MTR", "MITER", etc.
+        if unit in ('METER', 'METERS', 'METRE', 'METRES', 'MTRS', 'MTR', 'MTR.', 'MITER'):
+            return 'METER'
+        
+        # Map "Ream" and "Rim" variations to "REAM"
+        # Handle "REAM", "REAMS", "RIM", "RIMS", etc.
+        if unit in ('REAM', 'REAMS', 'RIM', 'RIMS'):
+            return 'REAM'
+        
+        return unit
+    
+    def show_normalized_units(self, odoo_data, manual_data):
+        """Collect and display all unique units with their normalized forms"""
+        units_map = {}  # normalized_unit -> set of original units
+        
+        # Collect units from Odoo data
+        for row in odoo_data:
+            original_unit = str(row.get('unit', '') or '').strip()
+            if original_unit:
+                
+                normalized = self.normalize_unit(original_unit)
+                if normalized not in units_map:
+                    units_map[normalized] = set()
+                units_map[normalized].add(original_unit)
+        
+        # Collect units from Manual data
+        for row in manual_data:
+            original_unit = str(row.get('unit', '') or '').strip()
+            if original_unit:
+                normalized = self.normalize_unit(original_unit)
+                if normalized not in units_map:
+                    units_map[normalized] = set()
+                units_map[normalized].add(original_unit)
+        
+        # Display results
+        if units_map:
+            self.log_status(f"\nFound {len(units_map)} unique normalized units:")
+            self.log_status("-" * 60)
+            # Sort by normalized unit for consistent display
+            for normalized_unit in sorted(units_map.keys()):
+                original_units = sorted(units_map[normalized_unit])
+                if len(original_units) == 1 and original_units[0].upper() == normalized_unit:
+                    # No transformation needed
+                    self.log_status(f"  '{normalized_unit}'")
+                else:
+                    # Show mapping
+                    originals_str = "', '".join(original_units)
+                    self.log_status(f"  '{normalized_unit}' ← ['{originals_str}']")
+            self.log_status("-" * 60)
+        else:
+            self.log_status("No units found in data.")
+    
+    def read_odoo_data(self, file_path):
+        """Read all data rows from Odoo file
+        Structure:
+        - Row 1: Date range in A1
+        - Row 2: Header row (SL No, Product Code, Product Name, etc.)
+        - Row 3+: Continuous data rows (no metadata, no repeated headers)
+        """
+        # Read-only mode streams the sheet XML row by row instead of building every cell object
+        wb = openpyxl.load_workbook(file_path, read_only=True)
+        ws = wb.active
+        
+        # Header row is always row 2 for Detailed Stock Report
+        header_row = 2
+        
+        rows = ws.iter_rows(min_row=header_row, max_col=ODOO_COLUMNS['closing_value'] + 1, values_only=True)
+        header_vals = next(rows, ())
+        
+        # Check if Match ID column exists (in case file was already processed)
+        has_match_id = str((header_vals[0] if header_vals else None) or '').strip() == 'Match ID'
+        
+        # Read all data rows from after header to end of file
+        data_rows = self.extract_data_rows(rows, header_row + 1, ODOO_COLUMNS, OdooRecord, has_match_id)
+        
+        wb.close()
+        return data_rows
+    
+    def read_manual_data(self, file_path, sheet_names=MANUAL_SHEETS):
+        """Read all data rows from the given Manual sheets, opening the workbook only once
+        Uses data_only=True to get calculated values from formulas for comparison
+        
+        Returns:
+            Dict of sheet name -> list of data rows (empty list if the sheet doesn't exist)
+        """
+        # Read-only mode streams each sheet; data_only=True returns cached formula results
+        wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        
+        sheets_data = {}
+        for sheet_name in sheet_names:
+            if sheet_name not in wb.sheetnames:
+                sheets_data[sheet_name] = []  # Sheet doesn't exist
+                continue
+            with self.stage(f"Read {sheet_name} sheet", advance=False):
+                sheets_data[sheet_name] = self.read_manual_sheet_rows(wb[sheet_name])
+        
+        wb.close()
+        return sheets_data
+    
+    def read_manual_sheet_rows(self, ws):
+        """Read all data rows from one Manual sheet (header in row 5, data from row 6)"""
+        header_row = 5
+        rows = ws.iter_rows(min_row=header_row, max_col=MANUAL_COLUMNS['closing_value'] + 1, values_only=True)
+        header_vals = next(rows, ())
+        
+        # Check if sheet has Match ID column (already processed)
+        has_match_id = str((header_vals[0] if header_vals else None) or '').strip() == 'Match ID'
+        
+        return self.extract_data_rows(rows, header_row + 1, MANUAL_COLUMNS, ManualRecord, has_match_id)
+    
+    def extract_data_rows(self, rows, first_row_num, columns, record_class, has_match_id):
+        """Turn streamed row value tuples into data records
+        
+        Args:
+            rows: Iterator of row value tuples, starting at first_row_num
+            first_row_num: Sheet row number of the first tuple
+            columns: Column layout (ODOO_COLUMNS or MANUAL_COLUMNS)
+            record_class: OdooRecord or ManualRecord
+            has_match_id: True if a Match ID column was inserted before the layout
+        
+        Returns:
+            List of records (rows with a numeric SL and a code or name)
+        """
+        name_field = record_class.FIELDS[2]
+        # Adjust column indices if Match ID column exists (0-based positions in the row tuple)
+        offset = 0 if has_match_id else -1
+        sl_idx = columns['sl'] + offset
+        code_idx = columns['product_code'] + offset
+        name_idx = columns[name_field] + offset
+        unit_idx = columns['unit'] + offset
+        numeric_idx = [columns[field] + offset for field in NUMERIC_FIELDS]
+        row_len = max(numeric_idx) + 1
+        
+        data_rows = []
+        row_num = first_row_num - 1  # Stays there for a sheet without data
+        for row_num, row_vals in enumerate(rows, start=first_row_num):
+            if row_num % CANCEL_CHECK_ROWS == 0:
+                self.check_cancelled()  # Also stops a background read of a file that was replaced
+            if len(row_vals) < row_len:
+                row_vals = tuple(row_vals) + (None,) * (row_len - len(row_vals))
+            sl_val = row_vals[sl_idx]
+            # Check if it's a data row (has numeric SL)
+            if sl_val is None:
+                continue
+            sl_str = str(sl_val).strip()
+            if not (sl_str.isdigit() or (isinstance(sl_val, (int, float)))):
+                continue
+            
+            # Read values using correct column indices
+            product_code = self.normalize_text(row_vals[code_idx])
+            name = self.normalize_text(row_vals[name_idx])
+            
+            if product_code or name:
+                data_rows.append(record_class(row_num, product_code, name, self.normalize_text(row_vals[unit_idx]),
+                                              *[row_vals[idx] for idx in numeric_idx]))
+        
+        self.count('sheet_rows_scanned', row_num - first_row_num + 1)
+        return data_rows
+    
+    def read_files_parallel(self, odoo_file, manual_file, sheet_names=MANUAL_SHEETS):
+        """Read the Odoo file and each Manual sheet concurrently in a process pool
+        Each worker parses its own sheet and sends back compact row tuples, which are
+        turned back into the usual row dicts here.
+        
+        Args:
+            odoo_file: Path of the Odoo file, or None to skip it
+            manual_file: Path of the Manual file
+            sheet_names: Manual sheets to read
+        
+        Returns:
+            Tuple of (odoo_data or None, dict of sheet name -> manual rows)
+        """
+        max_workers = max(1, min(len(sheet_names) + 1, os.cpu_count() or 1))
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            odoo_future = pool.submit(read_odoo_file_worker, odoo_file) if odoo_file else None
+            sheet_futures = {sheet_name: pool.submit(read_manual_sheet_worker, manual_file, sheet_name)
+                             for sheet_name in sheet_names}
+            
+            odoo_data = tuples_to_rows(odoo_future.result(), OdooRecord) if odoo_future else None
+            manual_sheets_data = {}
+            for sheet_name, future in sheet_futures.items():
+                manual_sheets_data[sheet_name] = tuples_to_rows(future.result(), ManualRecord)
+        
+        return odoo_data, manual_sheets_data
+    
+    def load_data(self, odoo_file, manual_file, parallel=False, use_cache=True):
+        """Load Odoo rows and all Manual sheet rows, reusing earlier parses of unchanged files
+        Rows read earlier in this session (session_rows, including files still being read in
+        the background) are used as they are; otherwise the on-disk cache is tried. Only the
+        file/sheet combinations found in neither are actually parsed.
+        
+        Returns:
+            Tuple of (odoo_data, dict of sheet name -> manual rows)
+        """
+        cache = ParsedRowCache() if use_cache else None
+        odoo_data, odoo_signature = self.session_lookup('odoo', odoo_file)
+        manual_sheets_data, manual_signature = self.session_lookup('manual', manual_file)
+        
+        if parallel and (odoo_data is None or manual_sheets_data is None):
+            odoo_data, manual_sheets_data = self.load_files_parallel(odoo_file, manual_file, cache,
+                                                                     odoo_data, manual_sheets_data)
+        else:
+            if odoo_data is None:
+                odoo_data = self.load_odoo_rows(odoo_file, cache)
+            if manual_sheets_data is None:
+                manual_sheets_data = self.load_manual_rows(manual_file, cache)
+        
+        if self.session_rows is not None:
+            self.session_rows.put('odoo', odoo_signature, odoo_data)
+            self.session_rows.put('manual', manual_signature, manual_sheets_data)
+        
+        self.count('odoo_rows', len(odoo_data))
+        self.count('manual_rows', sum(len(rows) for rows in manual_sheets_data.values()))
+        return odoo_data, manual_sheets_data
+    
+    def session_lookup(self, kind, file_path):
+        """Rows of file_path kept in session_rows, waiting for a background read of it if one is running
+        
+        Returns:
+            Tuple of (rows or None, file signature). The rows are the Odoo rows for 'odoo' and a
+            dict of sheet name -> rows for 'manual'. (None, None) without a session_rows store.
+        """
+        if self.session_rows is None:
+            return None, None
+        # Taken before reading, so a save during the read isn't missed
+        signature = file_signature(file_path)
+        label = 'Odoo' if kind == 'odoo' else 'Manual'
+        rows = self.session_rows.get(kind, signature)
+        if rows is None:
+            future = self.session_rows.pending_read(kind, signature)
+            if future is None:
+                return None, signature
+            if not future.done():
+                self.log_status(f"Waiting for the {label} file being read in the background...")
+                while not wait([future], timeout=0.2).done:
+                    self.check_cancelled()
+            if future.exception() is not None:
+                self.log_status(f"Background read of the {label} file failed ({future.exception()}), "
+                                "reading it again...")
+                return None, signature
+            rows = future.result()
+        self.count('session_hits')
+        self.log_status(f"Using {label} rows read earlier in this session (file unchanged)")
+        return rows, signature
+    
+    def preload_file(self, kind, file_path, use_cache=True):
+        """Start reading one file into session_rows in a background thread
+        A later load_data of the same (unchanged) file then uses these rows, waiting for the
+        read to finish if needed. Reads of a file that was replaced by another selection are
+        cancelled within a few hundred rows, and their rows are never stored.
+        
+        Args:
+            kind: 'odoo' or 'manual'
+            file_path: The file to read
+            use_cache: Try the on-disk cache first (and store what was parsed in it)
+        
+        Returns:
+            Tuple of (future of the rows, list collecting the read's log lines - complete once
+            the future is done), or (None, None) if the file is already read or being read
+        """
+        signature = file_signature(file_path)
+        if self.session_rows.get(kind, signature) is not None:
+            return None, None
+        future = self.session_rows.pending_read(kind, signature)
+        if future is not None and not (future.done() and future.exception() is not None):
+            return None, None  # Still being read (a failed read is tried again)
+        reader = LogCollectingEngine()
+        cache = ParsedRowCache() if use_cache else None
+        if kind == 'odoo':
+            load = lambda: reader.load_odoo_rows(file_path, cache)
+        else:
+            load = lambda: reader.load_manual_rows(file_path, cache)
+        return self.session_rows.preload(kind, signature, load, reader.cancel_event), reader.log_lines
+    
+    def load_odoo_rows(self, odoo_file, cache=None):
+        """Odoo rows from the on-disk cache, or parsed (and then cached)"""
+        odoo_key = None
+        if cache:
+            odoo_key = cache.make_key(cache.file_hash(odoo_file), 'odoo', ODOO_COLUMNS, ODOO_FIELDS)
+            odoo_data = self.cached_rows(cache, odoo_key, OdooRecord, "Odoo")
+            if odoo_data is not None:
+                return odoo_data
+        
+        self.log_status("Reading Odoo file...")
+        with self.stage("Read Odoo file", advance=False):
+            odoo_data = self.read_odoo_data(odoo_file)
+        if cache:
+            cache.put(odoo_key, rows_to_tuples(odoo_data))
+        return odoo_data
+    
+    def load_manual_rows(self, manual_file, cache=None):
+        """All Manual sheets (sheet name -> rows), from the on-disk cache where possible"""
+        manual_sheets_data, manual_keys = self.cached_manual_sheets(manual_file, cache)
+        missing_sheets = [sheet_name for sheet_name in MANUAL_SHEETS if sheet_name not in manual_sheets_data]
+        if missing_sheets:
+            self.log_status(f"Reading Manual file ({', '.join(missing_sheets)} sheets)...")
+            manual_sheets_data.update(self.read_manual_data(manual_file, missing_sheets))
+            if cache:
+                for sheet_name in missing_sheets:
+                    cache.put(manual_keys[sheet_name], rows_to_tuples(manual_sheets_data[sheet_name]))
+        return manual_sheets_data
+    
+    def load_files_parallel(self, odoo_file, manual_file, cache, odoo_data=None, manual_sheets_data=None):
+        """Like load_odoo_rows + load_manual_rows, but parsing in a process pool
+        odoo_data / manual_sheets_data that are already known (not None) are kept as they are.
+        
+        Returns:
+            Tuple of (odoo_data, dict of sheet name -> manual rows)
+        """
+        odoo_key = None
+        if cache and odoo_data is None:
+            odoo_key = cache.make_key(cache.file_hash(odoo_file), 'odoo', ODOO_COLUMNS, ODOO_FIELDS)
+            odoo_data = self.cached_rows(cache, odoo_key, OdooRecord, "Odoo")
+        if manual_sheets_data is None:
+            manual_sheets_data, manual_keys = self.cached_manual_sheets(manual_file, cache)
+            missing_sheets = [sheet_name for sheet_name in MANUAL_SHEETS if sheet_name not in manual_sheets_data]
+        else:
+            missing_sheets = []
+        odoo_parsed = odoo_data is None
+        if not (odoo_parsed or missing_sheets):
+            return odoo_data, manual_sheets_data
+        
+        self.log_status("Reading Odoo file and Manual sheets in parallel...")
+        parsed_odoo, parsed_sheets = self.read_files_parallel(
+            odoo_file if odoo_parsed else None, manual_file, missing_sheets)
+        if odoo_parsed:
+            odoo_data = parsed_odoo
+        manual_sheets_data.update(parsed_sheets)
+        
+        if cache:
+            if odoo_parsed:
+                cache.put(odoo_key, rows_to_tuples(odoo_data))
+            for sheet_name in missing_sheets:
+                cache.put(manual_keys[sheet_name], rows_to_tuples(manual_sheets_data[sheet_name]))
+        return odoo_data, manual_sheets_data
+    
+    def cached_manual_sheets(self, manual_file, cache):
+        """Manual sheets found in the on-disk cache
+        
+        Returns:
+            Tuple of (dict of sheet name -> rows of the cached sheets, dict of sheet name -> cache key);
+            ({}, None) without a cache
+        """
+        if not cache:
+            return {}, None
+        manual_hash = cache.file_hash(manual_file)
+        manual_keys = {sheet_name: cache.make_key(manual_hash, sheet_name, MANUAL_COLUMNS, MANUAL_FIELDS)
+                       for sheet_name in MANUAL_SHEETS}
+        manual_sheets_data = {}
+        for sheet_name, key in manual_keys.items():
+            rows = self.cached_rows(cache, key, ManualRecord, f"Manual {sheet_name}")
+            if rows is not None:
+                manual_sheets_data[sheet_name] = rows
+        return manual_sheets_data, manual_keys
+    
+    def cached_rows(self, cache, key, record_class, label):
+        """Records stored in the on-disk cache under key, or None"""
+        cached = cache.get(key)
+        if cached is None:
+            return None
+        self.count('cache_hits')
+        self.log_status(f"Loaded {label} rows from cache (file unchanged)")
+        return tuples_to_rows(cached, record_class)
+    
+    def read_manual_rm_data(self, file_path):
+        """Read all data rows from Manual RM sheet"""
+        return self.read_manual_data(file_path, ['RM'])['RM']
+    
+    def read_manual_consumable_data(self, file_path):
+        """Read all data rows from Manual Consumable sheet"""
+        return self.read_manual_data(file_path, ['Consumable'])['Consumable']
+    
+    def read_manual_spare_parts_data(self, file_path):
+        """Read all data rows from Manual Spare parts sheet"""
+        return self.read_manual_data(file_path, ['Spare parts'])['Spare parts']
+    
+    def read_manual_reusable_data(self, file_path):
+        """Read all data rows from Manual Re-usable sheet"""
+        return self.read_manual_data(file_path, ['Re-usable'])['Re-usable']
+    
+    def normalize_numeric(self, text):
+        """Normalize numeric values for exact comparison - handles Accounting format (commas, parentheses) and Number format"""
+        return to_minor_units(text) / 100
+    
+    def compare_numeric(self, val1, val2):
+        """Compare two numeric values exactly (no tolerance)"""
+        return to_minor_units(val1) == to_minor_units(val2)
+    
+    def find_matches_simple(self, odoo_data, manual_data, prefix='RM'):
+        """Find matching rows with simple logic: match if Product Code OR Product Name matches
+        This is a simpler matching mode that only considers Product Code or Product Name.
+        Other fields (Unit, quantities, values) are NOT considered for matching.
+        
+        Args:
+            odoo_data: List of Odoo data rows
+            manual_data: List of Manual data rows
+            prefix: Prefix for match IDs ('RM' or 'CON')
+        
+        Returns:
+            List of matched records with match_id, odoo_row_num, manual_row_num, product_code, name
+        """
+        matches = []
+        match_id_counter = 1
+
+        # Build lookup indexes once instead of rescanning manual_data for every Odoo row.
+        # Each index keeps the position of the FIRST manual row with that key, so the
+        # earliest manual row still wins exactly like the old nested loop did.
+        code_index = self.build_first_row_index(
+            manual_data, lambda row: self.normalize_product_code(row.product_code))
+        name_index = self.build_first_row_index(manual_data, lambda row: row.items_name)
+
+        for i, odoo_row in enumerate(odoo_data):
+            if i % CANCEL_CHECK_ROWS == 0:
+                self.check_cancelled()
+            
+            # Check Product Code match
+            odoo_code_normalized = self.normalize_product_code(odoo_row.product_code)
+            code_pos = code_index.get(odoo_code_normalized) if odoo_code_normalized else None
+
+            # Check Product Name match
+            name_pos = name_index.get(odoo_row.product_name) if odoo_row.product_name else None
+
+            # Match if EITHER Product Code OR Product Name matches - take whichever manual row comes first
+            if code_pos is None and name_pos is None:
+                continue
+            if code_pos is None:
+                manual_pos = name_pos
+            elif name_pos is None:
+                manual_pos = code_pos
+            else:
+                manual_pos = min(code_pos, name_pos)
+            manual_row = manual_data[manual_pos]
+
+            match_id = f'{prefix}{str(match_id_counter).zfill(4)}'
+            matches.append({
+                'match_id': match_id,
+                'odoo_row_num': odoo_row.row_num,
+                'manual_row_num': manual_row.row_num,
+                'product_code': odoo_row.product_code,
+                'name': odoo_row.product_name
+            })
+            match_id_counter += 1
+
+        self.count('odoo_rows_compared', len(odoo_data))
+        self.count('manual_rows_compared', len(manual_data))
+        self.count('matches', len(matches))
+        return matches
+
+    def build_first_row_index(self, rows, key_func):
+        """Map each non-empty key to the position of the first row that produces it
+
+        Args:
+            rows: List of data rows
+            key_func: Function returning the lookup key for a row
+
+        Returns:
+            Dict of key -> index into rows (empty keys are skipped)
+        """
+        index = {}
+        for pos, row in enumerate(rows):
+            key = key_func(row)
+            if key and key not in index:
+                index[key] = pos
+        return index
+    
+    def find_matches(self, odoo_data, manual_data, prefix='RM'):
+        """Find matching rows with specified prefix (RM or CON)
+        IMPORTANT: ALL criteria must match for a record to be considered a match:
+        - Product Code (case-insensitive, spaces ignored)
+        - Product Name (exact match)
+        - Unit (case-insensitive, with alias mappings)
+        - All quantity/value fields (Opening, Receive, Issue, Closing - Qty & Value)
+        
+        Records will NOT match if only Product Code and/or Item Name match.
+        All fields must match exactly (after normalization)."""
+        matches = []
+        match_id_counter = 1
+        
+        # Debug: Log first few rows from each file
+        if odoo_data:
+            self.log_status(f"\nSample Odoo row: Code='{odoo_data[0].get('product_code', '')}', Name='{odoo_data[0].get('product_name', '')[:30]}...', Unit='{odoo_data[0].get('unit', '')}', Opening Qty='{odoo_data[0].get('opening_qty', '')}'")
+        if manual_data:
+            self.log_status(f"Sample Manual row: Code='{manual_data[0].get('product_code', '')}', Name='{manual_data[0].get('items_name', '')[:30]}...', Unit='{manual_data[0].get('unit', '')}', Opening Qty='{manual_data[0].get('opening_qty', '')}'")
+        
+        # Index manual rows by (code, name, unit) once; only rows in the same bucket can ever
+        # pass the first three checks, so each Odoo row compares against a handful of candidates.
+        # The bucket lists keep manual_data order so the first matching manual row still wins.
+        candidate_index = {}
+        for manual_row in manual_data:
+            key = self.strict_match_key(manual_row.product_code, manual_row.items_name, manual_row.unit)
+            if key is None:
+                continue
+            candidate_index.setdefault(key, []).append(manual_row)
+
+        for i, odoo_row in enumerate(odoo_data):
+            if i % CANCEL_CHECK_ROWS == 0:
+                self.check_cancelled()
+            
+            key = self.strict_match_key(odoo_row.product_code, odoo_row.product_name, odoo_row.unit)
+            candidates = candidate_index.get(key) if key is not None else None
+            if not candidates:
+                continue  # Product code, name or unit doesn't match any manual row
+
+            # Code, name and unit already match - compare the eight quantity/value fields of the
+            # whole bucket at once; a zero mask means every field is equal
+            masks = self.numeric_mismatch_masks(odoo_row, candidates)
+            for manual_row, mask in zip(candidates, masks):
+                if not mask:
+                    # Use specified prefix (RM or CON)
+                    match_id = f'{prefix}{str(match_id_counter).zfill(4)}'
+                    matches.append({
+                        'match_id': match_id,
+                        'odoo_row_num': odoo_row.row_num,
+                        'manual_row_num': manual_row.row_num,
+                        'product_code': odoo_row.product_code,
+                        'name': odoo_row.product_name
+                    })
+                    match_id_counter += 1
+                    break
+
+                # Debug: Log why a potential match failed (only for first few attempts)
+                if match_id_counter <= 3:
+                    failed_fields = []
+                    if mask & 1:
+                        failed_fields.append(f"Opening Qty (Odoo: '{odoo_row.opening_qty}' vs Manual: '{manual_row.opening_qty}')")
+                    if mask & 2:
+                        failed_fields.append(f"Opening Value (Odoo: '{odoo_row.opening_value}' vs Manual: '{manual_row.opening_value}')")
+                    if failed_fields:
+                        self.log_status(f"Potential match failed on: {', '.join(failed_fields[:3])}")
+
+        self.count('odoo_rows_compared', len(odoo_data))
+        self.count('manual_rows_compared', len(manual_data))
+        self.count('matches', len(matches))
+        return matches
+
+    def strict_match_key(self, product_code, name, unit):
+        """Composite key used to bucket rows for strict matching
+        Returns None when code, name or unit is empty (such rows can never match strictly)"""
+        code_normalized = self.normalize_product_code(product_code)
+        unit_normalized = self.normalize_unit(unit)
+        if not (code_normalized and name and unit_normalized):
+            return None
+        return (code_normalized, name, unit_normalized)
+
+    def numeric_mismatch_masks(self, odoo_row, manual_rows):
+        """Compare the normalized quantity/value fields of one Odoo row against several Manual rows
+        
+        Returns:
+            List with one bitmask per Manual row - bit i is set when NUMERIC_FIELDS[i] differs
+        """
+        odoo_numeric = odoo_row.numeric
+        masks = []
+        for manual_row in manual_rows:
+            mask = 0
+            if manual_row.numeric != odoo_numeric:
+                for bit, (odoo_value, manual_value) in enumerate(zip(odoo_numeric, manual_row.numeric)):
+                    if odoo_value != manual_value:
+                        mask |= 1 << bit
+            masks.append(mask)
+        return masks
+    
+    def adjust_formulas_after_insert(self, ws, inserted_col=1):
+        """Adjust formulas after inserting a column - shift column references right by 1
+        openpyxl's insert_cols() moves cells but does not touch formulas, so references into ws
+        (from ws itself and from the other sheets of its workbook) are shifted here.
+        """
+        self.log_status("Adjusting formulas...")
+        formula_count = 0
+        shifter = FormulaColumnShifter(ws.title, inserted_col)
+        
+        for sheet in ws.parent.worksheets:
+            on_same_sheet = sheet is ws
+            # Iterate stored cells only - iter_rows() would create every empty cell of wide sheets
+            for cell in list(sheet._cells.values()):
+                if cell.data_type != 'f' or not cell.value:
+                    continue
+                try:
+                    if isinstance(cell.value, ArrayFormula):
+                        formula = cell.value.text
+                        if not on_same_sheet and ws.title not in formula:
+                            continue
+                        new_formula = shifter.shift_formula(formula, on_same_sheet)
+                        if on_same_sheet:
+                            cell.value.ref = shifter.shift_reference(cell.value.ref, True)
+                        cell.value.text = new_formula
+                    elif isinstance(cell.value, str):
+                        if not on_same_sheet and ws.title not in cell.value:
+                            continue
+                        cell.value = shifter.shift_formula(cell.value, on_same_sheet)
+                    else:
+                        continue
+                    formula_count += 1
+                except Exception as e:
+                    # If adjustment fails, log warning but keep original
+                    self.log_status(f"Warning: Could not adjust formula in {sheet.title}!{cell.coordinate}: {str(e)}")
+        
+        self.count('formulas_adjusted', formula_count)
+        self.count('formula_shapes', len(shifter.shape_cache))
+        self.log_status(f"Adjusted {formula_count} formulas ({len(shifter.shape_cache)} distinct shapes)")
+    
+    def clean_odoo_file(self, odoo_wb):
+        """Remove blank rows and images from Odoo workbook"""
+        odoo_ws = odoo_wb.active
+        
+        # Remove images from all sheets
+        total_images = 0
+        for sheet in odoo_wb.worksheets:
+            if hasattr(sheet, '_images'):
+                image_count = len(sheet._images)
+                sheet._images = []
+                total_images += image_count
+        if total_images > 0:
+            self.count('images_removed', total_images)
+            self.log_status(f"  Removed {total_images} image(s)")
+        
+        # Remove blank rows (rows with no data)
+        # One pass over the stored cells finds header rows (to preserve them) and rows with data
+        header_rows = set()
+        rows_with_data = set()
+        for (row_num, col), cell in odoo_ws._cells.items():
+            value = cell.value
+            if value is None or (isinstance(value, str) and not value.strip()):
+                continue
+            rows_with_data.add(row_num)
+            if col == 1 and str(value).strip() in ('SL\nNo', 'SL No', 'Match ID'):
+                header_rows.add(row_num)
+        
+        # Skip header rows and first 5 rows which might contain title/header info
+        rows_to_delete = [row_num for row_num in range(6, odoo_ws.max_row + 1)
+                          if row_num not in rows_with_data and row_num not in header_rows]
+        
+        # Delete blank rows
+        if rows_to_delete:
+            self.compact_rows(odoo_ws, rows_to_delete)
+            self.count('blank_rows_removed', len(rows_to_delete))
+            self.log_status(f"  Removed {len(rows_to_delete)} blank row(s)")
+    
+    def compact_rows(self, ws, rows_to_delete):
+        """Delete rows and move the rows below them up in a single pass over the sheet's cells
+        Same effect on cells as calling ws.delete_rows() for each row from the bottom up
+        (row heights, merged cells and formulas are not adjusted, as with delete_rows).
+        """
+        deleted = sorted(rows_to_delete)
+        deleted_set = set(deleted)
+        compacted = {}
+        for (row_num, col), cell in ws._cells.items():
+            if row_num in deleted_set:
+                continue
+            # Number of deleted rows above this one
+            shift = bisect.bisect_left(deleted, row_num)
+            if shift:
+                cell.row = row_num - shift
+            compacted[(cell.row, col)] = cell
+        ws._cells = compacted
+        ws._current_row = ws.max_row if compacted else 0
+    
+    def copy_cell_format(self, source_cell, target_cell):
+        """Copy cell formatting from source cell to target cell, including borders"""
+        if source_cell.parent.parent is target_cell.parent.parent:
+            # Same workbook - share the source's style ids (font, fill, border, alignment, number format, ...)
+            target_cell._style = copy(source_cell._style)
+            return
+        target_cell.font = copy(source_cell.font)
+        target_cell.alignment = copy(source_cell.alignment)
+        target_cell.border = copy(source_cell.border)
+        target_cell.fill = copy(source_cell.fill)
+        target_cell.number_format = source_cell.number_format
+    
+    def process_sheet(self, odoo_wb, manual_wb, sheet_name, matches, is_first_sheet=False):
+        """Process a single sheet (RM or Consumable)"""
+        odoo_ws = odoo_wb.active
+        
+        if sheet_name not in manual_wb.sheetnames:
+            return  # Sheet doesn't exist, skip
+        self.check_cancelled()
+        
+        manual_ws = manual_wb[sheet_name]
+        
+        # Insert Match ID column in Odoo file only for first sheet
+        if is_first_sheet:
+            self.log_status(f"Inserting Match ID column in Odoo file...")
+            
+            # Find header row dynamically
+            odoo_header_row = self.find_odoo_header_row(odoo_ws)
+            
+            # Preserve column widths for Odoo file
+            odoo_col_widths = {}
+            default_width = odoo_ws.column_dimensions.group_width if hasattr(odoo_ws.column_dimensions, 'group_width') else None
+            default_width = default_width if default_width else 8.43  # Excel default column width
+            
+            for col_idx in range(1, odoo_ws.max_column + 1):
+                col_letter = openpyxl.utils.get_column_letter(col_idx)
+                if col_letter in odoo_ws.column_dimensions and odoo_ws.column_dimensions[col_letter].width:
+                    odoo_col_widths[col_idx] = odoo_ws.column_dimensions[col_letter].width
+                else:
+                    odoo_col_widths[col_idx] = default_width
+            
+            self.count('cells_moved', len(odoo_ws._cells))
+            odoo_ws.insert_cols(1)
+            
+            # Restore ALL column widths (shifted by 1)
+            for col_idx, width in odoo_col_widths.items():
+                new_col_idx = col_idx + 1
+                new_col_letter = openpyxl.utils.get_column_letter(new_col_idx)
+                odoo_ws.column_dimensions[new_col_letter].width = width
+            
+            # Set width for new Match ID column
+            match_id_width = odoo_col_widths.get(1, 12.0)
+            odoo_ws.column_dimensions['A'].width = max(match_id_width, 12.0)
+            
+            # Copy font format from existing header cell to new Match ID header
+            if odoo_ws.cell(odoo_header_row, 2).value is not None:
+                self.copy_cell_format(odoo_ws.cell(odoo_header_row, 2), odoo_ws.cell(odoo_header_row, 1))
+            odoo_ws.cell(odoo_header_row, 1).value = 'Match ID'
+        
+        # Insert Match ID column in Manual sheet
+        self.log_status(f"Inserting Match ID column in {sheet_name} sheet...")
+        
+        # Preserve column widths for Manual file
+        # Read ALL column widths (including defaults for columns without explicit widths)
+        manual_col_widths = {}
+        default_width = manual_ws.column_dimensions.group_width if hasattr(manual_ws.column_dimensions, 'group_width') else None
+        default_width = default_width if default_width else 8.43  # Excel default column width
+        
+        for col_idx in range(1, manual_ws.max_column + 1):
+            col_letter = openpyxl.utils.get_column_letter(col_idx)
+            if col_letter in manual_ws.column_dimensions and manual_ws.column_dimensions[col_letter].width:
+                # Column has explicit width
+                manual_col_widths[col_idx] = manual_ws.column_dimensions[col_letter].width
+            else:
+                # Column uses default width
+                manual_col_widths[col_idx] = default_width
+        
+        # Insert column - openpyxl will automatically shift all columns, merged cells, formulas, etc.
+        self.count('cells_moved', len(manual_ws._cells))
+        manual_ws.insert_cols(1)
+        
+        # Restore ALL column widths (shifted by 1)
+        for col_idx, width in manual_col_widths.items():
+            new_col_idx = col_idx + 1
+            new_col_letter = openpyxl.utils.get_column_letter(new_col_idx)
+            manual_ws.column_dimensions[new_col_letter].width = width
+        
+        # Set width for new Match ID column
+        match_id_width = manual_col_widths.get(1, 12.0)
+        manual_ws.column_dimensions['A'].width = max(match_id_width, 12.0)
+        
+        # Copy font format from existing header cell to new Match ID header
+        if manual_ws.cell(5, 2).value is not None:
+            self.copy_cell_format(manual_ws.cell(5, 2), manual_ws.cell(5, 1))
+        manual_ws.cell(5, 1).value = 'Match ID'
+        
+        # openpyxl's insert_cols(1) shifts formulas but doesn't always adjust column references correctly
+        # We need to manually adjust formulas to ensure column references are updated
+        with self.stage(f"Adjust formulas ({sheet_name})", advance=False):
+            self.adjust_formulas_after_insert(manual_ws, inserted_col=1)
+        
+        # IMPORTANT: openpyxl's insert_cols() shifts cells (including the MergedCell placeholders and
+        # their borders) but leaves the merged range definitions where they were.
+        # Shift all range definitions right by 1 column in one batch - no unmerge/re-merge needed
+        self.log_status("Fixing merged cell ranges...")
+        merged_ranges = list(manual_ws.merged_cells.ranges)
+        for r in merged_ranges:
+            r.shift(col_shift=1)
+        # Ranges live in a set keyed by their coordinates, so rebuild it after shifting
+        manual_ws.merged_cells = MultiCellRange(merged_ranges)
+        
+        self.count('merged_ranges_shifted', len(merged_ranges))
+        self.log_status(f"Fixed {len(merged_ranges)} merged cell ranges")
+        
+        # IMPORTANT: Ensure column N (now column O, row 4) remains unmerged
+        # In input file, column N row 4 has "Rate(Tk)" and is NOT merged
+        # After insertion, it becomes column O row 4, and must remain unmerged
+        for r in list(manual_ws.merged_cells.ranges):
+            if r.min_col <= 15 <= r.max_col and r.min_row <= 4 <= r.max_row:
+                # Column O row 4 is part of a merged range - this is wrong!
+                # Unmerge it to preserve the original structure
+                self.log_status(f"Unmerging column O row 4 (original column N) from range {r}")
+                manual_ws.unmerge_cells(str(r))
+        
+        # Apply match IDs and highlight
+        self.log_status(f"Applying match IDs and highlighting rows for {sheet_name} sheet...")
+        odoo_styler = HighlightStyler(odoo_wb)
+        manual_styler = HighlightStyler(manual_wb)
+        odoo_highlight_cols = range(1, odoo_ws.max_column + 1)
+        for match in matches:
+            # Odoo file
+            odoo_row = match['odoo_row_num']
+            odoo_ws.cell(odoo_row, 1).value = match['match_id']
+            odoo_styler.highlight_row(odoo_ws, odoo_row, odoo_highlight_cols)
+            
+            # Manual file
+            manual_row = match['manual_row_num']
+            manual_ws.cell(manual_row, 1).value = match['match_id']
+            # Highlight columns 1-14 (Match ID + original columns A-M, excluding N)
+            manual_styler.highlight_row(manual_ws, manual_row, range(1, 15))
+        self.count('match_ids_written', 2 * len(matches))
+        self.count('cells_highlighted', len(matches) * (len(odoo_highlight_cols) + 14))
+    
+    def find_odoo_header_row(self, odoo_ws):
+        """Find the header row of the Odoo sheet (first of rows 1-9 starting with SL No / Match ID)"""
+        for row_num in range(1, min(10, odoo_ws.max_row + 1)):
+            first_cell = str(odoo_ws.cell(row_num, 1).value or '').strip()
+            if first_cell in ('Match ID', 'SL\nNo', 'SL No', 'SL'):
+                return row_num
+        return 1  # Default to row 1
+    
+    def find_last_used_column(self, ws):
+        """Return the right-most column that holds a value anywhere on the sheet"""
+        last_col = 0
+        for row_vals in ws.iter_rows(values_only=True):
+            for col in range(len(row_vals), last_col, -1):
+                if row_vals[col - 1] is not None:
+                    last_col = col
+                    break
+        return last_col
+    
+    def prepare_sidecar_column(self, ws, header_row, create=True):
+        """Find or create the appended Match ID column of a sheet
+        Re-uses an existing 'Match ID' header in header_row (clearing old IDs below it),
+        otherwise adds the header in the first column after the last used column.
+        
+        Args:
+            create: Add the column if the sheet has none (else return (None, set()))
+        
+        Returns:
+            Tuple of (column number of the Match ID column, set of rows whose old ID was cleared)
+        """
+        for cell in ws[header_row]:
+            if str(cell.value or '').strip() == 'Match ID':
+                # Already annotated - clear IDs from the previous run
+                cleared_rows = set()
+                for row_num in range(header_row + 1, ws.max_row + 1):
+                    if ws.cell(row_num, cell.column).value is not None:
+                        ws.cell(row_num, cell.column).value = None
+                        cleared_rows.add(row_num)
+                return cell.column, cleared_rows
+        if not create:
+            return None, set()
+        
+        col = self.find_last_used_column(ws) + 1
+        col_letter = openpyxl.utils.get_column_letter(col)
+        ws.column_dimensions[col_letter].width = 12.0
+        
+        # Copy font format from the last header cell to new Match ID header
+        for source_col in range(col - 1, 0, -1):
+            if ws.cell(header_row, source_col).value is not None:
+                self.copy_cell_format(ws.cell(header_row, source_col), ws.cell(header_row, col))
+                break
+        ws.cell(header_row, col).value = 'Match ID'
+        return col, set()
+    
+    def annotate_files_sidecar(self, odoo_wb, manual_wb, sheet_matches, style_origins=None, source_files=None):
+        """Write Match IDs into an appended column and highlight matched rows, without
+        inserting columns or touching formulas, merged cells or column widths
+        Rows that had an ID from an earlier run but are no longer matched lose their highlight.
+        
+        Args:
+            odoo_wb: Odoo workbook
+            manual_wb: Manual workbook
+            sheet_matches: Dict of Manual sheet name -> list of matches
+            style_origins: Dict with the 'odoo' and 'manual' highlighted -> original cell format
+                indices recorded by the previous run (see XlsxMatchIdWriter)
+            source_files: Dict with the 'odoo' and 'manual' paths the workbooks were loaded from,
+                to look up the cell formats of rows losing their highlight
+        
+        Returns:
+            Tuple of the Odoo and Manual HighlightStyler
+        """
+        style_origins = style_origins or {}
+        source_files = source_files or {}
+        odoo_ws = odoo_wb.active
+        odoo_header_row = self.find_odoo_header_row(odoo_ws)
+        odoo_col, odoo_cleared_rows = self.prepare_sidecar_column(odoo_ws, odoo_header_row)
+        self.log_status(f"Writing Match IDs to column {openpyxl.utils.get_column_letter(odoo_col)} of Odoo file")
+        
+        # Highlight original Manual columns A-M (as in insert mode) plus the Match ID cell
+        manual_highlight_cols = list(range(1, MANUAL_COLUMNS['closing_value'] + 1))
+        odoo_styler = HighlightStyler(odoo_wb, style_origins=style_origins.get('odoo'))
+        manual_styler = HighlightStyler(manual_wb, style_origins=style_origins.get('manual'))
+        
+        odoo_matched_rows = set()
+        for sheet_name, matches in sheet_matches.items():
+            if sheet_name not in manual_wb.sheetnames:
+                continue
+            manual_ws = manual_wb[sheet_name]
+            # A sheet without matches only needs its IDs of an earlier run removed
+            manual_col, manual_cleared_rows = self.prepare_sidecar_column(manual_ws, 5, create=bool(matches))
+            if manual_col is None:
+                continue
+            self.log_status(f"Writing Match IDs to column {openpyxl.utils.get_column_letter(manual_col)} of {sheet_name} sheet...")
+            
+            for match in matches:
+                # Odoo file
+                odoo_row = match['odoo_row_num']
+                odoo_ws.cell(odoo_row, odoo_col).value = match['match_id']
+                odoo_styler.highlight_row(odoo_ws, odoo_row, range(1, odoo_col + 1))
+                odoo_matched_rows.add(odoo_row)
+                
+                # Manual file
+                manual_row = match['manual_row_num']
+                manual_ws.cell(manual_row, manual_col).value = match['match_id']
+                manual_styler.highlight_row(manual_ws, manual_row, manual_highlight_cols + [manual_col])
+            unmatched_rows = manual_cleared_rows - {match['manual_row_num'] for match in matches}
+            cell_formats = self.read_cell_formats(source_files.get('manual'), sheet_name, unmatched_rows)
+            for manual_row in unmatched_rows:
+                manual_styler.unhighlight_row(manual_ws, manual_row, manual_highlight_cols + [manual_col],
+                                              cell_formats)
+            self.count('match_ids_written', 2 * len(matches))
+            self.count('cells_highlighted', len(matches) * (odoo_col + len(manual_highlight_cols) + 1))
+        unmatched_rows = odoo_cleared_rows - odoo_matched_rows
+        cell_formats = self.read_cell_formats(source_files.get('odoo'), None, unmatched_rows)
+        for odoo_row in unmatched_rows:
+            odoo_styler.unhighlight_row(odoo_ws, odoo_row, range(1, odoo_col + 1), cell_formats)
+        self.log_kept_highlights(odoo_styler.cells_kept_highlighted + manual_styler.cells_kept_highlighted)
+        return odoo_styler, manual_styler
+    
+    def read_cell_formats(self, file_path, sheet_name, row_nums):
+        """{(row, column): cell format index} of some rows of a file as saved, None if the
+        file isn't given or can't be read that way (sheet_name None: the active sheet)"""
+        if not file_path or not row_nums:
+            return None
+        try:
+            writer = XlsxMatchIdWriter(file_path)
+        except (XlsxPatchError, zipfile.BadZipFile):
+            return None
+        try:
+            return writer.row_styles(sheet_name, row_nums)
+        except (XlsxPatchError, KeyError):
+            return None
+        finally:
+            writer.close()
+    
+    def log_kept_highlights(self, cells):
+        """Warn about highlights of rows that are no longer matched but couldn't be removed"""
+        if cells:
+            self.log_status(f"Warning: {cells} cells of rows that are no longer matched keep their highlight - "
+                            "their format from before highlighting isn't recorded (remove it by hand)")
+    
+    def write_match_ids_xml(self, odoo_file, manual_file, sheet_matches, style_origins=None):
+        """Sidecar mode without openpyxl: patch the Match ID column and highlights directly
+        into the sheet XML of both files (raises XlsxPatchError if a file can't be patched)
+        
+        Args:
+            odoo_file: Path to Odoo file
+            manual_file: Path to Manual file
+            sheet_matches: Dict of Manual sheet name -> list of matches
+            style_origins: Dict with the 'odoo' and 'manual' highlighted -> original cell format
+                indices recorded by the previous run (see XlsxMatchIdWriter)
+        
+        Returns:
+            The same kind of dict for the files as written now
+        """
+        style_origins = style_origins or {}
+        odoo_writer = XlsxMatchIdWriter(odoo_file, style_origins.get('odoo'))
+        manual_writer = XlsxMatchIdWriter(manual_file, style_origins.get('manual'))
+        try:
+            odoo_ids = {}
+            manual_rows_changed = 0
+            for sheet_name, matches in sheet_matches.items():
+                if sheet_name not in manual_writer.sheet_parts:
+                    continue
+                # A sheet without matches only needs patching to remove IDs of an earlier run
+                if not matches and 'Match ID' not in (text.strip() for text in manual_writer.row_texts(sheet_name, 5).values()):
+                    continue
+                manual_ids = {}
+                for match in matches:
+                    odoo_ids[match['odoo_row_num']] = match['match_id']
+                    manual_ids[match['manual_row_num']] = match['match_id']
+                
+                # Highlight original Manual columns A-M (as in insert mode) plus the Match ID cell
+                manual_col = manual_writer.patch_sheet(sheet_name, 5, manual_ids,
+                                                       range(1, MANUAL_COLUMNS['closing_value'] + 1))
+                manual_rows_changed += manual_writer.rows_changed
+                self.count('match_ids_written', manual_writer.rows_changed)
+                self.log_status(f"Writing Match IDs to column {openpyxl.utils.get_column_letter(manual_col)} of {sheet_name} sheet "
+                                f"({manual_writer.rows_changed} rows changed)...")
+            
+            odoo_header_row = odoo_writer.find_header_row(odoo_writer.active_sheet, ('Match ID', 'SL\nNo', 'SL No', 'SL'))
+            odoo_col = odoo_writer.patch_sheet(None, odoo_header_row, odoo_ids)
+            self.count('match_ids_written', odoo_writer.rows_changed)
+            self.log_status(f"Writing Match IDs to column {openpyxl.utils.get_column_letter(odoo_col)} of Odoo file "
+                            f"({odoo_writer.rows_changed} rows changed)")
+            
+            self.log_kept_highlights(odoo_writer.cells_kept_highlighted + manual_writer.cells_kept_highlighted)
+            
+            self.check_cancelled()  # Last chance to stop before the files are modified
+            written_origins = {'odoo': odoo_writer.style_origins, 'manual': manual_writer.style_origins}
+            if not (odoo_writer.rows_changed or manual_rows_changed):
+                self.log_status("Match IDs are already up to date - files not modified")
+                return written_origins
+            self.log_status("Saving files...")
+            with self.stage("Save files", advance=False):
+                # A file whose Match IDs didn't change is left alone
+                if odoo_writer.rows_changed:
+                    odoo_writer.save()
+                if manual_rows_changed:
+                    manual_writer.save()
+            return written_origins
+        finally:
+            odoo_writer.close()
+            manual_writer.close()
+    
+    def process_files(self, odoo_file, manual_file, rm_matches, consumable_matches, spare_parts_matches, reusable_matches,
+                      output_mode='insert', style_origins=None):
+        """Process and update files for RM, Consumable, Spare parts, and Re-usable sheets
+        
+        Args:
+            output_mode: 'insert' puts Match IDs in a new first column (shifting the sheet, fixing
+                formulas and merged cells, cleaning the Odoo file); 'sidecar' keeps the layout
+                and writes Match IDs into a column appended after the last used column
+            style_origins: Sidecar mode: highlighted -> original cell formats of the previous run
+                (see write_match_ids_xml), needed to remove highlights of rows no longer matched
+        
+        Returns:
+            Sidecar mode: the highlighted -> original cell formats of the files as written
+            (None in insert mode)
+        """
+        if output_mode == 'sidecar':
+            sheet_matches = {'RM': rm_matches, 'Consumable': consumable_matches,
+                             'Spare parts': spare_parts_matches, 'Re-usable': reusable_matches}
+            try:
+                return self.write_match_ids_xml(odoo_file, manual_file, sheet_matches, style_origins)
+            except (XlsxPatchError, zipfile.BadZipFile) as e:
+                self.log_status(f"Cannot patch files directly ({e}), saving through openpyxl instead...")
+        
+        # Load files with all features preserved (formulas, formatting, merged cells, etc.)
+        self.log_status("Loading files (preserving all features: formulas, formatting, merged cells)...")
+        with self.stage("Load workbooks", advance=False):
+            odoo_wb = openpyxl.load_workbook(odoo_file, data_only=False, keep_links=False)
+            manual_wb = openpyxl.load_workbook(manual_file, data_only=False, keep_links=False)
+        
+        if output_mode == 'sidecar':
+            with self.stage("Annotate sheets", advance=False):
+                odoo_styler, manual_styler = self.annotate_files_sidecar(
+                    odoo_wb, manual_wb, sheet_matches, style_origins,
+                    source_files={'odoo': odoo_file, 'manual': manual_file})
+            
+            # Save files
+            self.check_cancelled()  # Last chance to stop before the files are modified
+            self.log_status("Saving files...")
+            with self.stage("Save files", advance=False):
+                odoo_wb.save(odoo_file)
+                manual_wb.save(manual_file)
+            
+            # Saving renumbers the cell formats
+            written_origins = {'odoo': odoo_styler.saved_style_origins(),
+                               'manual': manual_styler.saved_style_origins()}
+            odoo_wb.close()
+            manual_wb.close()
+            return written_origins
+        
+        # Process RM sheet (first sheet - inserts Odoo Match ID column)
+        if rm_matches:
+            with self.stage("Annotate RM sheet", advance=False):
+                self.process_sheet(odoo_wb, manual_wb, 'RM', rm_matches, is_first_sheet=True)
+        
+        # Process Consumable sheet (second sheet - Odoo Match ID already exists)
+        if consumable_matches:
+            with self.stage("Annotate Consumable sheet", advance=False):
+                self.process_sheet(odoo_wb, manual_wb, 'Consumable', consumable_matches, is_first_sheet=False)
+        
+        # Process Spare parts sheet (third sheet - Odoo Match ID already exists)
+        if spare_parts_matches:
+            with self.stage("Annotate Spare parts sheet", advance=False):
+                self.process_sheet(odoo_wb, manual_wb, 'Spare parts', spare_parts_matches, is_first_sheet=False)
+        
+        # Process Re-usable sheet (fourth sheet - Odoo Match ID already exists)
+        if reusable_matches:
+            with self.stage("Annotate Re-usable sheet", advance=False):
+                self.process_sheet(odoo_wb, manual_wb, 'Re-usable', reusable_matches, is_first_sheet=False)
+        
+        # Clean Odoo file (remove blank rows and images)
+        self.log_status("Cleaning Odoo file (removing blank rows and images)...")
+        with self.stage("Clean Odoo file", advance=False):
+            self.clean_odoo_file(odoo_wb)
+        
+        # Save files
+        self.check_cancelled()  # Last chance to stop before the files are modified
+        self.log_status("Saving files...")
+        with self.stage("Save files", advance=False):
+            odoo_wb.save(odoo_file)
+            manual_wb.save(manual_file)
+        
+        odoo_wb.close()
+        manual_wb.close()
+    
+    def generate_analysis_report(self, odoo_data, manual_data, matches, rm_matches, consumable_matches, spare_parts_matches, reusable_matches, output_dir='.', matching_mode='simple'):
+        """Generate analysis report of unmatched records
+        Args:
+            odoo_data: List of Odoo data rows
+            manual_data: List of Manual data rows
+            matches: List of all matched records (RM + Consumable + Spare parts + Re-usable)
+            rm_matches: List of RM matched records
+            consumable_matches: List of Consumable matched records
+            spare_parts_matches: List of Spare parts matched records
+            reusable_matches: List of Re-usable matched records
+            output_dir: Directory where to save the report (default: current directory)
+            matching_mode: Matching mode used ('simple' or 'strict')
+        
+        Returns:
+            Dict with 'report_path' and the counts of the report's SUMMARY section
+            ('name_matches_but_different', 'code_differences', 'unit_differences',
+            'qty_value_differences', 'unmatched_odoo', 'unmatched_manual')
+        """
+        import os
+        from datetime import datetime
+        
+        # Use different filename based on matching mode
+        if matching_mode == 'simple':
+            report_filename = 'match_analysis_report_simple_match.txt'
+        else:
+            report_filename = 'match_analysis_report.txt'
+        
+        # Use the provided output directory (same folder as loaded files)
+        report_path = os.path.join(output_dir, report_filename)
+        
+        # Get matched row numbers for quick lookup
+        matched_odoo_row_nums = {m['odoo_row_num'] for m in matches}
+        matched_manual_row_nums = {m['manual_row_num'] for m in matches}
+        
+        # Build lookup indexes once so every check below is a dict/set lookup instead of a
+        # scan over the other file. Empty codes/names are indexed too: the report has always
+        # treated two empty values as equal.
+        manual_by_name = {}  # item name -> first manual row with that name
+        manual_codes = set()
+        for manual_row in manual_data:
+            manual_by_name.setdefault(manual_row.items_name, manual_row)
+            manual_codes.add(self.normalize_product_code(manual_row.product_code))
+        odoo_names = {odoo_row.product_name for odoo_row in odoo_data}
+        odoo_codes = {self.normalize_product_code(odoo_row.product_code) for odoo_row in odoo_data}
+        
+        # Find unmatched records
+        unmatched_odoo = []
+        unmatched_manual = []
+        name_matches_but_different = []
+        
+        for odoo_row in odoo_data:
+            # Check if this record was matched (by checking if row number is in matches)
+            if odoo_row.row_num in matched_odoo_row_nums:
+                continue
+            
+            odoo_code_norm = self.normalize_product_code(odoo_row.product_code)
+            
+            # Check if there's a name match in manual data (for reporting differences)
+            manual_row = manual_by_name.get(odoo_row.product_name)
+            name_match_found = manual_row is not None
+            code_match_found = odoo_code_norm in manual_codes
+            
+            if name_match_found:
+                # Check differences against the first manual row with the same name
+                differences = []
+                if odoo_code_norm != self.normalize_product_code(manual_row.product_code):
+                    differences.append(f"Product Code: '{odoo_row.product_code}' vs '{manual_row.product_code}'")
+                if self.normalize_unit(odoo_row.unit) != self.normalize_unit(manual_row.unit):
+                    differences.append(f"Unit: '{odoo_row.unit}' vs '{manual_row.unit}'")
+                mask = self.numeric_mismatch_masks(odoo_row, [manual_row])[0]
+                for bit, (field, label) in enumerate(zip(NUMERIC_FIELDS, NUMERIC_LABELS)):
+                    if mask & (1 << bit):
+                        differences.append(f"{label}: {getattr(odoo_row, field)} vs {getattr(manual_row, field)}")
+                
+                if differences:
+                    name_matches_but_different.append({
+                        'odoo': odoo_row,
+                        'manual': manual_row,
+                        'differences': differences
+                    })
+            
+            # In simple mode: unmatched if neither code nor name matches any manual record
+            # In strict mode: unmatched if name doesn't match (code match alone doesn't count)
+            if matching_mode == 'simple':
+                if not code_match_found and not name_match_found:
+                    unmatched_odoo.append(odoo_row)
+            else:
+                if not name_match_found:
+                    unmatched_odoo.append(odoo_row)
+        
+        # Find unmatched manual records
+        for manual_row in manual_data:
+            # Check if this record was matched (by checking if row number is in matches)
+            if manual_row.row_num in matched_manual_row_nums:
+                continue
+            
+            # Check if code or name exists in Odoo
+            name_exists = manual_row.items_name in odoo_names
+            if matching_mode == 'simple':
+                code_exists = self.normalize_product_code(manual_row.product_code) in odoo_codes
+                if not code_exists and not name_exists:
+                    unmatched_manual.append(manual_row)
+            else:
+                if not name_exists:
+                    unmatched_manual.append(manual_row)
+        
+        # Group by difference type
+        code_diff = [x for x in name_matches_but_different if any('Product Code' in d for d in x['differences'])]
+        unit_diff = [x for x in name_matches_but_different if any('Unit' in d for d in x['differences'])]
+        qty_value_diff = [x for x in name_matches_but_different if any(('Qty' in d or 'Value' in d) for d in x['differences'])]
+        
+        # Write report
+        with open(report_path, 'w', encoding='utf-8') as f:
+            f.write("MATCH ANALYSIS REPORT\n")
+            f.write("=" * 80 + "\n")
+            f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+            
+            f.write(f"SUMMARY\n")
+            f.write("-" * 80 + "\n")
+            f.write(f"Total Odoo records: {len(odoo_data)}\n")
+            f.write(f"Total Manual records: {len(manual_data)}\n")
+            f.write(f"Full matches (all criteria): {len(matches)}\n")
+            f.write(f"  - RM matches: {len(rm_matches)}\n")
+            f.write(f"  - Consumable matches: {len(consumable_matches)}\n")
+            f.write(f"  - Spare parts matches: {len(spare_parts_matches)}\n")
+            f.write(f"  - Re-usable matches: {len(reusable_matches)}\n")
+            f.write(f"Name matches but other differences: {len(name_matches_but_different)}\n")
+            f.write(f"Unmatched Odoo records (no name match): {len(unmatched_odoo)}\n")
+            f.write(f"Unmatched Manual records (no name match): {len(unmatched_manual)}\n\n")
+            
+            f.write("=" * 80 + "\n")
+            f.write("RECORDS WITH MATCHING NAMES BUT DIFFERENT VALUES\n")
+            f.write("=" * 80 + "\n\n")
+            
+            f.write(f"Product Code differences: {len(code_diff)}\n")
+            f.write(f"Unit differences: {len(unit_diff)}\n")
+            f.write(f"Quantity/Value differences: {len(qty_value_diff)}\n\n")
+            
+            # Detailed list
+            for i, item in enumerate(name_matches_but_different, 1):
+                odoo = item['odoo']
+                manual = item['manual']
+                f.write(f"{i}. Item Name: '{odoo['product_name']}'\n")
+                f.write(f"   Odoo (Row {odoo['row_num']}): Code='{odoo['product_code']}', Unit='{odoo['unit']}', ")
+                f.write(f"Opening={odoo['opening_qty']}/{odoo['opening_value']}, Closing={odoo['closing_qty']}/{odoo['closing_value']}\n")
+                f.write(f"   Manual (Row {manual['row_num']}): Code='{manual['product_code']}', Unit='{manual['unit']}', ")
+                f.write(f"Opening={manual['opening_qty']}/{manual['opening_value']}, Closing={manual['closing_qty']}/{manual['closing_value']}\n")
+                f.write(f"   Differences: {', '.join(item['differences'])}\n\n")
+            
+            f.write("\n" + "=" * 80 + "\n")
+            f.write("UNMATCHED ODOO RECORDS (No matching name in Manual)\n")
+            f.write("=" * 80 + "\n\n")
+            for i, row in enumerate(unmatched_odoo[:100], 1):  # Limit to first 100
+                f.write(f"{i}. Row {row['row_num']}: Code='{row['product_code']}', Name='{row['product_name'][:60]}...', ")
+                f.write(f"Unit='{row['unit']}', Opening={row['opening_qty']}/{row['opening_value']}\n")
+            if len(unmatched_odoo) > 100:
+                f.write(f"\n... and {len(unmatched_odoo) - 100} more unmatched Odoo records\n")
+            
+            f.write("\n" + "=" * 80 + "\n")
+            f.write("UNMATCHED MANUAL RECORDS (No matching name in Odoo)\n")
+            f.write("=" * 80 + "\n\n")
+            for i, row in enumerate(unmatched_manual[:100], 1):  # Limit to first 100
+                f.write(f"{i}. Row {row['row_num']}: Code='{row['product_code']}', Name='{row['items_name'][:60]}...', ")
+                f.write(f"Unit='{row['unit']}', Opening={row['opening_qty']}/{row['opening_value']}\n")
+            if len(unmatched_manual) > 100:
+                f.write(f"\n... and {len(unmatched_manual) - 100} more unmatched Manual records\n")
+        
+        self.log_status(f"Analysis report saved to: {report_path}")
+        return {
+            'report_path': report_path,
+            'name_matches_but_different': len(name_matches_but_different),
+            'code_differences': len(code_diff),
+            'unit_differences': len(unit_diff),
+            'qty_value_differences': len(qty_value_diff),
+            'unmatched_odoo': len(unmatched_odoo),
+            'unmatched_manual': len(unmatched_manual),
+        }
+
+
+# Batch mode: file name prefixes used to pair Odoo and Manual files found in a folder
+BATCH_ODOO_PREFIX = 'detailed stock report'
+BATCH_MANUAL_PREFIX = 'monthly stock report'
+BATCH_SUMMARY_FILENAME = 'batch_summary.csv'
+BATCH_LOG_FILENAME = 'validation_log.txt'
+# Characters a manifest pair name can't contain: it names the pair's output folder inside --out
+INVALID_PAIR_NAME_RE = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+BATCH_SUMMARY_FIELDS = ('pair', 'status', 'seconds', 'odoo_rows', 'manual_rows', 'total_matches',
+                        'rm_matches', 'consumable_matches', 'spare_parts_matches', 'reusable_matches',
+                        'name_matches_but_different', 'code_differences', 'unit_differences',
+                        'qty_value_differences', 'unmatched_odoo', 'unmatched_manual',
+                        'report_path', 'odoo_file', 'manual_file', 'error')
+
+def copy_to_folder(path, folder):
+    """Copy a file into folder (unless it is already there) and return the copy's path"""
+    target = os.path.join(folder, os.path.basename(path))
+    if os.path.abspath(target) != os.path.abspath(path):
+        shutil.copy2(path, target)
+    return target
+
+def pair_key(file_name, prefix):
+    """Part of a file name after the Odoo/Manual prefix, e.g. 'aug 25 site a' - used to pair files"""
+    rest = os.path.splitext(file_name)[0][len(prefix):]
+    return ' '.join(re.split(r'[\s_\-]+', rest.lower())).strip()
+
+def unique_pair_name(name, used_names):
+    """name, or name with ' (2)', ' (3)', ... when another pair already has its output folder
+    Compared case-insensitively, as folder names are on Windows and macOS.
+    
+    Args:
+        used_names: Set of the casefolded names given out so far (updated)
+    """
+    unique_name = name
+    counter = 2
+    while unique_name.casefold() in used_names:
+        unique_name = f"{name} ({counter})"
+        counter += 1
+    used_names.add(unique_name.casefold())
+    return unique_name
+
+def find_file_pairs(directory, exclude_dir=None):
+    """Find Odoo/Manual pairs in directory and its subfolders
+    
+    Within a folder, 'Detailed Stock Report <x>.xlsx' is paired with 'Monthly Stock report <x>.xlsx'.
+    A folder holding exactly one file of each kind is paired regardless of the names.
+    
+    Returns:
+        Tuple of (list of (name, odoo_file, manual_file), list of files that could not be paired)
+    """
+    pairs = []
+    unpaired = []
+    used_names = set()
+    exclude_dir = os.path.abspath(exclude_dir) if exclude_dir else None
+    for folder, dir_names, file_names in os.walk(directory):
+        dir_names.sort()
+        if exclude_dir and os.path.abspath(folder) == exclude_dir:
+            dir_names[:] = []  # Don't pick up the annotated copies of an earlier batch run
+            continue
+        odoo_files = {}
+        manual_files = {}
+        for file_name in sorted(file_names):
+            lower = file_name.lower()
+            if not lower.endswith('.xlsx') or file_name.startswith('~$'):
+                continue
+            if lower.startswith(BATCH_ODOO_PREFIX):
+                odoo_files.setdefault(pair_key(file_name, BATCH_ODOO_PREFIX), []).append(file_name)
+            elif lower.startswith(BATCH_MANUAL_PREFIX):
+                manual_files.setdefault(pair_key(file_name, BATCH_MANUAL_PREFIX), []).append(file_name)
+        
+        folder_pairs = []
+        for key in list(manual_files):
+            if len(manual_files[key]) == 1 and len(odoo_files.get(key, ())) == 1:
+                folder_pairs.append((odoo_files.pop(key)[0], manual_files.pop(key)[0]))
+        left_odoo = sum(odoo_files.values(), [])
+        left_manual = sum(manual_files.values(), [])
+        if len(left_odoo) == 1 and len(left_manual) == 1:
+            folder_pairs.append((left_odoo[0], left_manual[0]))
+        else:
+            unpaired.extend(os.path.join(folder, name) for name in left_odoo + left_manual)
+        
+        relative_folder = os.path.relpath(folder, directory)
+        for odoo_name, manual_name in folder_pairs:
+            name = os.path.splitext(manual_name)[0]
+            if relative_folder != os.curdir:
+                name = os.path.join(relative_folder, name)
+            pairs.append((unique_pair_name(name, used_names), os.path.join(folder, odoo_name), os.path.join(folder, manual_name)))
+    return pairs, unpaired
+
+def read_pair_manifest(manifest_path):
+    """Read Odoo/Manual pairs from a CSV manifest with 'odoo' and 'manual' columns (and optionally 'name')
+    Relative paths are taken relative to the manifest's folder. A name becomes the pair's
+    output folder, so it can't contain path separators or other characters invalid in folder
+    names, and can't be '.' or '..' (ValueError).
+    
+    Returns:
+        List of (name, odoo_file, manual_file)
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    pairs = []
+    used_names = set()
+    with open(manifest_path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        columns = {(column or '').strip().lower(): column for column in reader.fieldnames or ()}
+        if 'odoo' not in columns or 'manual' not in columns:
+            raise ValueError(f"Manifest {manifest_path} needs 'odoo' and 'manual' columns")
+        for line_num, row in enumerate(reader, 2):
+            odoo_file = (row[columns['odoo']] or '').strip()
+            manual_file = (row[columns['manual']] or '').strip()
+            if not odoo_file and not manual_file:
+                continue
+            if not odoo_file or not manual_file:
+                raise ValueError(f"Manifest {manifest_path} line {line_num}: both 'odoo' and 'manual' are needed")
+            name = (row[columns['name']] or '').strip() if 'name' in columns else ''
+            if name and (INVALID_PAIR_NAME_RE.search(name) or not name.strip('.')):
+                raise ValueError(f"Manifest {manifest_path} line {line_num}: name {name!r} can't be used as a "
+                                 "folder name (no path separators, '..' or any of <>:\"|?*)")
+            name = name or os.path.splitext(os.path.basename(manual_file))[0]
+            # Every pair gets its own output folder
+            pairs.append((unique_pair_name(name, used_names), os.path.join(base_dir, odoo_file),
+                          os.path.join(base_dir, manual_file)))
+    return pairs
+
+class LogCollectingEngine(StockReportEngine):
+    """Engine that collects its log instead of printing it (batch pairs, background reads)"""
+    
+    def __init__(self):
+        super().__init__()
+        self.log_lines = []
+    
+    def log_status(self, message):
+        self.log_lines.append(message)
+
+def validate_pair_worker(name, odoo_file, manual_file, pair_dir, matching_mode, output_mode, use_cache):
+    """Process pool worker: validate copies of one pair in pair_dir and return its summary row
+    Errors are caught and reported in the row, so one bad pair doesn't stop the batch.
+    The pair's log is written to pair_dir as well.
+    """
+    engine = LogCollectingEngine()
+    summary = {'pair': name, 'odoo_file': odoo_file, 'manual_file': manual_file}
+    start = time.perf_counter()
+    try:
+        os.makedirs(pair_dir, exist_ok=True)
+        result = engine.run_validation(copy_to_folder(odoo_file, pair_dir), copy_to_folder(manual_file, pair_dir),
+                                       matching_mode=matching_mode, output_mode=output_mode,
+                                       use_cache=use_cache, report_dir=pair_dir)
+        sheet_matches = result['sheet_matches']
+        summary.update({
+            'status': 'ok' if result['total_matches'] else 'no matches',
+            'odoo_rows': result['odoo_rows'],
+            'manual_rows': result['manual_rows'],
+            'total_matches': result['total_matches'],
+            'rm_matches': len(sheet_matches['RM']),
+            'consumable_matches': len(sheet_matches['Consumable']),
+            'spare_parts_matches': len(sheet_matches['Spare parts']),
+            'reusable_matches': len(sheet_matches['Re-usable']),
+            'report_path': result['report_path'] or '',
+        })
+        summary.update(result['differences'] or {})
+    except Exception as e:
+        engine.log_status(traceback.format_exc())
+        summary.update({'status': 'error', 'error': str(e) or type(e).__name__})
+    summary['seconds'] = round(time.perf_counter() - start, 2)
+    
+    engine.log_stage_timings()
+    try:
+        with open(os.path.join(pair_dir, BATCH_LOG_FILENAME), 'w', encoding='utf-8') as f:
+            f.write("\n".join(engine.log_lines) + "\n")
+    except OSError:
+        pass  # The summary row still reports the outcome
+    return summary
@@ -0,0 +1,77 @@
+"""
+Tests for batch mode: pair manifests and the per-pair summary rows of validate_pair_worker
+
+Run with:
+    python -m unittest discover tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from generate_workbooks import generate_pair
+from stock_report_engine import BATCH_LOG_FILENAME, read_pair_manifest, validate_pair_worker
+
+
+class ValidatePairWorkerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_pair_without_matches_still_gets_its_report_and_counts(self):
+        # No shared items: every row of both files is unmatched
+        odoo_file, manual_file = generate_pair(20, os.path.join(self.tmp_dir, 'in'), match_ratio=0,
+                                               blank_row_ratio=0)
+        pair_dir = os.path.join(self.tmp_dir, 'out')
+        summary = validate_pair_worker('Aug-25', odoo_file, manual_file, pair_dir, 'simple', 'sidecar', False)
+
+        self.assertEqual(summary['status'], 'no matches')
+        self.assertEqual(summary['total_matches'], 0)
+        self.assertTrue(os.path.isfile(summary['report_path']))
+        self.assertEqual(summary['unmatched_odoo'], summary['odoo_rows'])
+        self.assertEqual(summary['unmatched_manual'], summary['manual_rows'])
+        self.assertIn('qty_value_differences', summary)
+        self.assertTrue(os.path.isfile(os.path.join(pair_dir, BATCH_LOG_FILENAME)))
+
+
+class ReadPairManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.manifest = os.path.join(self.tmp_dir, 'pairs.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def read(self, *names):
+        with open(self.manifest, 'w', encoding='utf-8') as f:
+            f.write('name,odoo,manual\n')
+            for num, name in enumerate(names):
+                f.write(f'"{name}",odoo{num}.xlsx,manual{num}.xlsx\n')
+        return read_pair_manifest(self.manifest)
+
+    def test_names_that_leave_the_output_folder_are_rejected(self):
+        for name in ('../x', '..', '/tmp/x', 'a/b', 'a\\b', 'C:x'):
+            with self.assertRaises(ValueError, msg=name):
+                self.read(name)
+
+    def test_names_differing_only_in_case_get_their_own_folders(self):
+        pairs = self.read('Aug-25', 'aug-25', 'AUG-25', 'Sep-25')
+        self.assertEqual([name for name, _, _ in pairs], ['Aug-25', 'aug-25 (2)', 'AUG-25 (3)', 'Sep-25'])
+        self.assertEqual(pairs[0][1], os.path.join(self.tmp_dir, 'odoo0.xlsx'))
+
+    def test_missing_name_comes_from_the_manual_file(self):
+        self.assertEqual(self.read('')[0][0], 'manual0')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""
+Tests for FormulaColumnShifter: references into a sheet follow a column inserted into it
+
+Run with:
+    python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+import openpyxl
+from openpyxl.worksheet.formula import ArrayFormula
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stock_report_engine import FormulaColumnShifter, LogCollectingEngine
+
+
+class ShiftFormulaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.shifter = FormulaColumnShifter('RM')
+
+    def test_references_on_the_same_sheet(self):
+        self.assertEqual(self.shifter.shift_formula('=G6*H6'), '=H6*I6')
+        self.assertEqual(self.shifter.shift_formula('=SUM($A$1:B5)'), '=SUM($B$1:C5)')
+        self.assertEqual(self.shifter.shift_formula('=RM!A1+Consumable!A1'), '=RM!B1+Consumable!A1')
+
+    def test_columns_before_the_inserted_one_stay(self):
+        shifter = FormulaColumnShifter('RM', inserted_col=3, amount=2)
+        self.assertEqual(shifter.shift_formula('=A1+B1+C1+AA1'), '=A1+B1+E1+AC1')
+
+    def test_cross_sheet_references(self):
+        # From another sheet only references qualified with the changed sheet move
+        self.assertEqual(self.shifter.shift_formula('=RM!G3+Consumable!G3+G3', on_same_sheet=False),
+                         '=RM!H3+Consumable!G3+G3')
+        self.assertEqual(self.shifter.shift_formula("='RM'!M3", on_same_sheet=False), "='RM'!N3")
+
+    def test_quoted_sheet_names(self):
+        shifter = FormulaColumnShifter('Spare parts')
+        self.assertEqual(shifter.shift_formula("='Spare parts'!G3*2", on_same_sheet=False), "='Spare parts'!H3*2")
+        self.assertEqual(shifter.shift_formula("='Spare parts (old)'!G3", on_same_sheet=False),
+                         "='Spare parts (old)'!G3")
+        shifter = FormulaColumnShifter("Bob's items")
+        self.assertEqual(shifter.shift_formula("='Bob''s items'!A1", on_same_sheet=False), "='Bob''s items'!B1")
+
+    def test_whole_column_ranges(self):
+        self.assertEqual(self.shifter.shift_formula('=SUM(RM!D:D)', on_same_sheet=False), '=SUM(RM!E:E)')
+        self.assertEqual(self.shifter.shift_formula('=SUM(D:F)'), '=SUM(E:G)')
+        self.assertEqual(self.shifter.shift_formula('=SUM($D:$D)'), '=SUM($E:$E)')
+
+    def test_strings_names_and_functions_are_left_alone(self):
+        self.assertEqual(self.shifter.shift_formula('=IF(A1="B2",LOG10(C3),"RM!D4")'),
+                         '=IF(B1="B2",LOG10(D3),"RM!D4")')
+        self.assertEqual(self.shifter.shift_formula('=ATAN2(1,2)+Rate'), '=ATAN2(1,2)+Rate')
+        self.assertEqual(self.shifter.shift_formula('=IFERROR((G6+I6)/(F6+H6),0)'), '=IFERROR((H6+J6)/(G6+I6),0)')
+
+    def test_cached_shape_gives_the_same_text_as_tokenizing(self):
+        formulas = ['=G6*H6', '=G7*H7', '=G123*H123', '=SUM(G6:G6000)', '=SUM(G7:G6001)',
+                    '=IF(A9="X10",LOG10(B9),0)', '=IF(A10="X10",LOG10(B10),0)', "='RM'!A5+RM!$B$6"]
+        for formula in formulas:
+            for on_same_sheet in (True, False):
+                expected = FormulaColumnShifter('RM').shift_tokens(formula, on_same_sheet)
+                self.assertEqual(self.shifter.shift_formula(formula, on_same_sheet), expected, formula)
+        # Copied-down formulas share one shape
+        shifter = FormulaColumnShifter('RM')
+        for row_num in range(6, 106):
+            shifter.shift_formula(f'=G{row_num}*H{row_num}')
+        self.assertEqual(len(shifter.shape_cache), 1)
+
+
+class AdjustFormulasTest(unittest.TestCase):
+
+    def test_workbook_formulas_follow_the_inserted_column(self):
+        wb = openpyxl.Workbook()
+        top = wb.active
+        top.title = 'Top Page'
+        for sheet_name in ('RM', 'Consumable', 'Re-usable'):
+            wb.create_sheet(sheet_name)
+        top['B2'] = "='RM'!G3"
+        top['B3'] = '=Consumable!G3'
+        top['B4'] = "='Re-usable'!G3"
+        top['B5'] = '=SUM(RM!D:D)'
+        rm = wb['RM']
+        rm['N6'] = '=IFERROR((G6+I6)/(F6+H6),0)'
+        rm['P6'] = ArrayFormula('P6:P8', '=SUM(G6:G8*H6:H8)')
+
+        LogCollectingEngine().adjust_formulas_after_insert(rm)
+        self.assertEqual(top['B2'].value, "='RM'!H3")
+        self.assertEqual(top['B3'].value, '=Consumable!G3')
+        self.assertEqual(top['B4'].value, "='Re-usable'!G3")
+        self.assertEqual(top['B5'].value, '=SUM(RM!E:E)')
+        self.assertEqual(rm['N6'].value, '=IFERROR((H6+J6)/(G6+I6),0)')
+        self.assertEqual(rm['P6'].value.text, '=SUM(H6:H8*I6:I8)')
+        self.assertEqual(rm['P6'].value.ref, 'Q6:Q8')
+
+
+if __name__ == '__main__':
+    unittest.main()
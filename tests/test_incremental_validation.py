@@ -0,0 +1,130 @@
+"""
+Tests for incremental re-validation: only rows changed since the previous sidecar run are
+matched and written again
+
+Run with:
+    python -m unittest discover tests
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import openpyxl
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from generate_workbooks import generate_pair
+from stock_report_engine import MATCH_STATE_SUFFIX, LogCollectingEngine
+
+SHEET = 'RM'
+
+
+class IncrementalValidationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.odoo_file, self.manual_file = generate_pair(40, self.tmp_dir, match_ratio=0.9, diff_ratio=0,
+                                                         blank_row_ratio=0, seed=1)
+        self.plain_fills = self.manual_fills()
+        self.first_run = self.validate()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def validate(self, incremental=True):
+        """Sidecar run in simple mode, returns the engine (log in log_lines, counters in 'counters')"""
+        engine = LogCollectingEngine()
+        engine.run_validation(self.odoo_file, self.manual_file, matching_mode='simple', output_mode='sidecar',
+                              use_cache=False, report_dir=self.tmp_dir, metrics=True, incremental=incremental)
+        with open(os.path.join(self.tmp_dir, 'validation_metrics.json'), encoding='utf-8') as f:
+            engine.counters = json.load(f)['counters']
+        return engine
+
+    def match_ids(self, file_path, sheet_name, header_row):
+        """{row number: Match ID} of a sheet's appended Match ID column"""
+        wb = openpyxl.load_workbook(file_path)
+        try:
+            ws = wb[sheet_name] if sheet_name else wb.active
+            col = next(cell.column for cell in ws[header_row] if cell.value == 'Match ID')
+            return {row_num: ws.cell(row_num, col).value for row_num in range(header_row + 1, ws.max_row + 1)
+                    if ws.cell(row_num, col).value is not None}
+        finally:
+            wb.close()
+
+    def all_match_ids(self):
+        return self.match_ids(self.odoo_file, None, 2), self.match_ids(self.manual_file, SHEET, 5)
+
+    def manual_fills(self):
+        """{row number: fill colour of column B} of the Manual sheet"""
+        ws = openpyxl.load_workbook(self.manual_file)[SHEET]
+        return {row_num: ws.cell(row_num, 2).fill.fgColor.rgb for row_num in range(6, ws.max_row + 1)}
+
+    def edit_manual_row(self, row_num, values):
+        """Change cells of a Manual row ({column: value}) and save, as a user would"""
+        wb = openpyxl.load_workbook(self.manual_file)
+        for col, value in values.items():
+            wb[SHEET].cell(row_num, col).value = value
+        wb.save(self.manual_file)
+
+    def first_match(self):
+        """(Match ID, Odoo row, Manual row) of the first RM match of the first run"""
+        state = self.first_run.load_match_state(self.odoo_file, self.manual_file)
+        return state['sheet_matches'][SHEET][0]
+
+    def test_edited_manual_row_is_the_only_one_matched_again(self):
+        odoo_ids, manual_ids = self.all_match_ids()
+        _, _, manual_row = self.first_match()
+        closing_qty = openpyxl.load_workbook(self.manual_file)[SHEET].cell(manual_row, 12).value
+
+        self.edit_manual_row(manual_row, {12: closing_qty + 5})
+        engine = self.validate()
+        self.assertIn("Re-matching only what changed since the previous run: 0 Odoo rows, 1 Manual rows",
+                      engine.log_lines)
+        self.assertEqual(engine.counters['incremental_odoo_rows_rematched'], 1)
+        # Still matched by code and name, so it keeps its Match ID and nothing is rewritten
+        self.assertEqual(engine.counters.get('match_ids_written', 0), 0)
+        self.assertEqual(self.all_match_ids(), (odoo_ids, manual_ids))
+
+    def test_row_that_no_longer_matches_loses_its_id_and_highlight(self):
+        odoo_ids, manual_ids = self.all_match_ids()
+        match_id, odoo_row, manual_row = self.first_match()
+        self.assertNotEqual(self.manual_fills()[manual_row], self.plain_fills[manual_row])
+
+        self.edit_manual_row(manual_row, {2: 'XX-0000', 4: 'Renamed item'})
+        engine = self.validate()
+        self.assertEqual(engine.counters['match_ids_written'], 2)  # One row in each file
+
+        new_odoo_ids, new_manual_ids = self.all_match_ids()
+        self.assertNotIn(odoo_row, new_odoo_ids)
+        self.assertNotIn(manual_row, new_manual_ids)
+        self.assertEqual(self.manual_fills()[manual_row], self.plain_fills[manual_row])
+        # Every other row keeps its Match ID
+        del odoo_ids[odoo_row], manual_ids[manual_row]
+        self.assertEqual((new_odoo_ids, new_manual_ids), (odoo_ids, manual_ids))
+
+    def test_state_of_another_version_or_file_pair_means_a_full_match(self):
+        state_path = self.manual_file + MATCH_STATE_SUFFIX
+        with open(state_path, encoding='utf-8') as f:
+            state = json.load(f)
+        engine = LogCollectingEngine()
+        self.assertIsNotNone(engine.load_match_state(self.odoo_file, self.manual_file))
+
+        for key, value in (('version', state['version'] - 1), ('odoo_file', state['odoo_file'] + '.old')):
+            with open(state_path, 'w', encoding='utf-8') as f:
+                json.dump(dict(state, **{key: value}), f)
+            self.assertIsNone(engine.load_match_state(self.odoo_file, self.manual_file), key)
+            engine = self.validate()
+            self.assertFalse(any(line.startswith("Re-matching only") for line in engine.log_lines), key)
+            self.assertIn("Finding matches for RM sheet...", engine.log_lines)
+            with open(state_path, encoding='utf-8') as f:
+                state = json.load(f)  # Written again by the full run
+
+
+if __name__ == '__main__':
+    unittest.main()
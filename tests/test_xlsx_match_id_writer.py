@@ -0,0 +1,249 @@
+"""
+Tests for XlsxMatchIdWriter and HighlightStyler: patching Match IDs into the sheet XML, and
+removing a highlight gives a cell back its own format
+
+Run with:
+    python -m unittest discover tests
+"""
+
+import os
+import re
+import shutil
+import sys
+import tempfile
+import unittest
+import zipfile
+
+import openpyxl
+from openpyxl.styles import Font, PatternFill
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stock_report_engine import HighlightStyler, XlsxMatchIdWriter
+
+GREEN_FILL = PatternFill(start_color='FF00B050', end_color='FF00B050', fill_type='solid')
+
+SHEET_XML = ('<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+             '<dimension ref="{dimension}" /><sheetViews><sheetView workbookViewId="0"/></sheetViews>'
+             '<sheetFormatPr defaultRowHeight="15"/>{cols}<sheetData>{rows}</sheetData>'
+             '<pageMargins left="0.75" right="0.75" top="1" bottom="1" header="0.5" footer="0.5"/></worksheet>')
+SHARED_STRINGS_XML = ('<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" count="{count}" '
+                      'uniqueCount="{count}">{items}</sst>')
+SHARED_STRINGS_REL = ('<Relationship Id="rIdStrings" Target="sharedStrings.xml" Type="http://schemas.openxmlformats'
+                      '.org/officeDocument/2006/relationships/sharedStrings"/>')
+SHARED_STRINGS_TYPE = ('<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-'
+                       'officedocument.spreadsheetml.sharedStrings+xml"/>')
+
+
+def write_package(path, rows_xml, shared_strings=(), dimension='A1:C3', cols_xml=''):
+    """Write an .xlsx whose only sheet has the given sheetData rows (cell format 1 is bold)"""
+    wb = openpyxl.Workbook()
+    wb.active['A1'].font = Font(bold=True)  # Cell format 1
+    skeleton = path + '.skeleton'
+    wb.save(skeleton)
+    with zipfile.ZipFile(skeleton) as source, zipfile.ZipFile(path, 'w') as package:
+        for info in source.infolist():
+            data = source.read(info).decode('utf-8')
+            if info.filename == 'xl/worksheets/sheet1.xml':
+                data = SHEET_XML.format(dimension=dimension, cols=cols_xml, rows=rows_xml)
+            elif info.filename == 'xl/_rels/workbook.xml.rels':
+                data = data.replace('</Relationships>', SHARED_STRINGS_REL + '</Relationships>')
+            elif info.filename == '[Content_Types].xml':
+                data = data.replace('</Types>', SHARED_STRINGS_TYPE + '</Types>')
+            package.writestr(info, data)
+        items = ''.join(f'<si><t>{text}</t></si>' for text in shared_strings)
+        package.writestr('xl/sharedStrings.xml', SHARED_STRINGS_XML.format(count=len(shared_strings), items=items))
+    os.remove(skeleton)
+
+
+class RemoveHighlightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'sheet.xlsx')
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.append(['SL', 'Name', 'Value'])
+        ws.append([1, 'Filled item', 10])
+        ws.append([2, 'Plain item', 20])
+        ws['C2'].fill = GREEN_FILL  # A format of the user's own, replaced while highlighted
+        wb.save(self.path)
+        self.original_styles = self.cell_styles()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def cell_styles(self):
+        """{cell reference: s attribute} of the sheet as saved"""
+        with zipfile.ZipFile(self.path) as package:
+            text = package.read('xl/worksheets/sheet1.xml').decode('utf-8')
+        styles = {}
+        for attrs in re.findall(r'<c\b([^>]*?)/?>', text):
+            ref = re.search(r'\br="([A-Z]+\d+)"', attrs).group(1)
+            style = re.search(r'\ss="(\d+)"', attrs)
+            styles[ref] = style.group(1) if style else '0'
+        return styles
+
+    def read_row_styles(self, row_nums):
+        writer = XlsxMatchIdWriter(self.path)
+        try:
+            return writer.row_styles(None, row_nums)
+        finally:
+            writer.close()
+
+    def patch(self, match_ids, style_origins=None):
+        writer = XlsxMatchIdWriter(self.path, style_origins)
+        try:
+            writer.patch_sheet(None, 1, match_ids)
+            writer.save()
+        finally:
+            writer.close()
+        return writer
+
+    def test_unmatched_row_gets_its_own_format_back(self):
+        writer = self.patch({2: 'RM0001', 3: 'RM0002'})
+        highlighted = self.cell_styles()
+        self.assertNotEqual(highlighted['C2'], self.original_styles['C2'])
+
+        writer = self.patch({3: 'RM0002'}, writer.style_origins)
+        styles = self.cell_styles()
+        for ref in ('A2', 'B2', 'C2'):
+            self.assertEqual(styles[ref], self.original_styles[ref], ref)
+        self.assertEqual(styles['C3'], highlighted['C3'])  # Still matched
+        self.assertEqual(writer.cells_kept_highlighted, 0)
+
+        ws = openpyxl.load_workbook(self.path).active
+        self.assertEqual(ws['C2'].fill.fgColor.rgb, 'FF00B050')
+        self.assertIsNone(ws['D2'].value)
+        self.assertEqual(ws['D3'].value, 'RM0002')
+
+    def test_highlight_is_kept_when_the_original_format_is_unknown(self):
+        self.patch({2: 'RM0001', 3: 'RM0002'})
+        highlighted = self.cell_styles()
+
+        writer = self.patch({3: 'RM0002'})  # No recorded origins
+        styles = self.cell_styles()
+        self.assertEqual(styles['C2'], highlighted['C2'])
+        self.assertGreater(writer.cells_kept_highlighted, 0)
+        self.assertIsNone(openpyxl.load_workbook(self.path).active['D2'].value)
+
+    def test_openpyxl_fallback_tells_fills_apart_by_cell_format(self):
+        # C2 (green) and C3 (no fill) look the same to openpyxl once highlighted
+        writer = self.patch({2: 'RM0001', 3: 'RM0002'})
+        cell_formats = self.read_row_styles({2, 3})
+
+        wb = openpyxl.load_workbook(self.path)
+        styler = HighlightStyler(wb, style_origins=writer.style_origins)
+        for row_num in (2, 3):
+            styler.unhighlight_row(wb.active, row_num, range(1, 5), cell_formats)
+        wb.save(self.path)
+        self.assertEqual(styler.cells_kept_highlighted, 0)
+
+        ws = openpyxl.load_workbook(self.path).active
+        self.assertEqual(ws['C2'].fill.fgColor.rgb, 'FF00B050')
+        self.assertIsNone(ws['C3'].fill.fill_type)
+
+    def test_openpyxl_fallback_keeps_ambiguous_highlights(self):
+        writer = self.patch({2: 'RM0001', 3: 'RM0002'})
+
+        wb = openpyxl.load_workbook(self.path)
+        styler = HighlightStyler(wb, style_origins=writer.style_origins)
+        styler.unhighlight_row(wb.active, 2, range(1, 5))  # Cell formats not known
+        self.assertEqual(wb.active['C2'].fill.fgColor.rgb, styler.wb._fills[styler.fill_id].fgColor.rgb)
+        self.assertGreater(styler.cells_kept_highlighted, 0)
+
+
+class PatchSheetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'sheet.xlsx')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def patch(self, match_ids):
+        writer = XlsxMatchIdWriter(self.path)
+        try:
+            col = writer.patch_sheet(None, 1, match_ids)
+            writer.save()
+        finally:
+            writer.close()
+        return col, writer.rows_changed
+
+    def sheet_xml(self):
+        with zipfile.ZipFile(self.path) as package:
+            return package.read('xl/worksheets/sheet1.xml').decode('utf-8')
+
+    def test_shared_and_inline_strings_are_both_read(self):
+        # Header and first ID as shared strings, second ID as an inline string
+        write_package(self.path,
+                      '<row r="1"><c r="A1" t="s"><v>0</v></c><c r="B1" t="inlineStr"><is><t>Name</t></is></c>'
+                      '<c r="C1" t="s"><v>1</v></c></row>'
+                      '<row r="2"><c r="A2"><v>1</v></c><c r="C2" t="s"><v>2</v></c></row>'
+                      '<row r="3"><c r="A3"><v>2</v></c><c r="C3" t="inlineStr"><is><t>RM0002</t></is></c></row>',
+                      shared_strings=('SL', 'Match ID', 'RM0001'))
+        self.assertEqual(self.patch({2: 'RM0001', 3: 'RM0002'}), (3, 0))  # Nothing to change
+
+        self.assertEqual(self.patch({2: 'RM0001', 3: 'RM0003'}), (3, 1))
+        ws = openpyxl.load_workbook(self.path).active
+        self.assertEqual([ws['C2'].value, ws['C3'].value], ['RM0001', 'RM0003'])
+        self.assertEqual(ws['B1'].value, 'Name')
+
+    def test_self_closing_cells_are_highlighted(self):
+        write_package(self.path,
+                      '<row r="1"><c r="A1" t="inlineStr"><is><t>SL</t></is></c>'
+                      '<c r="B1" t="inlineStr"><is><t>Name</t></is></c></row>'
+                      '<row r="2"><c r="A2"><v>1</v></c><c r="B2" s="1"/></row>',
+                      dimension='A1:B2')
+        col, _ = self.patch({2: 'RM0001'})
+        self.assertEqual(col, 3)
+        self.assertRegex(self.sheet_xml(), r'<c r="B2" s="\d+"/>')  # Still empty
+
+        ws = openpyxl.load_workbook(self.path).active
+        for ref in ('A2', 'B2', 'C2'):
+            self.assertEqual(ws[ref].fill.fgColor.rgb, 'FFFFFF99', ref)
+        self.assertTrue(ws['B2'].font.b)  # Its own format is kept under the highlight
+        self.assertIsNone(ws['B2'].value)
+        self.assertEqual(ws['C2'].value, 'RM0001')
+
+    def test_rerun_reuses_the_match_id_column(self):
+        write_package(self.path,
+                      '<row r="1"><c r="A1" t="inlineStr"><is><t>SL</t></is></c></row>'
+                      '<row r="2"><c r="A2"><v>1</v></c></row><row r="3"><c r="A3"><v>2</v></c></row>',
+                      dimension='A1:A3')
+        self.assertEqual(self.patch({2: 'RM0001'}), (2, 1))
+        self.assertEqual(self.patch({3: 'RM0002'}), (2, 2))  # Row 2 cleared, row 3 written
+
+        ws = openpyxl.load_workbook(self.path).active
+        self.assertEqual([cell.value for cell in ws[1]], ['SL', 'Match ID'])
+        self.assertEqual([ws['B2'].value, ws['B3'].value], [None, 'RM0002'])
+        self.assertEqual(self.sheet_xml().count('Match ID'), 1)
+
+    def test_new_column_gets_its_width_and_dimension(self):
+        # The column range 2-4 is split around the new column 3
+        write_package(self.path,
+                      '<row r="1"><c r="A1" t="inlineStr"><is><t>SL</t></is></c>'
+                      '<c r="B1" t="inlineStr"><is><t>Name</t></is></c></row>'
+                      '<row r="2"><c r="A2"><v>1</v></c></row>',
+                      dimension='A1:B2', cols_xml='<cols><col min="2" max="4" width="30" style="1" customWidth="1"/></cols>')
+        self.patch({2: 'RM0001'})
+        self.assertIn('<dimension ref="A1:C2"/>', self.sheet_xml())
+
+        ws = openpyxl.load_workbook(self.path).active
+        self.assertEqual(ws.dimensions, 'A1:C2')
+        self.assertEqual(ws.column_dimensions['B'].width, 30)
+        self.assertEqual(ws.column_dimensions['C'].width, 12)
+        self.assertEqual(ws.column_dimensions['D'].width, 30)
+        self.assertEqual(ws['C1'].value, 'Match ID')
+
+    def test_column_width_without_cols(self):
+        write_package(self.path, '<row r="1"><c r="A1" t="inlineStr"><is><t>SL</t></is></c></row>'
+                      '<row r="2"><c r="A2"><v>1</v></c></row>', dimension='A1:A2')
+        self.patch({2: 'RM0001'})
+        self.assertIn('<cols><col min="2" max="2" width="12" customWidth="1"/></cols><sheetData>', self.sheet_xml())
+        self.assertEqual(openpyxl.load_workbook(self.path).active.column_dimensions['B'].width, 12)
+
+
+if __name__ == '__main__':
+    unittest.main()
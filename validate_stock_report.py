@@ -1,206 +1,136 @@
 """
 Stock Report Validator
-Matches Product Code and Items Name between Odoo and Manual reports
-Highlights matches and adds match IDs
+Command line front end: matches Product Code and Items Name between Odoo and Manual reports,
+highlights matches, adds match IDs and writes the analysis report.
+Does not import tkinter, so it can run without a display (e.g. from cron).
+
+Usage:
+    python validate_stock_report.py --odoo "Detailed Stock Report.xlsx" --manual "Monthly Stock report.xlsx"
+    python validate_stock_report.py --odoo odoo.xlsx --manual manual.xlsx --mode strict --out results/
+    python validate_stock_report.py --batch exports/ --out results/
+    python validate_stock_report.py --batch pairs.csv --out results/ --workers 4
+
+Batch mode takes a folder (pairs 'Detailed Stock Report <x>.xlsx' with 'Monthly Stock report <x>.xlsx',
+or the only two such files of a subfolder) or a CSV manifest with 'odoo', 'manual' and optional 'name'
+columns. Every pair is validated in its own folder under --out, and batch_summary.csv lists the
+match and difference counts per pair.
+
+Sidecar runs leave <manual file>.match_state.json next to the Manual file; when the pair is
+validated again, only rows changed since then are re-matched and re-written (--full to redo all).
 """
 
-import openpyxl
-from openpyxl.styles import PatternFill
-from openpyxl.utils import get_column_letter
-import re
-
-# File paths
-ODOO_FILE = 'resources/Detailed Stock Report.xlsx'
-MANUAL_FILE = 'resources/Monthly Stock report Aug-25.xlsx'
-
-# Color for highlighting matches
-RED_FILL = PatternFill(start_color='FFFF0000', end_color='FFFF0000', fill_type='solid')
-
-def is_data_row_odoo(row_vals):
-    """Check if a row is a data row in Odoo file (has numeric SL No)"""
-    if not row_vals or len(row_vals) == 0:
-        return False
-    sl_val = str(row_vals[0]).strip() if row_vals[0] else ''
-    return bool(re.match(r'^\d+$', sl_val))
-
-def is_data_row_manual(row_vals):
-    """Check if a row is a data row in Manual file (has numeric SL # and actual data)"""
-    if not row_vals or len(row_vals) < 4:
-        return False
-    sl_val = str(row_vals[0]).strip() if row_vals[0] else ''
-    # Check if SL # is numeric
-    if not re.match(r'^\d+$', sl_val):
-        return False
-    # Check if there's actual data (Product Code or Items Name should not be empty)
-    product_code = str(row_vals[1]).strip() if len(row_vals) > 1 and row_vals[1] else ''
-    items_name = str(row_vals[3]).strip() if len(row_vals) > 3 and row_vals[3] else ''
-    return bool(product_code or items_name)
-
-def normalize_text(text):
-    """Normalize text for comparison (strip whitespace, handle None)"""
-    if text is None:
-        return ''
-    return str(text).strip()
-
-def read_odoo_data():
-    """Read all data rows from Odoo file"""
-    wb = openpyxl.load_workbook(ODOO_FILE)
-    ws = wb.active
-    
-    data_rows = []
-    
-    # Find all header rows (page breaks) - check for "SL\nNo" in first column
-    header_rows = [5]
-    for i in range(6, ws.max_row + 1):
-        first_cell = str(ws.cell(i, 1).value or '').strip()
-        if first_cell == 'SL\nNo' or first_cell == 'SL No':
-            header_rows.append(i)
-    
-    # Read data from each page
-    for page_idx in range(len(header_rows)):
-        header_start = header_rows[page_idx]
-        header_next = header_rows[page_idx + 1] if page_idx + 1 < len(header_rows) else ws.max_row + 1
-        
-        for row_num in range(header_start + 1, header_next):
-            # Read row values
-            row_vals = [cell.value for cell in ws[row_num]]
-            
-            if is_data_row_odoo(row_vals):
-                # Extract Product Code (Col 2) and Product Name (Col 3)
-                product_code = normalize_text(row_vals[1] if len(row_vals) > 1 else '')
-                product_name = normalize_text(row_vals[2] if len(row_vals) > 2 else '')
-                
-                if product_code or product_name:  # Only add if has data
-                    data_rows.append({
-                        'row_num': row_num,
-                        'product_code': product_code,
-                        'product_name': product_name
-                    })
-    
-    wb.close()
-    return data_rows
-
-def read_manual_rm_data():
-    """Read all data rows from Manual RM sheet"""
-    wb = openpyxl.load_workbook(MANUAL_FILE)
-    ws = wb['RM']
-    
-    data_rows = []
-    
-    # Read data rows (starting from row 6)
-    for row_num in range(6, ws.max_row + 1):
-        # Read columns A through N (14 columns)
-        row_vals = [ws.cell(row_num, col).value for col in range(1, 15)]
-        
-        if is_data_row_manual(row_vals):
-            # Extract Product Code (Col 2) and Items Name (Col 4)
-            product_code = normalize_text(row_vals[1] if len(row_vals) > 1 else '')
-            items_name = normalize_text(row_vals[3] if len(row_vals) > 3 else '')
-            
-            if product_code or items_name:  # Only add if has data
-                data_rows.append({
-                    'row_num': row_num,
-                    'product_code': product_code,
-                    'items_name': items_name
-                })
-    
-    wb.close()
-    return data_rows
-
-def find_matches(odoo_data, manual_data):
-    """Find matching rows based on Product Code and Name"""
-    matches = []
-    match_id_counter = 1
-    
-    for odoo_row in odoo_data:
-        for manual_row in manual_data:
-            # Match on Product Code AND (Product Name = Items Name)
-            if (odoo_row['product_code'] and manual_row['product_code'] and 
-                odoo_row['product_code'] == manual_row['product_code'] and
-                odoo_row['product_name'] and manual_row['items_name'] and
-                odoo_row['product_name'] == manual_row['items_name']):
-                
-                match_id = f'M{str(match_id_counter).zfill(4)}'
-                matches.append({
-                    'match_id': match_id,
-                    'odoo_row_num': odoo_row['row_num'],
-                    'manual_row_num': manual_row['row_num'],
-                    'product_code': odoo_row['product_code'],
-                    'name': odoo_row['product_name']
-                })
-                match_id_counter += 1
-                break  # Found match, move to next odoo row
-    
-    return matches
-
-def process_files():
-    """Main function to process files"""
-    print("Reading Odoo file...")
-    odoo_data = read_odoo_data()
-    print(f"Found {len(odoo_data)} data rows in Odoo file")
-    
-    print("Reading Manual RM sheet...")
-    manual_data = read_manual_rm_data()
-    print(f"Found {len(manual_data)} data rows in Manual RM sheet")
-    
-    print("Finding matches...")
-    matches = find_matches(odoo_data, manual_data)
-    print(f"Found {len(matches)} matches")
-    
-    if not matches:
-        print("No matches found. Exiting.")
-        return
-    
-    # Load files for modification
-    print("Loading files for modification...")
-    odoo_wb = openpyxl.load_workbook(ODOO_FILE)
-    odoo_ws = odoo_wb.active
-    
-    manual_wb = openpyxl.load_workbook(MANUAL_FILE)
-    manual_ws = manual_wb['RM']
-    
-    # Insert new first column in Odoo file
-    print("Inserting match ID column in Odoo file...")
-    odoo_ws.insert_cols(1)
-    odoo_ws.cell(5, 1).value = 'Match ID'  # Header row
-    
-    # Insert new first column in Manual file
-    print("Inserting match ID column in Manual file...")
-    manual_ws.insert_cols(1)
-    manual_ws.cell(5, 1).value = 'Match ID'  # Header row
-    
-    # Apply match IDs and highlight rows
-    print("Applying match IDs and highlighting rows...")
-    for match in matches:
-        # Odoo file
-        odoo_row = match['odoo_row_num']
-        odoo_ws.cell(odoo_row, 1).value = match['match_id']
-        # Highlight entire row (adjust column range as needed)
-        for col in range(1, odoo_ws.max_column + 1):
-            odoo_ws.cell(odoo_row, col).fill = RED_FILL
-        
-        # Manual file
-        manual_row = match['manual_row_num']
-        manual_ws.cell(manual_row, 1).value = match['match_id']
-        # Highlight entire row (Match ID column + original columns A through N = columns 1-15)
-        for col in range(1, 16):  # Columns 1-15 (Match ID + original A-N)
-            manual_ws.cell(manual_row, col).fill = RED_FILL
-    
-    # Save files
-    print("Saving Odoo file...")
-    odoo_wb.save(ODOO_FILE)
-    
-    print("Saving Manual file...")
-    manual_wb.save(MANUAL_FILE)
-    
-    print(f"\nCompleted! Found {len(matches)} matches.")
-    print("Files have been updated with match IDs and highlighted rows.")
-    print("\nMatch Summary:")
-    for match in matches[:10]:  # Show first 10 matches
-        print(f"  {match['match_id']}: Product Code='{match['product_code']}', Name='{match['name'][:50]}...'")
-    if len(matches) > 10:
-        print(f"  ... and {len(matches) - 10} more matches")
+import argparse
+import multiprocessing
+import os
+import sys
 
-if __name__ == '__main__':
-    process_files()
+from stock_report_engine import (StockReportEngine, ValidationCancelled, copy_to_folder,
+                                 find_file_pairs, read_pair_manifest)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Match an Odoo stock report against the Manual stock report")
+    parser.add_argument('--odoo', help="Odoo Detailed Stock Report (.xlsx)")
+    parser.add_argument('--manual', help="Manual Monthly Stock report (.xlsx)")
+    parser.add_argument('--batch', metavar='DIR_OR_CSV',
+                        help="Validate many pairs: a folder of exports or a CSV manifest (needs --out)")
+    parser.add_argument('--mode', choices=['simple', 'strict'], default='simple',
+                        help="simple: Product Code OR Product Name, strict: all fields must match (default: simple)")
+    parser.add_argument('--out', metavar='DIR',
+                        help="Write annotated copies of both files and the report into DIR "
+                             "(default: update the files in place, report next to the Manual file)")
+    parser.add_argument('--output-mode', choices=['insert', 'sidecar'], default='insert',
+                        help="insert: Match ID as a new first column, sidecar: after the last used column (default: insert)")
+    parser.add_argument('--parallel', action='store_true', help="Read the sheets in parallel processes")
+    parser.add_argument('--workers', type=int, help="Batch mode: number of pairs validated at once (default: one per CPU)")
+    parser.add_argument('--no-cache', action='store_true', help="Don't reuse parsed rows of unchanged files")
+    parser.add_argument('--full', action='store_true',
+                        help="Match all rows again, ignoring the match state left by an earlier sidecar run")
+    parser.add_argument('--profile', action='store_true',
+                        help="Collect per-stage wall/CPU time, row/cell counters and peak memory "
+                             "into validation_metrics.json next to the report")
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help="Also record tracemalloc peaks per stage (implies --profile; much slower "
+                             "and needs several times the usual memory)")
+    parser.add_argument('--cprofile', action='store_true',
+                        help="Also dump a cProfile of the run to validation_profile.prof next to the report")
+    args = parser.parse_args(argv)
+    if args.batch:
+        if args.odoo or args.manual:
+            parser.error("--batch can't be combined with --odoo/--manual")
+        if args.profile or args.tracemalloc or args.cprofile:
+            parser.error("--profile/--tracemalloc/--cprofile work on a single pair (--odoo/--manual)")
+        if not args.out:
+            parser.error("--batch needs --out")
+    elif not (args.odoo and args.manual):
+        parser.error("--odoo and --manual are required (or use --batch)")
+    return args
+
+
+def run_batch(args):
+    """Validate every pair of a folder or manifest, return the exit status"""
+    try:
+        if os.path.isdir(args.batch):
+            pairs, unpaired = find_file_pairs(args.batch, exclude_dir=args.out)
+            for path in unpaired:
+                print(f"WARNING: No matching file to pair with: {path}", file=sys.stderr)
+        else:
+            pairs = read_pair_manifest(args.batch)
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 1
+    if not pairs:
+        print(f"ERROR: No Odoo/Manual file pairs found in {args.batch}", file=sys.stderr)
+        return 1
 
+    engine = StockReportEngine()
+    summary_path, summary_rows = engine.run_batch(pairs, args.out, matching_mode=args.mode,
+                                                  output_mode=args.output_mode, use_cache=not args.no_cache,
+                                                  max_workers=args.workers)
+    failed = [row['pair'] for row in summary_rows if row['status'] == 'error']
+    if failed:
+        print(f"\n{len(failed)} of {len(pairs)} pairs failed (see {summary_path})", file=sys.stderr)
+        return 1
+    return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.batch:
+        return run_batch(args)
+    for path in (args.odoo, args.manual):
+        if not os.path.isfile(path):
+            print(f"ERROR: File not found: {path}", file=sys.stderr)
+            return 1
+
+    odoo_file, manual_file, report_dir = args.odoo, args.manual, None
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+        odoo_file = copy_to_folder(args.odoo, args.out)
+        manual_file = copy_to_folder(args.manual, args.out)
+        report_dir = args.out
+
+    engine = StockReportEngine()
+    try:
+        result = engine.run_validation(odoo_file, manual_file, matching_mode=args.mode,
+                                       output_mode=args.output_mode, parallel=args.parallel,
+                                       use_cache=not args.no_cache, report_dir=report_dir,
+                                       metrics=args.profile, trace_memory=args.tracemalloc,
+                                       cprofile=args.cprofile, incremental=not args.full)
+    except ValidationCancelled:
+        print("\nValidation cancelled.", file=sys.stderr)
+        return 1
+    except Exception as e:
+        print(f"\nERROR: Error during validation: {e}", file=sys.stderr)
+        return 1
+    finally:
+        engine.log_stage_timings()
+
+    if result['report_path']:
+        print(f"\nAnalysis report: {result['report_path']}")
+    return 0
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
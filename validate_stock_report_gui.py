@@ -4,28 +4,43 @@ Simple GUI for uploading and validating stock reports
 """
 
 import tkinter as tk
-from tkinter import filedialog, messagebox, scrolledtext
+from tkinter import filedialog, messagebox, scrolledtext, ttk
 import threading
-import openpyxl
-from openpyxl.styles import PatternFill, Font, Alignment, Border, GradientFill
-from copy import copy
-import re
+import queue
+import multiprocessing
 import os
+import time
 
-# Color for highlighting matches - light yellow
-HIGHLIGHT_FILL = PatternFill(start_color='FFFFFF99', end_color='FFFFFF99', fill_type='solid')
+from stock_report_engine import (StockReportEngine, SessionRowStore, ValidationCancelled, file_signature,
+                                 ANALYSIS_STAGES, APPLY_STAGES)
 
-class StockReportValidator:
-    def __init__(self, root):
+class StockReportValidator(StockReportEngine):
+    def __init__(self, root=None):
+        """Create the validator window, or a headless validator (no UI) when root is None"""
+        super().__init__()
         self.root = root
+        self.session_rows = SessionRowStore()  # Rows of the selected files, kept until a file changes
+        self.analysis = None  # run_analysis result waiting for Apply to files (None if there is none)
+        self.running = False
+        
+        if root is None:
+            return
+        
         self.root.title("Stock Report Validator")
-        self.root.geometry("700x600")
+        self.root.geometry("700x830")
         
-        self.odoo_file_path = None
-        self.manual_file_path = None
         self.matching_mode = tk.StringVar(value="simple")  # Default to simple matching
+        self.parallel_reading = tk.BooleanVar(value=False)
+        self.use_cache = tk.BooleanVar(value=True)
+        self.output_mode = tk.StringVar(value="insert")
+        self.collect_metrics = tk.BooleanVar(value=False)
+        self.deep_profile = tk.BooleanVar(value=False)
+        
+        # Log lines and UI callbacks from the worker thread, drained by the Tk main loop
+        self.ui_queue = queue.Queue()
         
         self.setup_ui()
+        self.pump_ui_queue()
     
     def setup_ui(self):
         # Title
@@ -71,18 +86,63 @@ class StockReportValidator:
         
         tk.Radiobutton(mode_options_frame, text="Simple: Product Code OR Product Name", 
                       variable=self.matching_mode, value="simple",
+                      command=self.matching_mode_changed,
                       font=("Arial", 9)).pack(anchor=tk.W, padx=20)
         tk.Radiobutton(mode_options_frame, text="Strict: All fields must match (Code, Name, Unit, Quantities, Values)", 
                       variable=self.matching_mode, value="strict",
+                      command=self.matching_mode_changed,
                       font=("Arial", 9)).pack(anchor=tk.W, padx=20)
         
-        # Validate button
-        self.validate_btn = tk.Button(self.root, text="Validate and Match", 
+        tk.Label(mode_frame, text="Output Mode:", font=("Arial", 10, "bold")).pack(anchor=tk.W, pady=(5, 0))
+        output_options_frame = tk.Frame(mode_frame)
+        output_options_frame.pack(fill=tk.X, pady=5)
+        tk.Radiobutton(output_options_frame, text="Insert Match ID as first column (shifts sheet layout)",
+                      variable=self.output_mode, value="insert",
+                      font=("Arial", 9)).pack(anchor=tk.W, padx=20)
+        tk.Radiobutton(output_options_frame, text="Append Match ID column after last used column (keeps layout)",
+                      variable=self.output_mode, value="sidecar",
+                      font=("Arial", 9)).pack(anchor=tk.W, padx=20)
+        
+        tk.Checkbutton(mode_frame, text="Read sheets in parallel (one process per sheet)",
+                      variable=self.parallel_reading,
+                      font=("Arial", 9)).pack(anchor=tk.W, pady=(5, 0))
+        tk.Checkbutton(mode_frame, text="Reuse parsed data when files are unchanged (cache)",
+                      variable=self.use_cache,
+                      font=("Arial", 9)).pack(anchor=tk.W)
+        tk.Checkbutton(mode_frame, text="Collect performance metrics (per-stage timers, memory, row counts)",
+                      variable=self.collect_metrics,
+                      font=("Arial", 9)).pack(anchor=tk.W)
+        tk.Checkbutton(mode_frame, text="Deep profiling: tracemalloc + cProfile (much slower, needs lots of memory)",
+                      variable=self.deep_profile,
+                      font=("Arial", 9)).pack(anchor=tk.W)
+        
+        # Validate, Apply and Cancel buttons
+        button_frame = tk.Frame(self.root)
+        button_frame.pack(pady=(20, 10))
+        self.validate_btn = tk.Button(button_frame, text="Validate and Match", 
                                      command=self.start_validation,
                                      font=("Arial", 12, "bold"),
                                      bg="#4CAF50", fg="white",
                                      state=tk.DISABLED)
-        self.validate_btn.pack(pady=20)
+        self.validate_btn.pack(side=tk.LEFT, padx=5)
+        self.apply_btn = tk.Button(button_frame, text="Apply to files",
+                                   command=self.start_apply,
+                                   font=("Arial", 12),
+                                   state=tk.DISABLED)
+        self.apply_btn.pack(side=tk.LEFT, padx=5)
+        self.cancel_btn = tk.Button(button_frame, text="Cancel",
+                                    command=self.cancel_validation,
+                                    font=("Arial", 12),
+                                    state=tk.DISABLED)
+        self.cancel_btn.pack(side=tk.LEFT, padx=5)
+        
+        # Progress bar with the current stage
+        progress_frame = tk.Frame(self.root)
+        progress_frame.pack(padx=20, fill=tk.X)
+        self.progress_bar = ttk.Progressbar(progress_frame, mode="determinate", maximum=ANALYSIS_STAGES)
+        self.progress_bar.pack(fill=tk.X)
+        self.progress_label = tk.Label(progress_frame, text="", fg="gray", anchor=tk.W)
+        self.progress_label.pack(fill=tk.X)
         
         # Progress/Status area
         status_frame = tk.Frame(self.root)
@@ -101,9 +161,11 @@ class StockReportValidator:
         )
         if filename:
             self.odoo_file_path = filename
+            self.analysis = None
             self.odoo_label.config(text=os.path.basename(filename), fg="green")
             self.update_button_state()
             self.log_status(f"Selected Odoo file: {os.path.basename(filename)}")
+            self.start_preload('odoo', filename)
     
     def select_manual_file(self):
         filename = filedialog.askopenfilename(
@@ -112,1464 +174,267 @@ class StockReportValidator:
         )
         if filename:
             self.manual_file_path = filename
+            self.analysis = None
             self.manual_label.config(text=os.path.basename(filename), fg="green")
             self.update_button_state()
             self.log_status(f"Selected Manual file: {os.path.basename(filename)}")
+            self.start_preload('manual', filename)
+    
+    def start_preload(self, kind, file_path):
+        """Start reading a just selected file in the background, so Validate usually finds it ready"""
+        label = 'Odoo' if kind == 'odoo' else 'Manual'
+        try:
+            future, log_lines = self.preload_file(kind, file_path, use_cache=self.use_cache.get())
+        except OSError as e:
+            self.log_status(f"Could not open the {label} file: {e}")
+            return
+        if future is None:
+            return  # Already read (or being read)
+        self.log_status(f"Reading the {label} file in the background...")
+        start = time.perf_counter()
+        future.add_done_callback(lambda future: self.preload_finished(future, label, start, log_lines))
+    
+    def preload_finished(self, future, label, start, log_lines):
+        """Log the outcome of a background read and the lines it logged (called on the reading thread)"""
+        error = future.exception()
+        if isinstance(error, ValidationCancelled):
+            return  # Another file was selected meanwhile
+        for line in log_lines:
+            self.log_status(line)  # Warnings of the read (skipped sheets, cache problems, ...)
+        if error is not None:
+            self.log_status(f"Background read of the {label} file failed: {error}")
+            return
+        rows = future.result()
+        row_count = len(rows) if isinstance(rows, list) else sum(len(sheet) for sheet in rows.values())
+        self.log_status(f"{label} file ready ({row_count} rows, read in {time.perf_counter() - start:.1f}s)")
     
     def update_button_state(self):
-        if self.odoo_file_path and self.manual_file_path:
+        if self.odoo_file_path and self.manual_file_path and not self.running:
             self.validate_btn.config(state=tk.NORMAL)
         else:
             self.validate_btn.config(state=tk.DISABLED)
+        if self.analysis and (self.analysis['total_matches'] or self.analysis['has_match_ids']) and not self.running:
+            self.apply_btn.config(state=tk.NORMAL)
+        else:
+            self.apply_btn.config(state=tk.DISABLED)
     
     def log_status(self, message):
-        self.status_text.insert(tk.END, message + "\n")
-        self.status_text.see(tk.END)
-        self.root.update()
+        """Log a status line (safe to call from any thread - the UI picks it up on its next pump)"""
+        if self.root is None:
+            super().log_status(message)
+            return
+        self.ui_queue.put(message)
     
-    def start_validation(self):
-        """Start validation in a separate thread to keep UI responsive"""
-        self.validate_btn.config(state=tk.DISABLED)
-        self.status_text.delete(1.0, tk.END)
-        
-        thread = threading.Thread(target=self.validate_files)
-        thread.daemon = True
-        thread.start()
+    def run_on_ui(self, callback, *args):
+        """Run callback(*args) on the Tk main thread, after the log lines queued before it"""
+        if self.root is None:
+            callback(*args)
+            return
+        self.ui_queue.put((callback, args))
     
-    def validate_files(self):
-        """Main validation logic"""
+    def pump_ui_queue(self, max_items=2000, interval_ms=50):
+        """Drain queued log lines (one text insert per batch) and UI callbacks, then reschedule"""
+        lines = []
         try:
-            self.log_status("=" * 60)
-            self.log_status("Starting validation...")
-            self.log_status("=" * 60)
-            
-            # Read files
-            self.log_status("\nReading Odoo file...")
-            odoo_data = self.read_odoo_data(self.odoo_file_path)
-            self.log_status(f"Found {len(odoo_data)} data rows in Odoo file")
-            
-            self.log_status("\nReading Manual RM sheet...")
-            manual_rm_data = self.read_manual_rm_data(self.manual_file_path)
-            self.log_status(f"Found {len(manual_rm_data)} data rows in Manual RM sheet")
-            
-            self.log_status("\nReading Manual Consumable sheet...")
-            manual_consumable_data = self.read_manual_consumable_data(self.manual_file_path)
-            self.log_status(f"Found {len(manual_consumable_data)} data rows in Manual Consumable sheet")
-            
-            self.log_status("\nReading Manual Spare parts sheet...")
-            manual_spare_parts_data = self.read_manual_spare_parts_data(self.manual_file_path)
-            self.log_status(f"Found {len(manual_spare_parts_data)} data rows in Manual Spare parts sheet")
-            
-            self.log_status("\nReading Manual Re-usable sheet...")
-            manual_reusable_data = self.read_manual_reusable_data(self.manual_file_path)
-            self.log_status(f"Found {len(manual_reusable_data)} data rows in Manual Re-usable sheet")
-            
-            # Show all normalized units
-            self.log_status("\nCollecting unique units...")
-            all_manual_data = manual_rm_data + manual_consumable_data + manual_spare_parts_data + manual_reusable_data
-            self.show_normalized_units(odoo_data, all_manual_data)
-            
-            # Determine matching mode
-            matching_mode = self.matching_mode.get()
-            if matching_mode == "simple":
-                # Simple matching: Product Code OR Product Name
-                self.log_status("\nUsing SIMPLE matching mode: Product Code OR Product Name")
-                self.log_status("Finding matches for RM sheet...")
-                rm_matches = self.find_matches_simple(odoo_data, manual_rm_data, prefix='RM')
-                self.log_status(f"Found {len(rm_matches)} RM matches")
-                
-                self.log_status("Finding matches for Consumable sheet...")
-                consumable_matches = self.find_matches_simple(odoo_data, manual_consumable_data, prefix='CON')
-                self.log_status(f"Found {len(consumable_matches)} Consumable matches")
-                
-                self.log_status("Finding matches for Spare parts sheet...")
-                spare_parts_matches = self.find_matches_simple(odoo_data, manual_spare_parts_data, prefix='SP')
-                self.log_status(f"Found {len(spare_parts_matches)} Spare parts matches")
-                
-                self.log_status("Finding matches for Re-usable sheet...")
-                reusable_matches = self.find_matches_simple(odoo_data, manual_reusable_data, prefix='RE')
-                self.log_status(f"Found {len(reusable_matches)} Re-usable matches")
-            else:
-                # Strict matching: All fields must match
-                self.log_status("\nUsing STRICT matching mode: All fields must match")
-                self.log_status("Finding matches for RM sheet...")
-                rm_matches = self.find_matches(odoo_data, manual_rm_data, prefix='RM')
-                self.log_status(f"Found {len(rm_matches)} RM matches")
-                
-                self.log_status("Finding matches for Consumable sheet...")
-                consumable_matches = self.find_matches(odoo_data, manual_consumable_data, prefix='CON')
-                self.log_status(f"Found {len(consumable_matches)} Consumable matches")
-                
-                self.log_status("Finding matches for Spare parts sheet...")
-                spare_parts_matches = self.find_matches(odoo_data, manual_spare_parts_data, prefix='SP')
-                self.log_status(f"Found {len(spare_parts_matches)} Spare parts matches")
-                
-                self.log_status("Finding matches for Re-usable sheet...")
-                reusable_matches = self.find_matches(odoo_data, manual_reusable_data, prefix='RE')
-                self.log_status(f"Found {len(reusable_matches)} Re-usable matches")
-            
-            total_matches = len(rm_matches) + len(consumable_matches) + len(spare_parts_matches) + len(reusable_matches)
-            if total_matches == 0:
-                self.log_status("\nNo matches found!")
-                messagebox.showinfo("No Matches", "No matching records found between the two files.")
-                self.validate_btn.config(state=tk.NORMAL)
-                return
-            
-            # Process files
-            self.log_status("\nProcessing files...")
-            self.process_files(self.odoo_file_path, self.manual_file_path, rm_matches, consumable_matches, spare_parts_matches, reusable_matches)
-            
-            # Generate analysis report in the same folder as loaded files
-            self.log_status("\nGenerating analysis report...")
-            import os
-            report_dir = os.path.dirname(self.manual_file_path) or os.path.dirname(self.odoo_file_path) or '.'
-            all_matches = rm_matches + consumable_matches + spare_parts_matches + reusable_matches
-            all_manual_data = manual_rm_data + manual_consumable_data + manual_spare_parts_data + manual_reusable_data
-            matching_mode = self.matching_mode.get()
-            self.generate_analysis_report(odoo_data, all_manual_data, all_matches, rm_matches, consumable_matches, spare_parts_matches, reusable_matches, report_dir, matching_mode)
-            
-            self.log_status("\n" + "=" * 60)
-            self.log_status("VALIDATION COMPLETED SUCCESSFULLY!")
-            self.log_status("=" * 60)
-            self.log_status(f"\nTotal matches found: {total_matches}")
-            self.log_status(f"  - RM matches: {len(rm_matches)}")
-            self.log_status(f"  - Consumable matches: {len(consumable_matches)}")
-            self.log_status(f"  - Spare parts matches: {len(spare_parts_matches)}")
-            self.log_status(f"  - Re-usable matches: {len(reusable_matches)}")
-            self.log_status("\nMatch Summary (first 10):")
-            for match in all_matches[:10]:
-                name_preview = match['name'][:40] + "..." if len(match['name']) > 40 else match['name']
-                self.log_status(f"  {match['match_id']}: Code='{match['product_code']}', Name='{name_preview}'")
-            if total_matches > 10:
-                self.log_status(f"  ... and {total_matches - 10} more matches")
-            
-            messagebox.showinfo("Success", 
-                              f"Validation completed!\n\nFound {total_matches} matches:\n"
-                              f"- RM: {len(rm_matches)} matches\n"
-                              f"- Consumable: {len(consumable_matches)} matches\n"
-                              f"- Spare parts: {len(spare_parts_matches)} matches\n"
-                              f"- Re-usable: {len(reusable_matches)} matches\n\n"
-                              "Both files have been updated with:\n"
-                              "- Match IDs in the first column\n"
-                              "- Highlighted matching rows in light yellow\n\n"
-                              "Analysis report saved in the same folder as loaded files.")
-            
-        except Exception as e:
-            error_msg = f"Error during validation: {str(e)}"
-            self.log_status(f"\nERROR: {error_msg}")
-            messagebox.showerror("Error", error_msg)
-        finally:
-            self.validate_btn.config(state=tk.NORMAL)
-    
-    def is_data_row_odoo(self, row_vals):
-        """Check if a row is a data row in Odoo file"""
-        if not row_vals or len(row_vals) == 0:
-            return False
-        sl_val = str(row_vals[0]).strip() if row_vals[0] else ''
-        return bool(re.match(r'^\d+$', sl_val))
-    
-    def is_data_row_manual(self, row_vals):
-        """Check if a row is a data row in Manual file"""
-        if not row_vals or len(row_vals) < 4:
-            return False
-        sl_val = str(row_vals[0]).strip() if row_vals[0] else ''
-        if not re.match(r'^\d+$', sl_val):
-            return False
-        product_code = str(row_vals[1]).strip() if len(row_vals) > 1 and row_vals[1] else ''
-        items_name = str(row_vals[3]).strip() if len(row_vals) > 3 and row_vals[3] else ''
-        return bool(product_code or items_name)
+            for _ in range(max_items):
+                item = self.ui_queue.get_nowait()
+                if isinstance(item, str):
+                    lines.append(item)
+                    continue
+                # Keep ordering: show pending lines before running the callback (e.g. a messagebox)
+                self.flush_status_lines(lines)
+                lines = []
+                callback, args = item
+                callback(*args)
+        except queue.Empty:
+            pass
+        self.flush_status_lines(lines)
+        self.root.after(interval_ms, self.pump_ui_queue)
     
-    def normalize_text(self, text):
-        """Normalize text for comparison"""
-        if text is None:
-            return ''
-        return str(text).strip()
+    def flush_status_lines(self, lines):
+        if lines:
+            self.status_text.insert(tk.END, "\n".join(lines) + "\n")
+            self.status_text.see(tk.END)
     
-    def normalize_product_code(self, text):
-        """Normalize product code - remove all spaces and make case-insensitive for comparison"""
-        if text is None:
-            return ''
-        # Remove all spaces (leading, trailing, and internal) and convert to uppercase
-        return str(text).replace(' ', '').upper()
+    def start_validation(self, announce=True):
+        """Start the analysis (read, match, report) in a separate thread to keep UI responsive
+        Files are only modified by Apply to files. announce=False skips the No Matches box
+        (used when re-matching after a mode change)."""
+        self.start_run_ui(ANALYSIS_STAGES)
+        self.analysis = None
+        
+        # Tk variables are only read here on the UI thread; the worker gets plain values
+        options = dict(matching_mode=self.matching_mode.get(), parallel=self.parallel_reading.get(),
+                       use_cache=self.use_cache.get(), **self.measure_options())
+        thread = threading.Thread(target=self.validate_files,
+                                  args=(self.odoo_file_path, self.manual_file_path, options, announce))
+        thread.daemon = True
+        thread.start()
     
-    def normalize_unit(self, text):
-        """Normalize unit - case-insensitive comparison with unit aliases"""
-        if text is None:
-            return ''
-        
-        # Normalize to uppercase and strip whitespace
-        unit = str(text).strip().upper()
-        
-        # Map "PCS", "Pieces", and "Piece" variations to "PCS"
-        if unit in ('PCS', 'PIECES', 'PIECE'):
-            return 'PCS'
-        
-        # Map "Foot(ft)" and "Feet" variations to "FEET"
-        # Handle "FOOT(FT)", "FOOT (FT)", "FEET", etc.
-        if unit in ('FOOT(FT)', 'FOOT (FT)', 'FOOT', 'FEET'):
-            return 'FEET'
-        
-        # Map "Liter(s)" and "Liter" variations to "LITER"
-        # Handle "LITER(S)", "LITER (S)", "LITER", "LITERS", etc.
-        if unit in ('LITER(S)', 'LITER (S)', 'LITER', 'LITERS', 'LITRE(S)', 'LITRE (S)', 'LITRE', 'LITRES'):
-            return 'LITER'
-        
-        # Map "gal(s)" and "Gallon" variations to "GALLON"
-        # Handle "GAL(S)", "GAL (S)", "GAL", "GALLON", "GALLONS", etc.
-        if unit in ('GAL(S)', 'GAL (S)', 'GAL', 'GALLON', 'GALLONS'):
-            return 'GALLON'
-        
-        # Map "Square Foot" and "SFT" variations to "SFT"
-        # Handle "SQUARE FOOT", "SQUARE FEET", "SFT", "SQ FT", "SQFT", etc.
-        if unit in ('SQUARE FOOT', 'SQUARE FEET', 'SQUARE FOOT(FT)', 'SQUARE FOOT (FT)', 'SFT', 'SQ FT', 'SQFT', 'SQ.FT', 'SQ. FT'):
-            return 'SFT'
-        
-        # Map "lbs" and "Pound" variations to "POUND"
-        # Handle "LBS", "LB", "POUND", "POUNDS", etc.
-        if unit in ('LBS', 'LB', 'LBS.', 'LB.', 'POUND', 'POUNDS'):
-            return 'POUND'
-        
-        # Map "Meter" variations to "METER"
-        # Handle "METER", "METERS", "METRE", "METRES", "MTRS", "MTR", "MITER", etc.
-        if unit in ('METER', 'METERS', 'METRE', 'METRES', 'MTRS', 'MTR', 'MTR.', 'MITER'):
-            return 'METER'
-        
-        # Map "Ream" and "Rim" variations to "REAM"
-        # Handle "REAM", "REAMS", "RIM", "RIMS", etc.
-        if unit in ('REAM', 'REAMS', 'RIM', 'RIMS'):
-            return 'REAM'
+    def start_apply(self):
+        """Write the Match IDs of the current analysis into both files (separate thread)"""
+        analysis = self.analysis
+        try:
+            unchanged = analysis['file_signatures'] == (file_signature(analysis['odoo_file']),
+                                                        file_signature(analysis['manual_file']))
+        except OSError:
+            unchanged = False
+        if not unchanged:
+            # Row numbers of the analysis may no longer fit the files
+            self.analysis = None
+            self.update_button_state()
+            messagebox.showwarning("Files Changed", "The files changed since they were validated.\n\n"
+                                   "Press Validate and Match again before applying.")
+            return
         
-        return unit
+        self.start_run_ui(APPLY_STAGES)
+        thread = threading.Thread(target=self.apply_files,
+                                  args=(analysis, self.output_mode.get(), self.measure_options()))
+        thread.daemon = True
+        thread.start()
     
-    def show_normalized_units(self, odoo_data, manual_data):
-        """Collect and display all unique units with their normalized forms"""
-        units_map = {}  # normalized_unit -> set of original units
-        
-        # Collect units from Odoo data
-        for row in odoo_data:
-            original_unit = str(row.get('unit', '') or '').strip()
-            if original_unit:
-                
-                normalized = self.normalize_unit(original_unit)
-                if normalized not in units_map:
-                    units_map[normalized] = set()
-                units_map[normalized].add(original_unit)
-        
-        # Collect units from Manual data
-        for row in manual_data:
-            original_unit = str(row.get('unit', '') or '').strip()
-            if original_unit:
-                normalized = self.normalize_unit(original_unit)
-                if normalized not in units_map:
-                    units_map[normalized] = set()
-                units_map[normalized].add(original_unit)
-        
-        # Display results
-        if units_map:
-            self.log_status(f"\nFound {len(units_map)} unique normalized units:")
-            self.log_status("-" * 60)
-            # Sort by normalized unit for consistent display
-            for normalized_unit in sorted(units_map.keys()):
-                original_units = sorted(units_map[normalized_unit])
-                if len(original_units) == 1 and original_units[0].upper() == normalized_unit:
-                    # No transformation needed
-                    self.log_status(f"  '{normalized_unit}'")
-                else:
-                    # Show mapping
-                    originals_str = "', '".join(original_units)
-                    self.log_status(f"  '{normalized_unit}' ← ['{originals_str}']")
-            self.log_status("-" * 60)
-        else:
-            self.log_status("No units found in data.")
+    def measure_options(self):
+        """metrics, trace_memory and cprofile arguments of a run, from the checkboxes (UI thread)"""
+        return {'metrics': self.collect_metrics.get(), 'trace_memory': self.deep_profile.get(),
+                'cprofile': self.deep_profile.get()}
     
-    def read_odoo_data(self, file_path):
-        """Read all data rows from Odoo file
-        Structure:
-        - Row 1: Date range in A1
-        - Row 2: Header row (SL No, Product Code, Product Name, etc.)
-        - Row 3+: Continuous data rows (no metadata, no repeated headers)
-        """
-        wb = openpyxl.load_workbook(file_path)
-        ws = wb.active
-        
-        data_rows = []
-        
-        # Header row is always row 2 for Detailed Stock Report
-        header_row = 2
-        
-        # Check if Match ID column exists (in case file was already processed)
-        has_match_id = str(ws.cell(header_row, 1).value or '').strip() == 'Match ID'
-        
-        # Adjust column indices if Match ID column exists
-        if has_match_id:
-            sl_col = 2
-            code_col = 3
-            name_col = 4
-            unit_col = 6
-            opening_qty_col = 7
-            opening_value_col = 8
-            receive_qty_col = 9
-            receive_value_col = 10
-            issue_qty_col = 11
-            issue_value_col = 12
-            closing_qty_col = 13
-            closing_value_col = 14
-        else:
-            sl_col = 1
-            code_col = 2
-            name_col = 3
-            unit_col = 5
-            opening_qty_col = 6
-            opening_value_col = 7
-            receive_qty_col = 8
-            receive_value_col = 9
-            issue_qty_col = 10
-            issue_value_col = 11
-            closing_qty_col = 12
-            closing_value_col = 13
-        
-        # Read all data rows from after header to end of file
-        for row_num in range(header_row + 1, ws.max_row + 1):
-            sl_val = ws.cell(row_num, sl_col).value
-            # Check if it's a data row (has numeric SL)
-            if sl_val is None:
-                continue
-            sl_str = str(sl_val).strip()
-            if not (sl_str.isdigit() or (isinstance(sl_val, (int, float)))):
-                continue
-            
-            # Read values using correct column indices
-            product_code = self.normalize_text(ws.cell(row_num, code_col).value)
-            product_name = self.normalize_text(ws.cell(row_num, name_col).value)
-            unit = self.normalize_text(ws.cell(row_num, unit_col).value)
-            opening_qty = ws.cell(row_num, opening_qty_col).value
-            opening_value = ws.cell(row_num, opening_value_col).value
-            receive_qty = ws.cell(row_num, receive_qty_col).value
-            receive_value = ws.cell(row_num, receive_value_col).value
-            issue_qty = ws.cell(row_num, issue_qty_col).value
-            issue_value = ws.cell(row_num, issue_value_col).value
-            closing_qty = ws.cell(row_num, closing_qty_col).value
-            closing_value = ws.cell(row_num, closing_value_col).value
-            
-            if product_code or product_name:
-                data_rows.append({
-                    'row_num': row_num,
-                    'product_code': product_code,
-                    'product_name': product_name,
-                    'unit': unit,
-                    'opening_qty': opening_qty,
-                    'opening_value': opening_value,
-                    'receive_qty': receive_qty,
-                    'receive_value': receive_value,
-                    'issue_qty': issue_qty,
-                    'issue_value': issue_value,
-                    'closing_qty': closing_qty,
-                    'closing_value': closing_value
-                })
-        
-        wb.close()
-        return data_rows
+    def start_run_ui(self, stages):
+        """Reset the progress display and lock the buttons for a run of the given number of stages"""
+        self.running = True
+        self.update_button_state()
+        self.cancel_btn.config(state=tk.NORMAL)
+        self.status_text.delete(1.0, tk.END)
+        self.progress_bar.config(value=0, maximum=stages)
+        self.progress_label.config(text="")
+        self.cancel_event.clear()
+        self.stage_timings = []
     
-    def read_manual_rm_data(self, file_path):
-        """Read all data rows from Manual RM sheet
-        Uses data_only=True to get calculated values from formulas for comparison"""
-        # Check if file has Match ID column (already processed)
-        wb_check = openpyxl.load_workbook(file_path, data_only=True)
-        ws_check = wb_check['RM']
-        has_match_id = str(ws_check.cell(5, 1).value or '').strip() == 'Match ID'
-        wb_check.close()
-        
-        # Load with data_only=True to get calculated values (not formulas)
-        wb = openpyxl.load_workbook(file_path, data_only=True)
-        ws = wb['RM']
-        
-        data_rows = []
-        
-        # Adjust column indices if Match ID column exists
-        if has_match_id:
-            sl_col = 2
-            code_col = 3
-            name_col = 5
-            unit_col = 6
-            opening_qty_col = 7
-            opening_value_col = 8
-            receive_qty_col = 9
-            receive_value_col = 10
-            issue_qty_col = 11
-            issue_value_col = 12
-            closing_qty_col = 13
-            closing_value_col = 14
-        else:
-            sl_col = 1
-            code_col = 2
-            name_col = 4
-            unit_col = 5
-            opening_qty_col = 6
-            opening_value_col = 7
-            receive_qty_col = 8
-            receive_value_col = 9
-            issue_qty_col = 10
-            issue_value_col = 11
-            closing_qty_col = 12
-            closing_value_col = 13
-        
-        for row_num in range(6, ws.max_row + 1):
-            sl_val = ws.cell(row_num, sl_col).value
-            # Check if it's a data row (has numeric SL)
-            if sl_val is None:
-                continue
-            sl_str = str(sl_val).strip()
-            if not (sl_str.isdigit() or (isinstance(sl_val, (int, float)))):
-                continue
-            
-            # Read values using correct column indices
-            product_code = self.normalize_text(ws.cell(row_num, code_col).value)
-            items_name = self.normalize_text(ws.cell(row_num, name_col).value)
-            unit = self.normalize_text(ws.cell(row_num, unit_col).value)
-            opening_qty = ws.cell(row_num, opening_qty_col).value
-            opening_value = ws.cell(row_num, opening_value_col).value
-            receive_qty = ws.cell(row_num, receive_qty_col).value
-            receive_value = ws.cell(row_num, receive_value_col).value
-            issue_qty = ws.cell(row_num, issue_qty_col).value
-            issue_value = ws.cell(row_num, issue_value_col).value
-            closing_qty = ws.cell(row_num, closing_qty_col).value
-            closing_value = ws.cell(row_num, closing_value_col).value
-            
-            if product_code or items_name:
-                data_rows.append({
-                    'row_num': row_num,
-                    'product_code': product_code,
-                    'items_name': items_name,
-                    'unit': unit,
-                    'opening_qty': opening_qty,
-                    'opening_value': opening_value,
-                    'receive_qty': receive_qty,
-                    'receive_value': receive_value,
-                    'issue_qty': issue_qty,
-                    'issue_value': issue_value,
-                    'closing_qty': closing_qty,
-                    'closing_value': closing_value
-                })
-        
-        wb.close()
-        return data_rows
+    def matching_mode_changed(self):
+        """Re-match with the rows already read when the mode changes after a validation"""
+        if self.analysis is None or self.running:
+            return  # A running analysis re-matches when it finishes (see run_finished)
+        self.start_validation(announce=False)
     
-    def read_manual_consumable_data(self, file_path):
-        """Read all data rows from Manual Consumable sheet
-        Uses data_only=True to get calculated values from formulas for comparison"""
-        # Check if file has Match ID column (already processed)
-        wb_check = openpyxl.load_workbook(file_path, data_only=True)
-        if 'Consumable' not in wb_check.sheetnames:
-            wb_check.close()
-            return []  # Consumable sheet doesn't exist
-        ws_check = wb_check['Consumable']
-        has_match_id = str(ws_check.cell(5, 1).value or '').strip() == 'Match ID'
-        wb_check.close()
-        
-        # Load with data_only=True to get calculated values (not formulas)
-        wb = openpyxl.load_workbook(file_path, data_only=True)
-        ws = wb['Consumable']
-        
-        data_rows = []
-        
-        # Adjust column indices if Match ID column exists
-        if has_match_id:
-            sl_col = 2
-            code_col = 3
-            name_col = 5
-            unit_col = 6
-            opening_qty_col = 7
-            opening_value_col = 8
-            receive_qty_col = 9
-            receive_value_col = 10
-            issue_qty_col = 11
-            issue_value_col = 12
-            closing_qty_col = 13
-            closing_value_col = 14
-        else:
-            sl_col = 1
-            code_col = 2
-            name_col = 4
-            unit_col = 5
-            opening_qty_col = 6
-            opening_value_col = 7
-            receive_qty_col = 8
-            receive_value_col = 9
-            issue_qty_col = 10
-            issue_value_col = 11
-            closing_qty_col = 12
-            closing_value_col = 13
-        
-        for row_num in range(6, ws.max_row + 1):
-            sl_val = ws.cell(row_num, sl_col).value
-            # Check if it's a data row (has numeric SL)
-            if sl_val is None:
-                continue
-            sl_str = str(sl_val).strip()
-            if not (sl_str.isdigit() or (isinstance(sl_val, (int, float)))):
-                continue
-            
-            # Read values using correct column indices
-            product_code = self.normalize_text(ws.cell(row_num, code_col).value)
-            items_name = self.normalize_text(ws.cell(row_num, name_col).value)
-            unit = self.normalize_text(ws.cell(row_num, unit_col).value)
-            opening_qty = ws.cell(row_num, opening_qty_col).value
-            opening_value = ws.cell(row_num, opening_value_col).value
-            receive_qty = ws.cell(row_num, receive_qty_col).value
-            receive_value = ws.cell(row_num, receive_value_col).value
-            issue_qty = ws.cell(row_num, issue_qty_col).value
-            issue_value = ws.cell(row_num, issue_value_col).value
-            closing_qty = ws.cell(row_num, closing_qty_col).value
-            closing_value = ws.cell(row_num, closing_value_col).value
-            
-            if product_code or items_name:
-                data_rows.append({
-                    'row_num': row_num,
-                    'product_code': product_code,
-                    'items_name': items_name,
-                    'unit': unit,
-                    'opening_qty': opening_qty,
-                    'opening_value': opening_value,
-                    'receive_qty': receive_qty,
-                    'receive_value': receive_value,
-                    'issue_qty': issue_qty,
-                    'issue_value': issue_value,
-                    'closing_qty': closing_qty,
-                    'closing_value': closing_value
-                })
-        
-        wb.close()
-        return data_rows
+    def cancel_validation(self):
+        """Ask the running validation to stop at the next stage or row chunk"""
+        self.cancel_event.set()
+        self.cancel_btn.config(state=tk.DISABLED)
+        self.log_status("\nCancelling - stopping after the current step...")
     
-    def read_manual_spare_parts_data(self, file_path):
-        """Read all data rows from Manual Spare parts sheet
-        Uses data_only=True to get calculated values from formulas for comparison"""
-        # Check if file has Match ID column (already processed)
-        wb_check = openpyxl.load_workbook(file_path, data_only=True)
-        if 'Spare parts' not in wb_check.sheetnames:
-            wb_check.close()
-            return []  # Spare parts sheet doesn't exist
-        ws_check = wb_check['Spare parts']
-        has_match_id = str(ws_check.cell(5, 1).value or '').strip() == 'Match ID'
-        wb_check.close()
-        
-        # Load with data_only=True to get calculated values (not formulas)
-        wb = openpyxl.load_workbook(file_path, data_only=True)
-        ws = wb['Spare parts']
-        
-        data_rows = []
-        
-        # Adjust column indices if Match ID column exists
-        if has_match_id:
-            sl_col = 2
-            code_col = 3
-            name_col = 5
-            unit_col = 6
-            opening_qty_col = 7
-            opening_value_col = 8
-            receive_qty_col = 9
-            receive_value_col = 10
-            issue_qty_col = 11
-            issue_value_col = 12
-            closing_qty_col = 13
-            closing_value_col = 14
-        else:
-            sl_col = 1
-            code_col = 2
-            name_col = 4
-            unit_col = 5
-            opening_qty_col = 6
-            opening_value_col = 7
-            receive_qty_col = 8
-            receive_value_col = 9
-            issue_qty_col = 10
-            issue_value_col = 11
-            closing_qty_col = 12
-            closing_value_col = 13
-        
-        for row_num in range(6, ws.max_row + 1):
-            sl_val = ws.cell(row_num, sl_col).value
-            # Check if it's a data row (has numeric SL)
-            if sl_val is None:
-                continue
-            sl_str = str(sl_val).strip()
-            if not (sl_str.isdigit() or (isinstance(sl_val, (int, float)))):
-                continue
-            
-            # Read values using correct column indices
-            product_code = self.normalize_text(ws.cell(row_num, code_col).value)
-            items_name = self.normalize_text(ws.cell(row_num, name_col).value)
-            unit = self.normalize_text(ws.cell(row_num, unit_col).value)
-            opening_qty = ws.cell(row_num, opening_qty_col).value
-            opening_value = ws.cell(row_num, opening_value_col).value
-            receive_qty = ws.cell(row_num, receive_qty_col).value
-            receive_value = ws.cell(row_num, receive_value_col).value
-            issue_qty = ws.cell(row_num, issue_qty_col).value
-            issue_value = ws.cell(row_num, issue_value_col).value
-            closing_qty = ws.cell(row_num, closing_qty_col).value
-            closing_value = ws.cell(row_num, closing_value_col).value
-            
-            if product_code or items_name:
-                data_rows.append({
-                    'row_num': row_num,
-                    'product_code': product_code,
-                    'items_name': items_name,
-                    'unit': unit,
-                    'opening_qty': opening_qty,
-                    'opening_value': opening_value,
-                    'receive_qty': receive_qty,
-                    'receive_value': receive_value,
-                    'issue_qty': issue_qty,
-                    'issue_value': issue_value,
-                    'closing_qty': closing_qty,
-                    'closing_value': closing_value
-                })
-        
-        wb.close()
-        return data_rows
+    def stage_started(self, name):
+        self.run_on_ui(self.set_progress_label, f"{name}...")
     
-    def read_manual_reusable_data(self, file_path):
-        """Read all data rows from Manual Re-usable sheet
-        Uses data_only=True to get calculated values from formulas for comparison"""
-        # Check if file has Match ID column (already processed)
-        wb_check = openpyxl.load_workbook(file_path, data_only=True)
-        if 'Re-usable' not in wb_check.sheetnames:
-            wb_check.close()
-            return []  # Re-usable sheet doesn't exist
-        ws_check = wb_check['Re-usable']
-        has_match_id = str(ws_check.cell(5, 1).value or '').strip() == 'Match ID'
-        wb_check.close()
-        
-        # Load with data_only=True to get calculated values (not formulas)
-        wb = openpyxl.load_workbook(file_path, data_only=True)
-        ws = wb['Re-usable']
-        
-        data_rows = []
-        
-        # Adjust column indices if Match ID column exists
-        if has_match_id:
-            sl_col = 2
-            code_col = 3
-            name_col = 5
-            unit_col = 6
-            opening_qty_col = 7
-            opening_value_col = 8
-            receive_qty_col = 9
-            receive_value_col = 10
-            issue_qty_col = 11
-            issue_value_col = 12
-            closing_qty_col = 13
-            closing_value_col = 14
-        else:
-            sl_col = 1
-            code_col = 2
-            name_col = 4
-            unit_col = 5
-            opening_qty_col = 6
-            opening_value_col = 7
-            receive_qty_col = 8
-            receive_value_col = 9
-            issue_qty_col = 10
-            issue_value_col = 11
-            closing_qty_col = 12
-            closing_value_col = 13
-        
-        for row_num in range(6, ws.max_row + 1):
-            sl_val = ws.cell(row_num, sl_col).value
-            # Check if it's a data row (has numeric SL)
-            if sl_val is None:
-                continue
-            sl_str = str(sl_val).strip()
-            if not (sl_str.isdigit() or (isinstance(sl_val, (int, float)))):
-                continue
-            
-            # Read values using correct column indices
-            product_code = self.normalize_text(ws.cell(row_num, code_col).value)
-            items_name = self.normalize_text(ws.cell(row_num, name_col).value)
-            unit = self.normalize_text(ws.cell(row_num, unit_col).value)
-            opening_qty = ws.cell(row_num, opening_qty_col).value
-            opening_value = ws.cell(row_num, opening_value_col).value
-            receive_qty = ws.cell(row_num, receive_qty_col).value
-            receive_value = ws.cell(row_num, receive_value_col).value
-            issue_qty = ws.cell(row_num, issue_qty_col).value
-            issue_value = ws.cell(row_num, issue_value_col).value
-            closing_qty = ws.cell(row_num, closing_qty_col).value
-            closing_value = ws.cell(row_num, closing_value_col).value
-            
-            if product_code or items_name:
-                data_rows.append({
-                    'row_num': row_num,
-                    'product_code': product_code,
-                    'items_name': items_name,
-                    'unit': unit,
-                    'opening_qty': opening_qty,
-                    'opening_value': opening_value,
-                    'receive_qty': receive_qty,
-                    'receive_value': receive_value,
-                    'issue_qty': issue_qty,
-                    'issue_value': issue_value,
-                    'closing_qty': closing_qty,
-                    'closing_value': closing_value
-                })
-        
-        wb.close()
-        return data_rows
+    def stage_finished(self, name):
+        self.run_on_ui(self.step_progress)
     
-    def normalize_numeric(self, text):
-        """Normalize numeric values for exact comparison - handles Accounting format (commas, parentheses) and Number format"""
-        if text is None:
-            return 0.0
-        
-        # If it's already a number (int or float), convert directly
-        if isinstance(text, (int, float)):
-            return round(float(text), 2)
-        
-        # Convert to string and clean up
-        text_str = str(text).strip()
-        if text_str == '' or text_str.lower() == 'none':
-            return 0.0
-        
-        # Handle dash/hyphen as zero (common in Accounting format)
-        if text_str == '-' or text_str == '—' or text_str == '–':
-            return 0.0
-        
-        # Handle Accounting format: parentheses indicate negative numbers
-        is_negative = False
-        if text_str.startswith('(') and text_str.endswith(')'):
-            is_negative = True
-            text_str = text_str[1:-1].strip()  # Remove parentheses
-        
-        # Remove spaces, commas (thousands separators), currency symbols, and other formatting
-        text_str = text_str.replace(' ', '').replace(',', '').replace('$', '').replace('₹', '').replace('€', '').replace('£', '')
-        
-        if text_str == '' or text_str == '-':
-            return 0.0
-        
-        try:
-            # Convert to float
-            num_value = float(text_str)
-            # Apply negative sign if parentheses were present
-            if is_negative:
-                num_value = -num_value
-            # Round to 2 decimal places for exact comparison
-            return round(num_value, 2)
-        except (ValueError, TypeError):
-            # If conversion fails, return 0.0
-            return 0.0
+    def set_progress_label(self, text):
+        if self.root is not None:
+            self.progress_label.config(text=text)
     
-    def compare_numeric(self, val1, val2):
-        """Compare two numeric values exactly (no tolerance)"""
-        num1 = self.normalize_numeric(val1)
-        num2 = self.normalize_numeric(val2)
-        return num1 == num2
+    def step_progress(self):
+        if self.root is not None:
+            self.progress_bar.step(1)
     
-    def find_matches_simple(self, odoo_data, manual_data, prefix='RM'):
-        """Find matching rows with simple logic: match if Product Code OR Product Name matches
-        This is a simpler matching mode that only considers Product Code or Product Name.
-        Other fields (Unit, quantities, values) are NOT considered for matching.
+    def validate_files(self, odoo_file, manual_file, options, announce=True):
+        """Analyse the selected files (worker thread) and report the outcome
         
         Args:
-            odoo_data: List of Odoo data rows
-            manual_data: List of Manual data rows
-            prefix: Prefix for match IDs ('RM' or 'CON')
-        
-        Returns:
-            List of matched records with match_id, odoo_row_num, manual_row_num, product_code, name
-        """
-        matches = []
-        match_id_counter = 1
-        
-        for odoo_row in odoo_data:
-            for manual_row in manual_data:
-                # Check Product Code match
-                odoo_code_normalized = self.normalize_product_code(odoo_row['product_code'])
-                manual_code_normalized = self.normalize_product_code(manual_row['product_code'])
-                product_code_match = (odoo_code_normalized and manual_code_normalized and 
-                                     odoo_code_normalized == manual_code_normalized)
-                
-                # Check Product Name match
-                product_name_match = (odoo_row['product_name'] and manual_row['items_name'] and 
-                                     odoo_row['product_name'] == manual_row['items_name'])
-                
-                # Match if EITHER Product Code OR Product Name matches
-                if product_code_match or product_name_match:
-                    match_id = f'{prefix}{str(match_id_counter).zfill(4)}'
-                    matches.append({
-                        'match_id': match_id,
-                        'odoo_row_num': odoo_row['row_num'],
-                        'manual_row_num': manual_row['row_num'],
-                        'product_code': odoo_row['product_code'],
-                        'name': odoo_row['product_name']
-                    })
-                    match_id_counter += 1
-                    break  # Found match, move to next odoo row
-        
-        return matches
-    
-    def find_matches(self, odoo_data, manual_data, prefix='RM'):
-        """Find matching rows with specified prefix (RM or CON)
-        IMPORTANT: ALL criteria must match for a record to be considered a match:
-        - Product Code (case-insensitive, spaces ignored)
-        - Product Name (exact match)
-        - Unit (case-insensitive, with alias mappings)
-        - All quantity/value fields (Opening, Receive, Issue, Closing - Qty & Value)
-        
-        Records will NOT match if only Product Code and/or Item Name match.
-        All fields must match exactly (after normalization)."""
-        matches = []
-        match_id_counter = 1
-        
-        # Debug: Log first few rows from each file
-        if odoo_data:
-            self.log_status(f"\nSample Odoo row: Code='{odoo_data[0].get('product_code', '')}', Name='{odoo_data[0].get('product_name', '')[:30]}...', Unit='{odoo_data[0].get('unit', '')}', Opening Qty='{odoo_data[0].get('opening_qty', '')}'")
-        if manual_data:
-            self.log_status(f"Sample Manual row: Code='{manual_data[0].get('product_code', '')}', Name='{manual_data[0].get('items_name', '')[:30]}...', Unit='{manual_data[0].get('unit', '')}', Opening Qty='{manual_data[0].get('opening_qty', '')}'")
-        
-        for odoo_row in odoo_data:
-            for manual_row in manual_data:
-                # Check all matching criteria
-                # Normalize product codes (ignore spaces)
-                odoo_code_normalized = self.normalize_product_code(odoo_row['product_code'])
-                manual_code_normalized = self.normalize_product_code(manual_row['product_code'])
-                product_code_match = (odoo_code_normalized and manual_code_normalized and 
-                                     odoo_code_normalized == manual_code_normalized)
-                
-                if not product_code_match:
-                    continue  # Skip if product code doesn't match
-                
-                product_name_match = (odoo_row['product_name'] and manual_row['items_name'] and 
-                                     odoo_row['product_name'] == manual_row['items_name'])
-                
-                if not product_name_match:
-                    continue  # Skip if product name doesn't match
-                
-                # Normalize units (case-insensitive)
-                odoo_unit_normalized = self.normalize_unit(odoo_row['unit'])
-                manual_unit_normalized = self.normalize_unit(manual_row['unit'])
-                unit_match = (odoo_unit_normalized and manual_unit_normalized and 
-                             odoo_unit_normalized == manual_unit_normalized)
-                
-                if not unit_match:
-                    continue  # Skip if unit doesn't match
-                
-                # Compare numeric values with tolerance for floating point precision
-                opening_qty_match = self.compare_numeric(odoo_row['opening_qty'], manual_row['opening_qty'])
-                opening_value_match = self.compare_numeric(odoo_row['opening_value'], manual_row['opening_value'])
-                receive_qty_match = self.compare_numeric(odoo_row['receive_qty'], manual_row['receive_qty'])
-                receive_value_match = self.compare_numeric(odoo_row['receive_value'], manual_row['receive_value'])
-                issue_qty_match = self.compare_numeric(odoo_row['issue_qty'], manual_row['issue_qty'])
-                issue_value_match = self.compare_numeric(odoo_row['issue_value'], manual_row['issue_value'])
-                closing_qty_match = self.compare_numeric(odoo_row['closing_qty'], manual_row['closing_qty'])
-                closing_value_match = self.compare_numeric(odoo_row['closing_value'], manual_row['closing_value'])
-                
-                # Debug: Log why a potential match failed (only for first few attempts)
-                if product_code_match and product_name_match and match_id_counter <= 3:
-                    failed_fields = []
-                    if not unit_match:
-                        failed_fields.append(f"Unit (Odoo: '{odoo_row['unit']}' vs Manual: '{manual_row['unit']}')")
-                    if not opening_qty_match:
-                        failed_fields.append(f"Opening Qty (Odoo: '{odoo_row['opening_qty']}' vs Manual: '{manual_row['opening_qty']}')")
-                    if not opening_value_match:
-                        failed_fields.append(f"Opening Value (Odoo: '{odoo_row['opening_value']}' vs Manual: '{manual_row['opening_value']}')")
-                    if failed_fields:
-                        self.log_status(f"Potential match failed on: {', '.join(failed_fields[:3])}")
-                
-                # All criteria must match
-                if (product_code_match and product_name_match and unit_match and
-                    opening_qty_match and opening_value_match and
-                    receive_qty_match and receive_value_match and
-                    issue_qty_match and issue_value_match and
-                    closing_qty_match and closing_value_match):
-                    
-                    # Use specified prefix (RM or CON)
-                    match_id = f'{prefix}{str(match_id_counter).zfill(4)}'
-                    matches.append({
-                        'match_id': match_id,
-                        'odoo_row_num': odoo_row['row_num'],
-                        'manual_row_num': manual_row['row_num'],
-                        'product_code': odoo_row['product_code'],
-                        'name': odoo_row['product_name']
-                    })
-                    match_id_counter += 1
-                    break
-        
-        return matches
-    
-    def adjust_formulas_after_insert(self, ws, inserted_col=1):
-        """Adjust formulas after inserting a column - shift column references right by 1
-        Note: openpyxl's insert_cols() should automatically adjust formulas, but we do this
-        explicitly to ensure all formulas are correctly updated, especially in columns N and O+
+            options: Keyword arguments of run_analysis, read from the UI by start_validation
         """
-        self.log_status("Adjusting formulas...")
-        formula_count = 0
-        
-        # Pattern to match Excel column references (like FN6, $FN$6, FN$6, $FN6)
-        # Also handles sheet references like 'RM'!G6 or RM!G6
-        col_pattern = re.compile(r"(\$?)([A-Z]+)(\$?)(\d+)")
-        sheet_ref_pattern = re.compile(r"(['\w\s]+'?!)")
-        
-        def shift_column(match):
-            """Shift column reference by inserted_col positions"""
-            dollar_before = match.group(1)
-            col_letters = match.group(2)
-            dollar_after = match.group(3)
-            row_num = match.group(4)
-            
-            # Convert column letters to number (A=1, B=2, ..., Z=26, AA=27, etc.)
-            col_num = 0
-            for char in col_letters:
-                col_num = col_num * 26 + (ord(char) - ord('A') + 1)
-            
-            # When inserting at column 1, ALL columns shift right by 1
-            # So column A becomes B, B becomes C, etc.
-            # We need to shift ALL column references by 1
-            new_col_num = col_num + 1
-            
-            # Convert back to letters
-            new_col_letters = ''
-            temp = new_col_num
-            while temp > 0:
-                temp -= 1
-                new_col_letters = chr(ord('A') + (temp % 26)) + new_col_letters
-                temp //= 26
-            
-            return f"{dollar_before}{new_col_letters}{dollar_after}{row_num}"
-        
-        for row in ws.iter_rows():
-            for cell in row:
-                if cell.data_type == 'f' and cell.value:  # Formula cell
-                    try:
-                        formula = str(cell.value)
-                        # Adjust column references in formula
-                        # Note: openpyxl should have already done this, but we verify/adjust
-                        new_formula = col_pattern.sub(shift_column, formula)
-                        cell.value = new_formula
-                        formula_count += 1
-                    except Exception as e:
-                        # If adjustment fails, log warning but keep original
-                        self.log_status(f"Warning: Could not adjust formula in {cell.coordinate}: {str(e)}")
-        
-        self.log_status(f"Adjusted {formula_count} formulas")
-    
-    def clean_odoo_file(self, odoo_wb):
-        """Remove blank rows and images from Odoo workbook"""
-        odoo_ws = odoo_wb.active
-        
-        # Remove images from all sheets
-        total_images = 0
-        for sheet in odoo_wb.worksheets:
-            if hasattr(sheet, '_images'):
-                image_count = len(sheet._images)
-                sheet._images = []
-                total_images += image_count
-        if total_images > 0:
-            self.log_status(f"  Removed {total_images} image(s)")
-        
-        # Remove blank rows (rows with no data)
-        # Start from the bottom to avoid index shifting issues
-        rows_to_delete = []
-        max_row = odoo_ws.max_row
-        
-        # Find all header rows first (to preserve them)
-        header_rows = set()
-        for row_num in range(1, max_row + 1):
-            first_cell = str(odoo_ws.cell(row_num, 1).value or '').strip()
-            if first_cell == 'SL\nNo' or first_cell == 'SL No' or first_cell == 'Match ID':
-                header_rows.add(row_num)
-        
-        # Check each row (skip header rows and first 5 rows which might contain title/header info)
-        for row_num in range(max_row, 5, -1):
-            if row_num in header_rows:
-                continue  # Skip header rows
-            
-            # Check if row is empty (all cells are None or empty)
-            is_empty = True
-            for col in range(1, odoo_ws.max_column + 1):
-                cell_value = odoo_ws.cell(row_num, col).value
-                if cell_value is not None:
-                    # Check if it's not just whitespace
-                    if isinstance(cell_value, str) and cell_value.strip():
-                        is_empty = False
-                        break
-                    elif not isinstance(cell_value, str):
-                        is_empty = False
-                        break
+        try:
+            result = self.run_analysis(odoo_file, manual_file, **options)
+            result.update(odoo_file=odoo_file, manual_file=manual_file)
+            self.run_on_ui(self.analysis_ready, result, announce)
             
-            if is_empty:
-                rows_to_delete.append(row_num)
-        
-        # Delete blank rows
-        if rows_to_delete:
-            for row_num in rows_to_delete:
-                odoo_ws.delete_rows(row_num)
-            self.log_status(f"  Removed {len(rows_to_delete)} blank row(s)")
-    
-    def copy_cell_format(self, source_cell, target_cell):
-        """Copy cell formatting from source cell to target cell, including borders"""
-        if source_cell.font:
-            target_cell.font = Font(
-                name=source_cell.font.name,
-                size=source_cell.font.size,
-                bold=source_cell.font.bold,
-                italic=source_cell.font.italic,
-                underline=source_cell.font.underline,
-                strike=source_cell.font.strike,
-                color=source_cell.font.color
-            )
-        if source_cell.alignment:
-            target_cell.alignment = Alignment(
-                horizontal=source_cell.alignment.horizontal,
-                vertical=source_cell.alignment.vertical,
-                wrap_text=source_cell.alignment.wrap_text
-            )
-        # Preserve borders - create new Border object to avoid StyleProxy issues
-        if source_cell.border:
-            target_cell.border = Border(
-                left=copy(source_cell.border.left),
-                right=copy(source_cell.border.right),
-                top=copy(source_cell.border.top),
-                bottom=copy(source_cell.border.bottom),
-                diagonal=copy(source_cell.border.diagonal),
-                diagonal_direction=source_cell.border.diagonal_direction,
-                vertical=copy(source_cell.border.vertical),
-                horizontal=copy(source_cell.border.horizontal)
-            )
-        # Preserve fill - create new Fill object to avoid StyleProxy issues
-        if source_cell.fill:
-            try:
-                # Check fill type by accessing fill_type attribute
-                fill_type = getattr(source_cell.fill, 'fill_type', None)
-                if fill_type is not None:
-                    # PatternFill
-                    target_cell.fill = PatternFill(
-                        fill_type=source_cell.fill.fill_type,
-                        start_color=source_cell.fill.start_color,
-                        end_color=source_cell.fill.end_color,
-                        patternType=getattr(source_cell.fill, 'patternType', None)
-                    )
-                else:
-                    # GradientFill or other - check for type attribute
-                    grad_type = getattr(source_cell.fill, 'type', None)
-                    if grad_type is not None:
-                        target_cell.fill = GradientFill(
-                            type=source_cell.fill.type,
-                            degree=getattr(source_cell.fill, 'degree', None),
-                            left=getattr(source_cell.fill, 'left', None),
-                            right=getattr(source_cell.fill, 'right', None),
-                            top=getattr(source_cell.fill, 'top', None),
-                            bottom=getattr(source_cell.fill, 'bottom', None),
-                            stop=getattr(source_cell.fill, 'stop', None)
-                        )
-            except (AttributeError, TypeError):
-                # If we can't determine the fill type, skip it
-                # The cell will keep its default fill
-                pass
-        # Preserve number format
-        if source_cell.number_format:
-            target_cell.number_format = source_cell.number_format
+        except ValidationCancelled:
+            self.log_status("\nValidation cancelled - files were not modified.")
+            self.run_on_ui(self.set_progress_label, "Cancelled")
+        except Exception as e:
+            error_msg = f"Error during validation: {str(e)}"
+            self.log_status(f"\nERROR: {error_msg}")
+            self.run_on_ui(messagebox.showerror, "Error", error_msg)
+        finally:
+            self.log_stage_timings()
+            self.run_on_ui(self.run_finished)
     
-    def process_sheet(self, odoo_wb, manual_wb, sheet_name, matches, is_first_sheet=False):
-        """Process a single sheet (RM or Consumable)"""
-        odoo_ws = odoo_wb.active
-        
-        if sheet_name not in manual_wb.sheetnames:
-            return  # Sheet doesn't exist, skip
-        
-        manual_ws = manual_wb[sheet_name]
-        
-        # Insert Match ID column in Odoo file only for first sheet
-        if is_first_sheet:
-            self.log_status(f"Inserting Match ID column in Odoo file...")
-            
-            # Find header row dynamically
-            odoo_header_row = None
-            for row_num in range(1, min(10, odoo_ws.max_row + 1)):
-                first_cell = str(odoo_ws.cell(row_num, 1).value or '').strip()
-                if first_cell in ('Match ID', 'SL\nNo', 'SL No', 'SL'):
-                    odoo_header_row = row_num
-                    break
-            if odoo_header_row is None:
-                odoo_header_row = 1  # Default to row 1
-            
-            # Preserve column widths for Odoo file
-            odoo_col_widths = {}
-            default_width = odoo_ws.column_dimensions.group_width if hasattr(odoo_ws.column_dimensions, 'group_width') else None
-            default_width = default_width if default_width else 8.43  # Excel default column width
-            
-            for col_idx in range(1, odoo_ws.max_column + 1):
-                col_letter = openpyxl.utils.get_column_letter(col_idx)
-                if col_letter in odoo_ws.column_dimensions and odoo_ws.column_dimensions[col_letter].width:
-                    odoo_col_widths[col_idx] = odoo_ws.column_dimensions[col_letter].width
-                else:
-                    odoo_col_widths[col_idx] = default_width
-            
-            odoo_ws.insert_cols(1)
-            
-            # Restore ALL column widths (shifted by 1)
-            for col_idx, width in odoo_col_widths.items():
-                new_col_idx = col_idx + 1
-                new_col_letter = openpyxl.utils.get_column_letter(new_col_idx)
-                odoo_ws.column_dimensions[new_col_letter].width = width
-            
-            # Set width for new Match ID column
-            match_id_width = odoo_col_widths.get(1, 12.0)
-            odoo_ws.column_dimensions['A'].width = max(match_id_width, 12.0)
-            
-            # Copy font format from existing header cell to new Match ID header
-            if odoo_ws.cell(odoo_header_row, 2).value is not None:
-                self.copy_cell_format(odoo_ws.cell(odoo_header_row, 2), odoo_ws.cell(odoo_header_row, 1))
-            odoo_ws.cell(odoo_header_row, 1).value = 'Match ID'
-        
-        # Insert Match ID column in Manual sheet
-        self.log_status(f"Inserting Match ID column in {sheet_name} sheet...")
-        
-        # Preserve column widths for Manual file
-        # Read ALL column widths (including defaults for columns without explicit widths)
-        manual_col_widths = {}
-        default_width = manual_ws.column_dimensions.group_width if hasattr(manual_ws.column_dimensions, 'group_width') else None
-        default_width = default_width if default_width else 8.43  # Excel default column width
-        
-        for col_idx in range(1, manual_ws.max_column + 1):
-            col_letter = openpyxl.utils.get_column_letter(col_idx)
-            if col_letter in manual_ws.column_dimensions and manual_ws.column_dimensions[col_letter].width:
-                # Column has explicit width
-                manual_col_widths[col_idx] = manual_ws.column_dimensions[col_letter].width
+    def analysis_ready(self, result, announce):
+        """Keep a finished analysis for Apply to files and for re-matching (UI thread)"""
+        # Files picked while the analysis was running make it stale
+        if (result['odoo_file'], result['manual_file']) != (self.odoo_file_path, self.manual_file_path):
+            return
+        self.analysis = result
+        total_matches = result['total_matches']
+        if total_matches == 0:
+            if result['has_match_ids']:
+                self.set_progress_label("No matches - Apply to files (sidecar) removes the earlier Match IDs")
             else:
-                # Column uses default width
-                manual_col_widths[col_idx] = default_width
-        
-        # Preserve merged cells before insertion
-        merged_ranges_before = list(manual_ws.merged_cells.ranges)
-        
-        # Insert column - openpyxl will automatically shift all columns, merged cells, formulas, etc.
-        manual_ws.insert_cols(1)
-        
-        # Restore ALL column widths (shifted by 1)
-        for col_idx, width in manual_col_widths.items():
-            new_col_idx = col_idx + 1
-            new_col_letter = openpyxl.utils.get_column_letter(new_col_idx)
-            manual_ws.column_dimensions[new_col_letter].width = width
-        
-        # Set width for new Match ID column
-        match_id_width = manual_col_widths.get(1, 12.0)
-        manual_ws.column_dimensions['A'].width = max(match_id_width, 12.0)
-        
-        # Copy font format from existing header cell to new Match ID header
-        if manual_ws.cell(5, 2).value is not None:
-            self.copy_cell_format(manual_ws.cell(5, 2), manual_ws.cell(5, 1))
-        manual_ws.cell(5, 1).value = 'Match ID'
-        
-        # openpyxl's insert_cols(1) shifts formulas but doesn't always adjust column references correctly
-        # We need to manually adjust formulas to ensure column references are updated
-        self.adjust_formulas_after_insert(manual_ws, inserted_col=1)
-        
-        # IMPORTANT: openpyxl's insert_cols() shifts cells but doesn't correctly update merged cell ranges
-        # We need to fix all merged ranges by unmerging current ones and re-merging with correct shifted positions
-        # But first, we need to preserve the values from the top-left cell of each merged range
-        self.log_status("Fixing merged cell ranges...")
-        current_merged_ranges = list(manual_ws.merged_cells.ranges)
-        
-        # Preserve values and borders from merged ranges before unmerging
-        # IMPORTANT: openpyxl shifts CELL VALUES but merged range definitions may not be updated correctly
-        # Strategy: Match current merged ranges to original ranges, then read value from shifted position
-        merged_values = {}
-        merged_borders = {}  # Store border information for merged ranges
-        
-        for orig_r in merged_ranges_before:
-            # The value should be in the shifted position: original_col + 1
-            shifted_col = orig_r.min_col + 1
-            shifted_row = orig_r.min_row
-            cell = manual_ws.cell(shifted_row, shifted_col)
-            value = cell.value
-            if value is not None:
-                merged_values[(orig_r.min_col, orig_r.min_row)] = value
-            
-            # Preserve border from the top-left cell of the merged range
-            # Create a new Border object to avoid StyleProxy issues
-            if cell.border:
-                merged_borders[(orig_r.min_col, orig_r.min_row)] = Border(
-                    left=copy(cell.border.left),
-                    right=copy(cell.border.right),
-                    top=copy(cell.border.top),
-                    bottom=copy(cell.border.bottom),
-                    diagonal=copy(cell.border.diagonal),
-                    diagonal_direction=cell.border.diagonal_direction,
-                    vertical=copy(cell.border.vertical),
-                    horizontal=copy(cell.border.horizontal)
-                )
-        
-        # Unmerge all current ranges (they may be in wrong positions)
-        for r in current_merged_ranges:
-            manual_ws.unmerge_cells(str(r))
-        
-        # Re-merge using the ORIGINAL ranges (before insertion) shifted right by 1 column
-        # And restore the values and borders
-        for r in merged_ranges_before:
-            new_min_col = r.min_col + 1
-            new_max_col = r.max_col + 1
-            new_min_row = r.min_row
-            new_max_row = r.max_row
-            new_min_letter = openpyxl.utils.get_column_letter(new_min_col)
-            new_max_letter = openpyxl.utils.get_column_letter(new_max_col)
-            new_range = f"{new_min_letter}{new_min_row}:{new_max_letter}{new_max_row}"
-            
-            # Restore value and border
-            top_left_cell = manual_ws.cell(new_min_row, new_min_col)
-            if (r.min_col, r.min_row) in merged_values:
-                top_left_cell.value = merged_values[(r.min_col, r.min_row)]
-            if (r.min_col, r.min_row) in merged_borders:
-                top_left_cell.border = merged_borders[(r.min_col, r.min_row)]
-            
-            manual_ws.merge_cells(new_range)
-        
-        self.log_status(f"Fixed {len(merged_ranges_before)} merged cell ranges")
-        
-        # IMPORTANT: Ensure column N (now column O, row 4) remains unmerged
-        # In input file, column N row 4 has "Rate(Tk)" and is NOT merged
-        # After insertion, it becomes column O row 4, and must remain unmerged
-        for r in list(manual_ws.merged_cells.ranges):
-            if r.min_col <= 15 <= r.max_col and r.min_row <= 4 <= r.max_row:
-                # Column O row 4 is part of a merged range - this is wrong!
-                # Unmerge it to preserve the original structure
-                self.log_status(f"Unmerging column O row 4 (original column N) from range {r}")
-                manual_ws.unmerge_cells(str(r))
-        
-        # Apply match IDs and highlight
-        self.log_status(f"Applying match IDs and highlighting rows for {sheet_name} sheet...")
-        for match in matches:
-            # Odoo file
-            odoo_row = match['odoo_row_num']
-            odoo_ws.cell(odoo_row, 1).value = match['match_id']
-            for col in range(1, odoo_ws.max_column + 1):
-                odoo_ws.cell(odoo_row, col).fill = HIGHLIGHT_FILL
-            
-            # Manual file
-            manual_row = match['manual_row_num']
-            manual_ws.cell(manual_row, 1).value = match['match_id']
-            # Highlight columns 1-14 (Match ID + original columns A-M, excluding N)
-            for col in range(1, 15):
-                manual_ws.cell(manual_row, col).fill = HIGHLIGHT_FILL
+                self.set_progress_label("No matches - nothing to apply")
+            if announce:
+                messagebox.showinfo("No Matches", "No matching records found between the two files.")
+            return
+        mode_name = "Simple" if result['matching_mode'] == 'simple' else "Strict"
+        self.set_progress_label(f"{mode_name} mode: {total_matches} matches - review the report, "
+                                "then Apply to files")
     
-    def process_files(self, odoo_file, manual_file, rm_matches, consumable_matches, spare_parts_matches, reusable_matches):
-        """Process and update files for RM, Consumable, Spare parts, and Re-usable sheets"""
-        # Load files with all features preserved (formulas, formatting, merged cells, etc.)
-        self.log_status("Loading files (preserving all features: formulas, formatting, merged cells)...")
-        odoo_wb = openpyxl.load_workbook(odoo_file, data_only=False, keep_links=False)
-        manual_wb = openpyxl.load_workbook(manual_file, data_only=False, keep_links=False)
-        
-        # Process RM sheet (first sheet - inserts Odoo Match ID column)
-        if rm_matches:
-            self.process_sheet(odoo_wb, manual_wb, 'RM', rm_matches, is_first_sheet=True)
-        
-        # Process Consumable sheet (second sheet - Odoo Match ID already exists)
-        if consumable_matches:
-            self.process_sheet(odoo_wb, manual_wb, 'Consumable', consumable_matches, is_first_sheet=False)
-        
-        # Process Spare parts sheet (third sheet - Odoo Match ID already exists)
-        if spare_parts_matches:
-            self.process_sheet(odoo_wb, manual_wb, 'Spare parts', spare_parts_matches, is_first_sheet=False)
-        
-        # Process Re-usable sheet (fourth sheet - Odoo Match ID already exists)
-        if reusable_matches:
-            self.process_sheet(odoo_wb, manual_wb, 'Re-usable', reusable_matches, is_first_sheet=False)
+    def apply_files(self, analysis, output_mode, measure_options):
+        """Write the analysis's Match IDs into both files (worker thread) and report the outcome
         
-        # Clean Odoo file (remove blank rows and images)
-        self.log_status("Cleaning Odoo file (removing blank rows and images)...")
-        self.clean_odoo_file(odoo_wb)
-        
-        # Save files
-        self.log_status("Saving files...")
-        odoo_wb.save(odoo_file)
-        manual_wb.save(manual_file)
-        
-        odoo_wb.close()
-        manual_wb.close()
-    
-    def generate_analysis_report(self, odoo_data, manual_data, matches, rm_matches, consumable_matches, spare_parts_matches, reusable_matches, output_dir='.', matching_mode='simple'):
-        """Generate analysis report of unmatched records
         Args:
-            odoo_data: List of Odoo data rows
-            manual_data: List of Manual data rows
-            matches: List of all matched records (RM + Consumable + Spare parts + Re-usable)
-            rm_matches: List of RM matched records
-            consumable_matches: List of Consumable matched records
-            spare_parts_matches: List of Spare parts matched records
-            reusable_matches: List of Re-usable matched records
-            output_dir: Directory where to save the report (default: current directory)
-            matching_mode: Matching mode used ('simple' or 'strict')
+            measure_options: See measure_options (read by start_apply)
         """
-        import os
-        from datetime import datetime
-        
-        # Use different filename based on matching mode
-        if matching_mode == 'simple':
-            report_filename = 'match_analysis_report_simple_match.txt'
-        else:
-            report_filename = 'match_analysis_report.txt'
-        
-        # Use the provided output directory (same folder as loaded files)
-        report_path = os.path.join(output_dir, report_filename)
-        
-        # Get matched row numbers for quick lookup
-        matched_odoo_row_nums = {m['odoo_row_num'] for m in matches}
-        matched_manual_row_nums = {m['manual_row_num'] for m in matches}
-        
-        # Find unmatched records
-        unmatched_odoo = []
-        unmatched_manual = []
-        name_matches_but_different = []
-        
-        for odoo_row in odoo_data:
-            odoo_code_norm = self.normalize_product_code(odoo_row['product_code'])
-            odoo_name = odoo_row['product_name']
-            
-            # Check if this record was matched (by checking if row number is in matches)
-            is_matched = odoo_row['row_num'] in matched_odoo_row_nums
-            
-            if not is_matched:
-                # Check if there's a name match in manual data (for reporting differences)
-                name_match_found = False
-                code_match_found = False
-                for manual_row in manual_data:
-                    manual_code_norm = self.normalize_product_code(manual_row['product_code'])
-                    manual_name = manual_row['items_name']
-                    
-                    # Check if code matches
-                    if odoo_code_norm == manual_code_norm:
-                        code_match_found = True
-                    
-                    # Check if name matches
-                    if odoo_name == manual_name:
-                        name_match_found = True
-                        # Check differences
-                        differences = []
-                        if odoo_code_norm != manual_code_norm:
-                            differences.append(f"Product Code: '{odoo_row['product_code']}' vs '{manual_row['product_code']}'")
-                        if self.normalize_unit(odoo_row['unit']) != self.normalize_unit(manual_row['unit']):
-                            differences.append(f"Unit: '{odoo_row['unit']}' vs '{manual_row['unit']}'")
-                        if self.compare_numeric(odoo_row['opening_qty'], manual_row['opening_qty']) == False:
-                            differences.append(f"Opening Qty: {odoo_row['opening_qty']} vs {manual_row['opening_qty']}")
-                        if self.compare_numeric(odoo_row['opening_value'], manual_row['opening_value']) == False:
-                            differences.append(f"Opening Value: {odoo_row['opening_value']} vs {manual_row['opening_value']}")
-                        if self.compare_numeric(odoo_row['receive_qty'], manual_row['receive_qty']) == False:
-                            differences.append(f"Receive Qty: {odoo_row['receive_qty']} vs {manual_row['receive_qty']}")
-                        if self.compare_numeric(odoo_row['receive_value'], manual_row['receive_value']) == False:
-                            differences.append(f"Receive Value: {odoo_row['receive_value']} vs {manual_row['receive_value']}")
-                        if self.compare_numeric(odoo_row['issue_qty'], manual_row['issue_qty']) == False:
-                            differences.append(f"Issue Qty: {odoo_row['issue_qty']} vs {manual_row['issue_qty']}")
-                        if self.compare_numeric(odoo_row['issue_value'], manual_row['issue_value']) == False:
-                            differences.append(f"Issue Value: {odoo_row['issue_value']} vs {manual_row['issue_value']}")
-                        if self.compare_numeric(odoo_row['closing_qty'], manual_row['closing_qty']) == False:
-                            differences.append(f"Closing Qty: {odoo_row['closing_qty']} vs {manual_row['closing_qty']}")
-                        if self.compare_numeric(odoo_row['closing_value'], manual_row['closing_value']) == False:
-                            differences.append(f"Closing Value: {odoo_row['closing_value']} vs {manual_row['closing_value']}")
-                        
-                        if differences:
-                            name_matches_but_different.append({
-                                'odoo': odoo_row,
-                                'manual': manual_row,
-                                'differences': differences
-                            })
-                        break
-                
-                # In simple mode: unmatched if neither code nor name matches any manual record
-                # In strict mode: unmatched if name doesn't match (code match alone doesn't count)
-                if matching_mode == 'simple':
-                    if not code_match_found and not name_match_found:
-                        unmatched_odoo.append(odoo_row)
-                else:
-                    if not name_match_found:
-                        unmatched_odoo.append(odoo_row)
-        
-        # Find unmatched manual records
-        for manual_row in manual_data:
-            manual_code_norm = self.normalize_product_code(manual_row['product_code'])
-            manual_name = manual_row['items_name']
-            
-            # Check if this record was matched (by checking if row number is in matches)
-            is_matched = manual_row['row_num'] in matched_manual_row_nums
-            
-            if not is_matched:
-                # Check if code or name exists in Odoo
-                if matching_mode == 'simple':
-                    code_exists = any(self.normalize_product_code(odoo_row['product_code']) == manual_code_norm 
-                                     for odoo_row in odoo_data)
-                    name_exists = any(odoo_row['product_name'] == manual_name for odoo_row in odoo_data)
-                    if not code_exists and not name_exists:
-                        unmatched_manual.append(manual_row)
-                else:
-                    name_exists = any(odoo_row['product_name'] == manual_name for odoo_row in odoo_data)
-                    if not name_exists:
-                        unmatched_manual.append(manual_row)
-        
-        # Write report
-        with open(report_path, 'w', encoding='utf-8') as f:
-            f.write("MATCH ANALYSIS REPORT\n")
-            f.write("=" * 80 + "\n")
-            f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-            
-            f.write(f"SUMMARY\n")
-            f.write("-" * 80 + "\n")
-            f.write(f"Total Odoo records: {len(odoo_data)}\n")
-            f.write(f"Total Manual records: {len(manual_data)}\n")
-            f.write(f"Full matches (all criteria): {len(matches)}\n")
-            f.write(f"  - RM matches: {len(rm_matches)}\n")
-            f.write(f"  - Consumable matches: {len(consumable_matches)}\n")
-            f.write(f"  - Spare parts matches: {len(spare_parts_matches)}\n")
-            f.write(f"  - Re-usable matches: {len(reusable_matches)}\n")
-            f.write(f"Name matches but other differences: {len(name_matches_but_different)}\n")
-            f.write(f"Unmatched Odoo records (no name match): {len(unmatched_odoo)}\n")
-            f.write(f"Unmatched Manual records (no name match): {len(unmatched_manual)}\n\n")
-            
-            f.write("=" * 80 + "\n")
-            f.write("RECORDS WITH MATCHING NAMES BUT DIFFERENT VALUES\n")
-            f.write("=" * 80 + "\n\n")
-            
-            # Group by difference type
-            code_diff = [x for x in name_matches_but_different if any('Product Code' in d for d in x['differences'])]
-            unit_diff = [x for x in name_matches_but_different if any('Unit' in d for d in x['differences'])]
-            qty_value_diff = [x for x in name_matches_but_different if any(('Qty' in d or 'Value' in d) for d in x['differences'])]
-            
-            f.write(f"Product Code differences: {len(code_diff)}\n")
-            f.write(f"Unit differences: {len(unit_diff)}\n")
-            f.write(f"Quantity/Value differences: {len(qty_value_diff)}\n\n")
-            
-            # Detailed list
-            for i, item in enumerate(name_matches_but_different, 1):
-                odoo = item['odoo']
-                manual = item['manual']
-                f.write(f"{i}. Item Name: '{odoo['product_name']}'\n")
-                f.write(f"   Odoo (Row {odoo['row_num']}): Code='{odoo['product_code']}', Unit='{odoo['unit']}', ")
-                f.write(f"Opening={odoo['opening_qty']}/{odoo['opening_value']}, Closing={odoo['closing_qty']}/{odoo['closing_value']}\n")
-                f.write(f"   Manual (Row {manual['row_num']}): Code='{manual['product_code']}', Unit='{manual['unit']}', ")
-                f.write(f"Opening={manual['opening_qty']}/{manual['opening_value']}, Closing={manual['closing_qty']}/{manual['closing_value']}\n")
-                f.write(f"   Differences: {', '.join(item['differences'])}\n\n")
-            
-            f.write("\n" + "=" * 80 + "\n")
-            f.write("UNMATCHED ODOO RECORDS (No matching name in Manual)\n")
-            f.write("=" * 80 + "\n\n")
-            for i, row in enumerate(unmatched_odoo[:100], 1):  # Limit to first 100
-                f.write(f"{i}. Row {row['row_num']}: Code='{row['product_code']}', Name='{row['product_name'][:60]}...', ")
-                f.write(f"Unit='{row['unit']}', Opening={row['opening_qty']}/{row['opening_value']}\n")
-            if len(unmatched_odoo) > 100:
-                f.write(f"\n... and {len(unmatched_odoo) - 100} more unmatched Odoo records\n")
-            
-            f.write("\n" + "=" * 80 + "\n")
-            f.write("UNMATCHED MANUAL RECORDS (No matching name in Odoo)\n")
-            f.write("=" * 80 + "\n\n")
-            for i, row in enumerate(unmatched_manual[:100], 1):  # Limit to first 100
-                f.write(f"{i}. Row {row['row_num']}: Code='{row['product_code']}', Name='{row['items_name'][:60]}...', ")
-                f.write(f"Unit='{row['unit']}', Opening={row['opening_qty']}/{row['opening_value']}\n")
-            if len(unmatched_manual) > 100:
-                f.write(f"\n... and {len(unmatched_manual) - 100} more unmatched Manual records\n")
-        
-        self.log_status(f"Analysis report saved to: {report_path}")
+        try:
+            self.apply_matches(analysis['odoo_file'], analysis['manual_file'], analysis,
+                               output_mode=output_mode, **measure_options)
+            self.run_on_ui(self.set_progress_label, "Done")
+            if analysis['total_matches'] == 0:
+                return  # Only Match IDs of an earlier run were removed (sidecar)
+            
+            sheet_matches = analysis['sheet_matches']
+            match_id_location = "the first column" if output_mode == 'insert' else "a column after the last used column"
+            self.run_on_ui(messagebox.showinfo, "Success",
+                           f"Validation completed!\n\nFound {analysis['total_matches']} matches:\n"
+                           f"- RM: {len(sheet_matches['RM'])} matches\n"
+                           f"- Consumable: {len(sheet_matches['Consumable'])} matches\n"
+                           f"- Spare parts: {len(sheet_matches['Spare parts'])} matches\n"
+                           f"- Re-usable: {len(sheet_matches['Re-usable'])} matches\n\n"
+                           "Both files have been updated with:\n"
+                           f"- Match IDs in {match_id_location}\n"
+                           "- Highlighted matching rows in light yellow\n\n"
+                           "Analysis report saved in the same folder as loaded files.")
+            
+        except ValidationCancelled:
+            self.log_status("\nApply cancelled - files were not modified.")
+            self.run_on_ui(self.set_progress_label, "Cancelled")
+        except Exception as e:
+            error_msg = f"Error while updating the files: {str(e)}"
+            self.log_status(f"\nERROR: {error_msg}")
+            self.run_on_ui(messagebox.showerror, "Error", error_msg)
+        finally:
+            self.log_stage_timings()
+            self.run_on_ui(self.apply_finished, analysis)
+    
+    def apply_finished(self, analysis):
+        # Written files have new row numbers and Match IDs, so the analysis can't be applied again
+        if self.files_written and self.analysis is analysis:
+            self.analysis = None
+        self.run_finished()
+    
+    def run_finished(self):
+        """Unlock the buttons after a run (UI thread)"""
+        self.running = False
+        if self.root is None:
+            return
+        self.cancel_btn.config(state=tk.DISABLED)
+        self.update_button_state()
+        # The mode was switched while the analysis was running
+        if self.analysis is not None and self.analysis['matching_mode'] != self.matching_mode.get():
+            self.matching_mode_changed()
 
 def main():
+    multiprocessing.freeze_support()  # Needed for the reader process pool in frozen Windows builds
     root = tk.Tk()
     app = StockReportValidator(root)
     root.mainloop()
 
 if __name__ == '__main__':
     main()
-